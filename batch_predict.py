@@ -0,0 +1,230 @@
+import os
+import csv
+import json
+import time
+import argparse
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from phase6_predictor import load_model_and_vectorizer, model_version
+from record_store import iter_parquet_records, iter_records
+import metrics
+
+# Stream a large input file through the model chunk by chunk
+
+CHUNK_SIZE = 5000
+
+# Model loaded once per worker process by the pool initializer
+_model = None
+_vectorizer = None
+
+
+def init_worker():
+    global _model, _vectorizer
+    _model, _vectorizer = load_model_and_vectorizer()
+
+
+# Input readers -------------------------------------------------------------
+
+def iter_csv_texts(path, text_column, id_column, chunk_size):
+    offset = 0
+    for frame in pd.read_csv(path, chunksize=chunk_size):
+        texts = frame[text_column].fillna('').astype(str).tolist()
+        ids = frame[id_column].tolist() if id_column else list(range(offset, offset + len(frame)))
+        offset += len(frame)
+        yield ids, texts
+
+
+def iter_record_texts(path, text_column, id_column, chunk_size):
+    if path.endswith('.parquet'):
+        # Only the text (and id) column is decoded, one row group at a time
+        records = iter_parquet_records(path, columns=[text_column] + ([id_column] if id_column else []))
+    else:
+        records = iter_records(path)
+    ids, texts = [], []
+    for position, record in enumerate(records):
+        ids.append(record.get(id_column) if id_column else position)
+        texts.append(record.get(text_column) or '')
+        if len(texts) == chunk_size:
+            yield ids, texts
+            ids, texts = [], []
+    if texts:
+        yield ids, texts
+
+
+def iter_plain_texts(path, chunk_size):
+    ids, texts = [], []
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for position, line in enumerate(f):
+            ids.append(position)
+            texts.append(line.rstrip('\n'))
+            if len(texts) == chunk_size:
+                yield ids, texts
+                ids, texts = [], []
+    if texts:
+        yield ids, texts
+
+
+# Pick a reader by file extension; yields (ids, texts) chunks
+def iter_input_chunks(path, text_column='text', id_column=None, chunk_size=CHUNK_SIZE):
+    if path.endswith('.csv'):
+        return iter_csv_texts(path, text_column, id_column, chunk_size)
+    if path.endswith(('.json', '.jsonl', '.jsonl.gz', '.parquet')):
+        return iter_record_texts(path, text_column, id_column, chunk_size)
+    return iter_plain_texts(path, chunk_size)
+
+
+# Prediction ----------------------------------------------------------------
+
+# Vectorize and predict one chunk; labels come from the same probabilities
+def predict_chunk(ids, texts, model=None, vectorizer=None):
+    model = model if model is not None else _model
+    vectorizer = vectorizer if vectorizer is not None else _vectorizer
+    with metrics.span("predict_seconds"):
+        probabilities = model.predict_proba(vectorizer.transform(texts))
+    metrics.inc("predictions_total", len(texts))
+    if model is _model:
+        # Pool workers exit without running exit handlers
+        metrics.flush()
+    classes = [str(label) for label in model.classes_]
+    rows = []
+    for text_id, row in zip(ids, probabilities.tolist()):
+        best = max(range(len(classes)), key=row.__getitem__)
+        rows.append({"id": text_id, "label": classes[best], "probabilities": dict(zip(classes, row))})
+    return rows
+
+
+# Output and checkpoints ----------------------------------------------------
+
+def write_rows(f, rows, output_format):
+    if output_format == 'jsonl':
+        for row in rows:
+            f.write(json.dumps(row, default=str) + '\n')
+        return
+    writer = csv.writer(f)
+    for row in rows:
+        writer.writerow([row["id"], row["label"]] + list(row["probabilities"].values()))
+
+
+def write_csv_header(f, classes):
+    csv.writer(f).writerow(["id", "label"] + [f"prob_{label}" for label in classes])
+
+
+# Progress file: chunks finished and the output size at that point
+def load_progress(progress_path):
+    if not os.path.exists(progress_path):
+        return {"chunks": 0, "bytes": 0}
+    with open(progress_path, 'r') as f:
+        return json.load(f)
+
+
+# A checkpoint only holds for the run that wrote it: another input, chunking or model misaligns the output
+def run_settings(input_path, text_column, id_column, chunk_size):
+    stat = os.stat(input_path)
+    return {"input": os.path.abspath(input_path), "input_size": stat.st_size, "input_mtime_ns": stat.st_mtime_ns,
+            "text_column": text_column, "id_column": id_column, "chunk_size": chunk_size,
+            "model_version": model_version()}
+
+
+def save_progress(progress_path, progress):
+    tmp_path = f"{progress_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, progress_path)
+
+
+# Main loop -----------------------------------------------------------------
+
+def run_batch(input_path, output_path, text_column='text', id_column=None, chunk_size=CHUNK_SIZE,
+              workers=0, resume=True):
+    """
+    Predicts every text of `input_path` and streams (id, label, probabilities)
+    to `output_path` (.jsonl or .csv). After each finished chunk the output
+    size is checkpointed, so an interrupted run resumes after the last
+    complete chunk. With `workers` > 0 chunks are predicted in a process pool.
+    A run only resumes with the input, columns, chunk size and model of the
+    checkpoint; otherwise it stops with an error and `resume=False`
+    (--restart) has to start over.
+    """
+    output_format = 'csv' if output_path.endswith('.csv') else 'jsonl'
+    progress_path = f"{output_path}.progress"
+    # Read before the model is loaded, so a model saved in between does not pass for the old one
+    settings = run_settings(input_path, text_column, id_column, chunk_size)
+    progress = load_progress(progress_path) if resume else {"chunks": 0, "bytes": 0}
+    if progress["chunks"]:
+        changed = [key for key, value in settings.items() if progress.get("settings", {}).get(key) != value]
+        if changed:
+            raise ValueError(f"{progress_path} belongs to a run with a different {', '.join(changed)}; "
+                             f"pass --restart to start over")
+        print(f"🔁 Resuming after chunk {progress['chunks']}")
+    progress["settings"] = settings
+
+    model, vectorizer = load_model_and_vectorizer()
+    chunks = iter_input_chunks(input_path, text_column, id_column, chunk_size)
+
+    # Drop anything written after the last checkpoint, then append
+    mode = 'r+' if progress["chunks"] and os.path.exists(output_path) else 'w'
+    start = time.perf_counter()
+    predicted = 0
+    with open(output_path, mode, newline='', encoding='utf-8') as f:
+        f.seek(progress["bytes"])
+        f.truncate()
+        if output_format == 'csv' and not progress["chunks"]:
+            write_csv_header(f, [str(label) for label in model.classes_])
+
+        def finish(rows):
+            nonlocal predicted
+            write_rows(f, rows, output_format)
+            f.flush()
+            predicted += len(rows)
+            progress["chunks"] += 1
+            progress["bytes"] = f.tell()
+            save_progress(progress_path, progress)
+
+        # Chunks finished by an earlier run are read but not predicted again
+        done_before = progress["chunks"]
+        skipped = 0
+        pending = []
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker) if workers > 0 else None
+        try:
+            for ids, texts in chunks:
+                if skipped < done_before:
+                    skipped += 1
+                    continue
+                if executor is None:
+                    finish(predict_chunk(ids, texts, model, vectorizer))
+                    continue
+                # Keep a bounded window of chunks in flight and write them in order
+                pending.append(executor.submit(predict_chunk, ids, texts))
+                if len(pending) >= 2 * workers:
+                    finish(pending.pop(0).result())
+            for future in pending:
+                finish(future.result())
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    rate = predicted / elapsed if elapsed > 0 else 0.0
+    print(f"📊 Predicted {predicted} texts in {elapsed:.1f}s ({rate:.0f} texts/sec) -> {output_path}")
+    return predicted
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Batch-predict a CSV, JSON Lines or plain text file")
+    arg_parser.add_argument("input", help="input file (.csv, .json, .jsonl, .jsonl.gz, .parquet or plain text)")
+    arg_parser.add_argument("output", help="output file (.jsonl or .csv)")
+    arg_parser.add_argument("--text-column", default="text", help="column / field holding the text")
+    arg_parser.add_argument("--id-column", help="column / field holding the id (default: row number)")
+    arg_parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    arg_parser.add_argument("--workers", type=int, default=0, help="process pool size (0 = in process)")
+    arg_parser.add_argument("--restart", action="store_true", help="ignore previous progress")
+    metrics.add_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    try:
+        with metrics.instrumented(args, "batch_predict"):
+            run_batch(args.input, args.output, args.text_column, args.id_column, args.chunk_size,
+                      args.workers, resume=not args.restart)
+    except ValueError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
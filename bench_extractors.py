@@ -0,0 +1,116 @@
+import os
+import glob
+import html
+import time
+import argparse
+from extractors import BACKENDS, available_backends, extract, extract_many
+from record_store import is_record_file, iter_records
+from snapshot_archive import ARCHIVE_DIR, SnapshotArchive, read_record
+
+# Benchmark the original BeautifulSoup extractor against the single-pass backends
+
+# Rebuild an HTML page from a stored scrape record, so old runs can be replayed
+def page_from_record(record):
+    parts = ["<!DOCTYPE html><html><head>"]
+    if record.get("title") is not None:
+        parts.append(f"<title>{html.escape(record['title'])}</title>")
+    if record.get("description") not in (None, "No Description"):
+        parts.append(f'<meta name="description" content="{html.escape(record["description"])}">')
+    parts.append("</head><body><div class=\"main\">")
+    content = record.get("content", "")
+    for start in range(0, len(content), 400):
+        parts.append(f"<p>{html.escape(content[start:start + 400])}</p>\n")
+    for src in record.get("images", []):
+        parts.append(f'<img src="{html.escape(src)}" alt="">')
+    parts.append("<ul>")
+    for href in record.get("links", []):
+        parts.append(f'<li><a href="{html.escape(href)}">link</a></li>')
+    parts.append("</ul></div></body></html>")
+    return "".join(parts)
+
+
+# Raw HTML of the latest archived snapshot of every page
+def load_archived_pages(archive_dir=ARCHIVE_DIR):
+    # Opening the archive creates it, so a missing one is left alone
+    if not os.path.exists(os.path.join(archive_dir, "index.db")):
+        return []
+    with SnapshotArchive(archive_dir) as archive:
+        rows = archive.snapshots("page", latest=True)
+    pages = []
+    for row in rows:
+        _, body = read_record(archive_dir, row["segment"], row["offset"], row["length"], row["compression"])
+        pages.append((row["key"], body.decode("utf-8", errors="replace")))
+    return pages
+
+
+# Collect saved pages: raw HTML from the snapshot archive and other saved copies; only when there
+# is none, pages rebuilt from the refined records (their markup is ours, not the sites')
+def load_pages():
+    pages = load_archived_pages()
+    for path in sorted(glob.glob("logs/*.html")):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            pages.append((path, f.read()))
+    for path in sorted(glob.glob("data/http_cache/bodies/*/*")):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            pages.append((path, f.read()))
+    if pages:
+        return pages
+    # Legacy .json arrays as well as the .jsonl / .jsonl.gz files of newer scrapes
+    for path in sorted(path for path in glob.glob("data/refined/*") if is_record_file(path)):
+        for record in iter_records(path):
+            pages.append((record["url"], page_from_record(record)))
+    return pages
+
+
+def run_backend(backend, pages):
+    results = []
+    start = time.perf_counter()
+    for url, page in pages:
+        try:
+            results.append(extract(url, page, backend))
+        except Exception as e:
+            results.append(repr(e))
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare HTML extractors on saved pages")
+    parser.add_argument("--repeat", type=int, default=3, help="times to repeat the page set")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="process pool size")
+    args = parser.parse_args()
+
+    pages = load_pages() * args.repeat
+    if not pages:
+        print("❌ No saved pages found in data/archive/, logs/, data/http_cache/ or data/refined/")
+        return
+    size_mb = sum(len(page) for _, page in pages) / (1024 * 1024)
+    print(f"📄 {len(pages)} pages, {size_mb:.1f} MB of HTML")
+
+    installed = [name for name in available_backends() if name in BACKENDS]
+    if "bs4" not in installed:
+        print("❌ beautifulsoup4 is required for the reference extractor")
+        return
+    reference, reference_time = run_backend("bs4", pages)
+
+    print(f"{'backend':<14}{'seconds':>10}{'pages/s':>10}{'speedup':>10}{'mismatches':>12}")
+    print(f"{'bs4':<14}{reference_time:>10.3f}{len(pages) / reference_time:>10.1f}{1.0:>10.2f}{0:>12}")
+    for backend in installed:
+        if backend == "bs4":
+            continue
+        results, elapsed = run_backend(backend, pages)
+        mismatches = sum(1 for old, new in zip(reference, results) if old != new)
+        print(f"{backend:<14}{elapsed:>10.3f}{len(pages) / elapsed:>10.1f}"
+              f"{reference_time / elapsed:>10.2f}{mismatches:>12}")
+
+    # Same extraction spread over a process pool
+    start = time.perf_counter()
+    results = extract_many(pages, "python", workers=args.workers)
+    elapsed = time.perf_counter() - start
+    mismatches = sum(1 for old, new in zip(reference, results) if old != new)
+    label = f"python x{args.workers}"
+    print(f"{label:<14}{elapsed:>10.3f}{len(pages) / elapsed:>10.1f}"
+          f"{reference_time / elapsed:>10.2f}{mismatches:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import random
+import tempfile
+import argparse
+import subprocess
+import numpy as np
+
+# Benchmark predictor cold start: joblib pickles against the memory-mapped model artifact
+
+CLASSES = ["Food", "Travel", "Apps", "Shopping", "Health"]
+SAMPLE_TEXTS = ["Best restaurants to visit in Ahmedabad", "Top tourist destinations in Paris",
+                "Delicious food delivery apps in Mumbai", "w17 w3 w99999 unseen words"]
+
+# Runs in a fresh interpreter, so the timing includes the imports each path needs
+LOAD_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+if sys.argv[1] == "joblib":
+    import joblib
+    model = joblib.load(sys.argv[2] + "/trained_model.joblib")
+    vectorizer = joblib.load(sys.argv[2] + "/tfidf_vectorizer.joblib")
+else:
+    from model_artifact import load_artifact
+    model, vectorizer = load_artifact(artifact_dir=sys.argv[2] + "/artifacts")
+loaded = time.perf_counter() - start
+predictions = model.predict(vectorizer.transform(json.loads(sys.argv[3]))).tolist()
+first = time.perf_counter() - start
+with open("/proc/self/status") as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS")) / 1024
+print(json.dumps({"load": loaded, "first": first, "rss": rss, "predictions": predictions}))
+"""
+
+
+def synthetic_corpus(vocabulary_size, documents, seed=42):
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(vocabulary_size)]
+    texts = [" ".join(rng.choices(words, k=40)) for _ in range(documents)]
+    # Make sure every word shows up at least once so the vocabulary has the asked-for size
+    texts.append(" ".join(words))
+    labels = [rng.choice(CLASSES) for _ in texts]
+    return texts + SAMPLE_TEXTS, labels + CLASSES[:len(SAMPLE_TEXTS)]
+
+
+def build_model(model_dir, vocabulary_size, documents):
+    import joblib
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+    from model_artifact import save_artifact
+
+    texts, labels = synthetic_corpus(vocabulary_size, documents)
+    vectorizer = TfidfVectorizer()
+    model = MultinomialNB().fit(vectorizer.fit_transform(texts), labels)
+    joblib.dump(model, os.path.join(model_dir, "trained_model.joblib"))
+    joblib.dump(vectorizer, os.path.join(model_dir, "tfidf_vectorizer.joblib"))
+    save_artifact(model, vectorizer, os.path.join(model_dir, "artifacts"))
+    return model, vectorizer
+
+
+def cold_start(mode, model_dir, texts, runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", LOAD_SCRIPT, mode, model_dir, json.dumps(texts)],
+                                capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        results.append(json.loads(output.stdout))
+    # Median run, by time to first prediction
+    return sorted(results, key=lambda result: result["first"])[len(results) // 2]
+
+
+def disk_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / 1e6
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark model loading: joblib vs memory-mapped artifact")
+    arg_parser.add_argument("--vocab-sizes", default="10000,100000,500000",
+                            help="comma-separated vocabulary sizes")
+    arg_parser.add_argument("--documents", type=int, default=2000, help="training documents per model")
+    arg_parser.add_argument("--runs", type=int, default=3, help="cold starts per path (median is shown)")
+    args = arg_parser.parse_args()
+
+    print(f"{'vocab':>10}{'path':>10}{'disk MB':>10}{'load s':>10}{'1st pred s':>12}{'RSS MB':>10}")
+    for size in [int(value) for value in args.vocab_sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as model_dir:
+            model, vectorizer = build_model(model_dir, size, args.documents)
+            texts = SAMPLE_TEXTS + synthetic_corpus(size, 20, seed=7)[0][:20]
+            expected = model.predict(vectorizer.transform(texts)).tolist()
+
+            for mode in ("joblib", "artifact"):
+                result = cold_start(mode, model_dir, texts, args.runs)
+                files = os.path.join(model_dir, "artifacts") if mode == "artifact" else model_dir
+                size_mb = disk_mb(files) if mode == "artifact" else \
+                    sum(os.path.getsize(os.path.join(model_dir, name)) for name in os.listdir(model_dir)
+                        if name.endswith(".joblib")) / 1e6
+                print(f"{size:>10}{mode:>10}{size_mb:>10.1f}{result['load']:>10.3f}{result['first']:>12.3f}"
+                      f"{result['rss']:>10.1f}")
+                if result["predictions"] != expected:
+                    print(f"❌ {mode} predictions differ from the in-memory model")
+
+            # Probabilities must match too, not only the winning class
+            from model_artifact import load_artifact
+            mapped_model, mapped_vectorizer = load_artifact(artifact_dir=os.path.join(model_dir, "artifacts"))
+            same = np.allclose(model.predict_proba(vectorizer.transform(texts)),
+                               mapped_model.predict_proba(mapped_vectorizer.transform(texts)))
+            print(f"🔍 Probabilities identical at vocabulary {size}: {same}")
+
+
+if __name__ == "__main__":
+    main()
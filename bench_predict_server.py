@@ -0,0 +1,101 @@
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Load test for predict_server.py: latency percentiles and requests/sec
+
+SAMPLE_TEXTS = [
+    "Best restaurants to visit in Ahmedabad",
+    "Top tourist destinations in Paris",
+    "Delicious food delivery apps in Mumbai",
+    "Must-try street foods in Ahmedabad",
+    "Explore the Eiffel Tower in Paris",
+    "Book an auto or cab with the Vayu app"
+]
+
+
+def post_predict(url, texts):
+    body = json.dumps({"texts": texts}).encode("utf-8")
+    request = urllib.request.Request(f"{url}/predict", data=body,
+                                     headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=30) as response:
+        json.loads(response.read())
+    return time.perf_counter() - start
+
+
+# Start a server subprocess and wait until /health answers
+def spawn_server(port, cache_size=None):
+    command = [sys.executable, "predict_server.py", "--port", str(port)]
+    if cache_size is not None:
+        command += ["--cache-size", str(cache_size)]
+    process = subprocess.Popen(command)
+    url = f"http://127.0.0.1:{port}"
+    # Importing scikit-learn and loading the model can take a while on a cold start
+    for _ in range(600):
+        try:
+            urllib.request.urlopen(f"{url}/health", timeout=1).read()
+            return process, url
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError("prediction server exited during startup")
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("prediction server did not start")
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the prediction server")
+    parser.add_argument("--url", help="server to test; a local one is started when omitted")
+    parser.add_argument("--port", type=int, default=8001, help="port for the local server")
+    parser.add_argument("--requests", type=int, default=2000, help="total requests")
+    parser.add_argument("--concurrency", type=int, default=32, help="parallel clients")
+    parser.add_argument("--texts-per-request", type=int, default=1)
+    parser.add_argument("--cache-size", type=int,
+                        help="prediction cache size of the local server (0 = off; the texts repeat, so "
+                             "with the cache on most requests are hits)")
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = spawn_server(args.port, args.cache_size)
+
+    rng = random.Random(0)
+    payloads = [rng.sample(SAMPLE_TEXTS, min(args.texts_per_request, len(SAMPLE_TEXTS)))
+                for _ in range(args.requests)]
+    try:
+        post_predict(url, payloads[0])  # warm-up
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            latencies = sorted(executor.map(lambda texts: post_predict(url, texts), payloads))
+        elapsed = time.perf_counter() - start
+        with urllib.request.urlopen(f"{url}/health", timeout=5) as response:
+            health = json.loads(response.read())
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print(f"📊 {args.requests} requests, {args.concurrency} clients, {elapsed:.2f}s")
+    print(f"   throughput: {args.requests / elapsed:.1f} req/s")
+    print(f"   latency p50: {percentile(latencies, 0.50) * 1000:.2f} ms, "
+          f"p99: {percentile(latencies, 0.99) * 1000:.2f} ms")
+    if health.get("batches"):
+        print(f"   average batch: {health['texts'] / health['batches']:.1f} texts")
+    if "cache_hit_ratio" in health:
+        print(f"   prediction cache hit ratio: {health['cache_hit_ratio'] * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import time
+import random
+import argparse
+from itertools import cycle, islice
+from phase4_refine import CLEAN_CHUNK_SIZE, iter_cleaned_data, iter_cleaned_data_loop
+
+# Benchmark the per-record cleaning loop against the chunked pandas path
+
+WORDS = ["best", "food", "in", "ahmedabad", "vayu", "app", "Book", "Auto/Cab", "street",
+         "Restaurants", "Thali", "Dhokla", "Ride", "Google", "Play", "review", "menu"]
+SPACES = [" ", "  ", "\t", "\n", " \n "]
+
+
+def noisy_text(rng, words):
+    return "".join(rng.choice(WORDS) + rng.choice(SPACES) for _ in range(words))
+
+
+def synthetic_record(rng, i):
+    return {
+        "url": f"https://example{i % 97}.com/page/{i}",
+        "title": "  " + noisy_text(rng, 8),
+        "description": noisy_text(rng, 20),
+        "content": noisy_text(rng, 60),
+        "images": [rng.choice(["https://cdn.example.com/", "/static/", "data:image/png;"]) + f"{i}_{k}.png"
+                   for k in range(rng.randint(0, 6))],
+        "links": [rng.choice(["https://example.com/", "/relative/", "#top", "http://old.example.com/"]) + str(k)
+                  for k in range(rng.randint(0, 12))]
+    }
+
+
+# Cycle through a fixed pool so generating 1M records costs almost nothing
+def synthetic_records(count, pool_size=2000, seed=42):
+    rng = random.Random(seed)
+    pool = [synthetic_record(rng, i) for i in range(pool_size)]
+    return islice(cycle(pool), count)
+
+
+def time_cleaner(cleaner, count):
+    start = time.perf_counter()
+    cleaned = 0
+    for _ in cleaner(synthetic_records(count)):
+        cleaned += 1
+    return time.perf_counter() - start, cleaned
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark record cleaning in phase4_refine")
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="comma-separated record counts")
+    parser.add_argument("--chunk-size", type=int, default=CLEAN_CHUNK_SIZE,
+                        help="rows per DataFrame chunk")
+    args = parser.parse_args()
+
+    # Both paths must agree before their timings mean anything
+    sample = list(synthetic_records(5000))
+    same = list(iter_cleaned_data_loop(sample)) == list(iter_cleaned_data(sample, args.chunk_size))
+    print(f"🔍 Outputs identical on 5000 records: {same}")
+
+    print(f"{'records':>10}{'loop s':>10}{'pandas s':>10}{'loop rec/s':>14}{'pandas rec/s':>14}{'speedup':>10}")
+    for size in [int(value) for value in args.sizes.split(",")]:
+        loop_time, _ = time_cleaner(iter_cleaned_data_loop, size)
+        pandas_time, _ = time_cleaner(lambda data: iter_cleaned_data(data, args.chunk_size), size)
+        print(f"{size:>10}{loop_time:>10.2f}{pandas_time:>10.2f}{size / loop_time:>14.0f}"
+              f"{size / pandas_time:>14.0f}{loop_time / pandas_time:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
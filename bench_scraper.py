@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import resource
+import argparse
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Benchmark the scraper end to end against a local mock web server, without touching the internet
+
+BENCH_DIR = "data/bench"
+MODES = ["sequential", "async", "async+parse-pool"]
+WORDS = ["best", "food", "in", "ahmedabad", "vayu", "app", "street", "thali", "dhokla", "ride",
+         "review", "menu", "travel", "hotel", "booking", "price", "delivery", "city", "guide", "top"]
+
+
+# Mock server ---------------------------------------------------------------------
+
+# Deterministic synthetic page of about `size` bytes
+def synthetic_page(i, size, seed):
+    rng = random.Random(seed * 1000003 + i)
+    head = (f"<html><head><title>Page {i} {' '.join(rng.choices(WORDS, k=5))}</title>"
+            f"<meta name=\"description\" content=\"{' '.join(rng.choices(WORDS, k=15))}\"></head><body>")
+    parts = [head]
+    length = len(head)
+    while length < size:
+        part = (f"<div class=\"c\"><p>{' '.join(rng.choices(WORDS, k=40))}</p>"
+                f"<img src=\"https://cdn.example.com/{rng.randrange(10 ** 6)}.png\">"
+                f"<a href=\"https://example{rng.randrange(50)}.com/page/{rng.randrange(10 ** 5)}\">link</a></div>")
+        parts.append(part)
+        length += len(part)
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def make_handler(config, latency):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, like a real server, so the client's connection pool matters
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            path, _, query = self.path.partition("?")
+            i = int(path.rsplit("/", 1)[-1])
+            rng = random.Random(config["seed"] * 7919 + i)
+            error, redirect = rng.random() < config["error_rate"], rng.random() < config["redirect_rate"]
+            time.sleep(latency)
+            if error:
+                self.send_response(500)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            elif redirect and not query:
+                self.send_response(302)
+                self.send_header("Location", f"{path}?redirected=1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            else:
+                body = synthetic_page(i, config["page_bytes"], config["seed"])
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+# One server per loopback address, so every "host" gets its own per-host limit in the fetch engine
+def serve(config, ready):
+    servers = []
+    for number, host in enumerate(config["hosts"]):
+        slow = number < config["slow_hosts"]
+        latency = (config["slow_latency_ms"] if slow else config["latency_ms"]) / 1000
+        server = ThreadingHTTPServer((host, config["port"]), make_handler(config, latency))
+        server.daemon_threads = True
+        servers.append(server)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    ready.set()
+    threading.Event().wait()
+
+
+def bench_urls(config):
+    hosts = config["hosts"]
+    return [f"http://{hosts[i % len(hosts)]}:{config['port']}/page/{i}" for i in range(config["pages"])]
+
+
+# One benchmark run (in a fresh interpreter) -----------------------------------
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def cpu_seconds(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_mode(mode, config):
+    """
+    "sequential" is the default phase 2 mode (fetch_page one URL at a time,
+    without the politeness sleep between categories). The async modes call
+    run_scraping itself on a throwaway category, so files are written too.
+    """
+    import requests
+    import metrics
+    from fetch_engine import PageSkipped, fetch_page
+    from phase2_scraper import get_session, make_page_handler, run_scraping
+
+    urls = bench_urls(config)
+    latencies = []
+    # Time to the response headers of every request, redirects and retries included
+    get_session().hooks["response"].append(lambda response, *args, **kwargs:
+                                           latencies.append(response.elapsed.total_seconds()))
+    limits = {"retries": config["retries"], "backoff": config["backoff"]}
+    workdir = tempfile.mkdtemp(prefix="bench_scraper_")
+    os.chdir(workdir)
+    os.makedirs("data/urls", exist_ok=True)
+    with open("data/urls/bench.json", "w") as f:
+        json.dump(urls, f)
+    # run_scraping flushes metrics after every category, so collect them in a file instead of reading the registry
+    metrics.enable(os.path.join(workdir, "metrics"))
+
+    # Start-up and imports are not part of the run: only CPU used from here on counts
+    cpu_before = cpu_seconds(resource.RUSAGE_SELF) + cpu_seconds(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    if mode == "sequential":
+        handle = make_page_handler(config["parser"])
+        pages = 0
+        for url in urls:
+            try:
+                pages += fetch_page(get_session(), url, handle, **limits) is not None
+            except (PageSkipped, requests.exceptions.RequestException):
+                pass
+    else:
+        run_scraping(async_mode=True, use_cache=False, parser=config["parser"],
+                     parse_workers=config["parse_workers"] if mode == "async+parse-pool" else 0,
+                     categories=["bench"], concurrency=config["concurrency"], per_host=config["per_host"],
+                     host_delay=0.0, **limits)
+        with open(next(os.path.join("data/refined", name) for name in os.listdir("data/refined"))) as f:
+            pages = sum(1 for _ in f)
+    wall = time.perf_counter() - start
+    metrics.flush()
+    _, histograms, _, _ = metrics.merge_run(os.path.join(workdir, "metrics"))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    # fetch_page times every parse into this histogram; with a parse pool that is the time the
+    # fetch threads waited for the pool, not parsing CPU, so it is reported under another name
+    parse_seconds = sum(histogram["sum"] for (name, _), histogram in histograms.items() if name == "parse_seconds")
+    pooled = mode == "async+parse-pool"
+    cpu = cpu_seconds(resource.RUSAGE_SELF) + cpu_seconds(resource.RUSAGE_CHILDREN) - cpu_before
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children_peak_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return {
+        "pages": pages,
+        "wall_seconds": wall,
+        "pages_per_sec": pages / wall if wall > 0 else 0.0,
+        "fetch_p50_ms": percentile(latencies, 0.50) * 1000,
+        "fetch_p99_ms": percentile(latencies, 0.99) * 1000,
+        "requests": len(latencies),
+        "cpu_seconds": cpu,
+        "parse_seconds": None if pooled else parse_seconds,
+        "parse_pool_wait_seconds": parse_seconds if pooled else None,
+        "wait_seconds": max(wall - cpu, 0.0),
+        "peak_rss_mb": peak_mb,
+        "parse_pool_peak_rss_mb": children_peak_mb,
+    }
+
+
+def run_in_subprocess(mode, config):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-mode", mode, json.dumps(config)],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr.strip().splitlines()[-1] if output.stderr.strip() else "run failed")
+    # The scraper prints progress; the result is the last line
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+# Driver ------------------------------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, previous=None):
+    print(f"{'mode':<18}{'pages':>7}{'pages/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'cpu s':>8}{'parse s':>9}"
+          f"{'wait s':>9}{'RSS MB':>9}")
+    for mode, result in results.items():
+        if result["parse_seconds"] is not None:
+            parse = f"{result['parse_seconds']:>9.2f}"
+        else:
+            parse = f"{result['parse_pool_wait_seconds']:>8.2f}*"
+        print(f"{mode:<18}{result['pages']:>7}{result['pages_per_sec']:>10.1f}{result['fetch_p50_ms']:>9.1f}"
+              f"{result['fetch_p99_ms']:>9.1f}{result['cpu_seconds']:>8.2f}{parse}"
+              f"{result['wait_seconds']:>9.2f}{result['peak_rss_mb']:>9.1f}")
+        before = (previous or {}).get("modes", {}).get(mode)
+        if before and before["pages_per_sec"]:
+            change = (result["pages_per_sec"] / before["pages_per_sec"] - 1) * 100
+            print(f"{'':<18}{change:+.1f}% pages/s vs {previous.get('commit') or 'previous run'}")
+    if any(result["parse_seconds"] is None for result in results.values()):
+        print("* time the fetch threads waited for the parse pool, not parse CPU")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark phase 2 against a local mock web server")
+    arg_parser.add_argument("--pages", type=int, default=300, help="pages to scrape per mode")
+    arg_parser.add_argument("--page-kb", type=float, default=50, help="size of each synthetic page in KB")
+    arg_parser.add_argument("--latency-ms", type=float, default=20, help="server latency per request")
+    arg_parser.add_argument("--hosts", type=int, default=4, help="distinct hosts (127.0.0.1, 127.0.0.2, ...)")
+    arg_parser.add_argument("--slow-hosts", type=int, default=1, help="how many of the hosts are slow")
+    arg_parser.add_argument("--slow-latency-ms", type=float, default=300, help="latency of a slow host")
+    arg_parser.add_argument("--error-rate", type=float, default=0.02, help="share of pages answering 500")
+    arg_parser.add_argument("--redirect-rate", type=float, default=0.1, help="share of pages behind a 302")
+    arg_parser.add_argument("--modes", default=",".join(MODES), help=f"comma-separated, from {MODES}")
+    arg_parser.add_argument("--parser", default="python", help="extraction backend")
+    arg_parser.add_argument("--parse-workers", type=int, default=2, help="parse pool size for async+parse-pool")
+    arg_parser.add_argument("--concurrency", type=int, default=16, help="async: pages in flight")
+    arg_parser.add_argument("--per-host", type=int, default=4, help="async: pages in flight per host")
+    arg_parser.add_argument("--port", type=int, default=8790, help="port of the mock servers")
+    arg_parser.add_argument("--output", help=f"result file (default: {BENCH_DIR}/scraper_<timestamp>.json)")
+    arg_parser.add_argument("--compare", help="earlier result file to compare pages/sec against")
+    arg_parser.add_argument("--run-mode", nargs=2, metavar=("MODE", "CONFIG"), help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.run_mode:
+        mode, config = args.run_mode
+        print(json.dumps(run_mode(mode, json.loads(config))))
+        return
+
+    config = {
+        "pages": args.pages, "page_bytes": int(args.page_kb * 1024), "latency_ms": args.latency_ms,
+        "hosts": [f"127.0.0.{k}" for k in range(1, args.hosts + 1)], "slow_hosts": args.slow_hosts,
+        "slow_latency_ms": args.slow_latency_ms, "error_rate": args.error_rate,
+        "redirect_rate": args.redirect_rate, "parser": args.parser, "parse_workers": args.parse_workers,
+        "concurrency": args.concurrency, "per_host": args.per_host, "port": args.port, "seed": 42,
+        # A 500 is retried once, quickly, so errors cost time without dominating the run
+        "retries": 1, "backoff": 0.05,
+    }
+    # The server gets its own process, so its CPU time never counts against the scraper
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(config, ready), daemon=True)
+    server.start()
+    ready.wait(10)
+
+    results = {}
+    try:
+        for mode in args.modes.split(","):
+            print(f"▶️  {mode}")
+            try:
+                results[mode] = run_in_subprocess(mode, config)
+            except RuntimeError as e:
+                print(f"❌ {mode} failed: {e}")
+    finally:
+        server.terminate()
+
+    previous = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            previous = json.load(f)
+    print_results(results, previous)
+
+    output = args.output or os.path.join(BENCH_DIR, f"scraper_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"commit": git_commit(), "time": datetime.now().isoformat(timespec="seconds"),
+                   "config": config, "modes": results}, f, indent=2)
+    print(f"📝 Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import os
+import csv
+import time
+import argparse
+from functools import lru_cache
+from itertools import product
+import numpy as np
+from joblib import Memory, Parallel, delayed
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import StratifiedKFold
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.svm import LinearSVC
+from phase3_model import load_data
+
+# Training benchmark: cross-validated grid of vectorizer + classifier settings, spread over all cores
+
+CLASSES = ["Food", "Travel", "Apps", "Shopping", "Health", "Finance"]
+TOPIC_SHARE = 0.1           # Fraction of a synthetic document's words drawn from a class topic
+TOPIC_NOISE = 0.4           # Chance that such a word comes from another class's topic instead
+SHARED_WORDS = 20000        # Zipf-distributed vocabulary common to all classes
+TOPIC_WORDS = 300           # Words specific to each class
+
+# Vectorizer settings: each one is fitted once per fold and shared by every classifier below
+VECTORIZER_GRID = {"ngram_range": [(1, 1), (1, 2)], "min_df": [1, 2, 5]}
+
+# Classifier candidates: (name, factory, parameter grid)
+CLASSIFIER_GRID = [
+    ("MultinomialNB", MultinomialNB, {"alpha": [0.1, 0.5, 1.0]}),
+    ("SGD (log loss)", lambda **params: SGDClassifier(loss="log_loss", random_state=42, **params),
+     {"alpha": [1e-5, 1e-4]}),
+    ("LinearSVC", lambda **params: LinearSVC(dual=True, random_state=42, **params), {"C": [0.1, 1.0]}),
+]
+
+FIELDS = ["documents", "vectorizer", "classifier", "accuracy", "macro_f1",
+          "train_seconds", "predict_us_per_doc", "vocabulary"]
+
+
+def expand(grid):
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in product(*(grid[key] for key in keys))]
+
+
+def describe(params):
+    return " ".join(f"{key}={value}" for key, value in params.items())
+
+
+# Deterministic synthetic corpus: shared Zipf background words plus a topic per class
+@lru_cache(maxsize=4)
+def synthetic_corpus(documents, seed=42, words_per_document=40):
+    rng = np.random.default_rng(seed)
+    shared = np.array([f"w{i}" for i in range(SHARED_WORDS)])
+    topics = [np.array([f"{label.lower()}{i}" for i in range(TOPIC_WORDS)]) for label in CLASSES]
+    labels = rng.integers(0, len(CLASSES), documents)
+    topic_count = int(words_per_document * TOPIC_SHARE)
+    texts = []
+    for label in labels.tolist():
+        background = shared[np.minimum(rng.zipf(1.3, words_per_document - topic_count) - 1, SHARED_WORDS - 1)]
+        sources = np.where(rng.random(topic_count) < TOPIC_NOISE, rng.integers(0, len(CLASSES), topic_count), label)
+        topic = np.array([topics[source][rng.integers(0, TOPIC_WORDS)] for source in sources.tolist()])
+        words = np.concatenate([background, topic])
+        rng.shuffle(words)
+        texts.append(" ".join(words.tolist()))
+    return texts, [CLASSES[label] for label in labels.tolist()]
+
+
+@lru_cache(maxsize=1)
+def file_corpus(path):
+    return load_data(path)
+
+
+# Sources are ("synthetic", size) or ("file", path, mtime); the mtime keeps cached folds of an edited file apart
+def get_corpus(source):
+    return synthetic_corpus(source[1]) if source[0] == "synthetic" else file_corpus(source[1])
+
+
+# Fit the vectorizer on one training fold; cached on disk, so candidates and reruns reuse it
+def vectorize_fold(source, vectorizer_params, fold, folds):
+    texts, labels = get_corpus(source)
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=42)
+    train, test = list(splitter.split(texts, labels))[fold]
+    start = time.perf_counter()
+    vectorizer = TfidfVectorizer(**vectorizer_params)
+    X_train = vectorizer.fit_transform([texts[i] for i in train])
+    seconds = time.perf_counter() - start
+    return vectorizer, X_train, np.asarray(labels)[train], train, test, seconds
+
+
+# One parallel task: a vectorized fold, scored with every classifier candidate
+def evaluate_fold(source, vectorizer_params, fold, folds, cache_dir):
+    memory = Memory(cache_dir, verbose=0)
+    vectorizer, X_train, y_train, _, test, vectorize_seconds = \
+        memory.cache(vectorize_fold)(source, vectorizer_params, fold, folds)
+    texts, labels = get_corpus(source)
+    test_texts = [texts[i] for i in test]
+    y_test = np.asarray(labels)[test]
+
+    start = time.perf_counter()
+    X_test = vectorizer.transform(test_texts)
+    transform_seconds = time.perf_counter() - start
+
+    results = []
+    for name, factory, grid in CLASSIFIER_GRID:
+        for params in expand(grid):
+            start = time.perf_counter()
+            model = factory(**params).fit(X_train, y_train)
+            fit_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            predictions = model.predict(X_test)
+            predict_seconds = time.perf_counter() - start + transform_seconds
+            results.append({
+                "classifier": f"{name} {describe(params)}",
+                "accuracy": accuracy_score(y_test, predictions),
+                "macro_f1": f1_score(y_test, predictions, average="macro"),
+                "train_seconds": vectorize_seconds + fit_seconds,
+                "predict_us_per_doc": predict_seconds / len(test) * 1e6,
+                "vocabulary": len(vectorizer.vocabulary_),
+            })
+    return results
+
+
+# Run the whole grid on one corpus and average every candidate over the folds
+def run_grid(source, documents, folds=3, jobs=-1, cache_dir="data/bench_cache"):
+    tasks = [(params, fold) for params in expand(VECTORIZER_GRID) for fold in range(folds)]
+    fold_results = Parallel(n_jobs=jobs)(
+        delayed(evaluate_fold)(source, params, fold, folds, cache_dir) for params, fold in tasks)
+
+    rows = {}
+    for (params, _), results in zip(tasks, fold_results):
+        for result in results:
+            key = (describe(params), result["classifier"])
+            rows.setdefault(key, []).append(result)
+    table = []
+    for (vectorizer, classifier), results in rows.items():
+        row = {"documents": documents, "vectorizer": vectorizer, "classifier": classifier}
+        for field in FIELDS[3:]:
+            row[field] = float(np.mean([result[field] for result in results]))
+        table.append(row)
+    return table
+
+
+def print_table(table):
+    print(f"{'docs':>8}  {'vectorizer':<28}{'classifier':<30}{'acc':>7}{'F1':>7}{'train s':>9}{'µs/doc':>9}")
+    for row in sorted(table, key=lambda row: (row["documents"], -row["accuracy"])):
+        print(f"{row['documents']:>8}  {row['vectorizer']:<28}{row['classifier']:<30}{row['accuracy']:>7.3f}"
+              f"{row['macro_f1']:>7.3f}{row['train_seconds']:>9.2f}{row['predict_us_per_doc']:>9.1f}")
+
+
+# Fastest-predicting candidate that reaches the quality bar, per corpus size
+def recommend(table, min_accuracy):
+    for documents in sorted({row["documents"] for row in table}):
+        good = [row for row in table if row["documents"] == documents and row["accuracy"] >= min_accuracy]
+        if not good:
+            print(f"⚠️ {documents} docs: no candidate reaches accuracy {min_accuracy}")
+            continue
+        best = min(good, key=lambda row: (row["predict_us_per_doc"], row["train_seconds"]))
+        print(f"✅ {documents} docs: {best['classifier']} with {best['vectorizer']} "
+              f"(accuracy {best['accuracy']:.3f}, {best['predict_us_per_doc']:.1f} µs/doc, "
+              f"trains in {best['train_seconds']:.2f}s)")
+
+
+def write_table(table, output_path):
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(table)
+    print(f"📝 Results written to {output_path}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark training: cross-validated model grid on all cores")
+    arg_parser.add_argument("--sizes", default="2000,10000,50000",
+                            help="comma-separated synthetic corpus sizes")
+    arg_parser.add_argument("--data", help="benchmark on this training file (.json/.jsonl) instead")
+    arg_parser.add_argument("--folds", type=int, default=3, help="cross-validation folds")
+    arg_parser.add_argument("--jobs", type=int, default=-1, help="parallel workers (-1 = all cores)")
+    arg_parser.add_argument("--min-accuracy", type=float, default=0.8, help="quality bar for the recommendation")
+    arg_parser.add_argument("--cache-dir", default="data/bench_cache", help="where vectorized folds are cached")
+    arg_parser.add_argument("--output", default="data/training_benchmark.csv", help="CSV table of the results")
+    args = arg_parser.parse_args()
+
+    if args.data:
+        sources = [(("file", args.data, os.path.getmtime(args.data)), len(load_data(args.data)[0]))]
+    else:
+        sources = [(("synthetic", size), size) for size in [int(value) for value in args.sizes.split(",")]]
+
+    table = []
+    for source, documents in sources:
+        start = time.perf_counter()
+        table.extend(run_grid(source, documents, args.folds, args.jobs, args.cache_dir))
+        print(f"📊 {documents} documents: grid finished in {time.perf_counter() - start:.1f}s")
+
+    print_table(table)
+    recommend(table, args.min_accuracy)
+    write_table(table, args.output)
+
+
+if __name__ == "__main__":
+    # Run from the importable module: the pool workers look up the lru_cached corpus functions
+    # by name, and a __main__ they did not start cannot provide them
+    import bench_training
+    bench_training.main()
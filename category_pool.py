@@ -0,0 +1,76 @@
+import time
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import metrics
+
+# Shared by every phase: where the categories come from and how they are spread over workers
+
+CATEGORIES_FILE = "categories.json"
+
+
+# A JSON array of categories, or a plain text file with one category per line
+def load_categories(path=CATEGORIES_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            categories = json.load(f)
+        else:
+            categories = [line.strip() for line in f]
+    # Keep the order of the file, drop blanks and repeats
+    return list(dict.fromkeys(category for category in categories if category))
+
+
+def add_category_arguments(arg_parser, workers_help="categories processed in parallel (0 = one after another)"):
+    arg_parser.add_argument("--categories-file", default=CATEGORIES_FILE,
+                            help="JSON array or text file (one per line) of categories")
+    arg_parser.add_argument("--workers", type=int, default=0, help=workers_help)
+
+
+def timed_call(func, category):
+    start = time.perf_counter()
+    try:
+        count = func(category)
+    finally:
+        # Pool workers are shut down without running exit handlers, so hand metrics over now
+        metrics.flush()
+    return count or 0, time.perf_counter() - start
+
+
+# Run func(category) for every category, sharded over a process pool, and report throughput
+def run_per_category(func, categories, workers=0, unit="records", initializer=None, initargs=()):
+    """
+    `func` must be picklable (a top-level function or a functools.partial of
+    one) and return how many items it produced. A failing category is
+    reported and does not stop the others. Returns {category: (count, seconds)},
+    with failed categories left out.
+    """
+    results = {}
+    run_start = time.perf_counter()
+
+    def report(category, count, seconds):
+        results[category] = (count, seconds)
+        rate = count / seconds if seconds > 0 else 0.0
+        print(f"📊 {category}: {count} {unit} in {seconds:.1f}s ({rate:.2f} {unit}/sec)")
+
+    if workers > 0:
+        with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+            futures = {executor.submit(timed_call, func, category): category for category in categories}
+            for future in as_completed(futures):
+                try:
+                    report(futures[future], *future.result())
+                except Exception as e:
+                    print(f"❌ Category '{futures[future]}' failed: {e}")
+    else:
+        if initializer is not None:
+            initializer(*initargs)
+        for category in categories:
+            try:
+                report(category, *timed_call(func, category))
+            except Exception as e:
+                print(f"❌ Category '{category}' failed: {e}")
+
+    elapsed = time.perf_counter() - run_start
+    total = sum(count for count, _ in results.values())
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"📊 {len(results)}/{len(categories)} categories, {total} {unit} in {elapsed:.1f}s "
+          f"({rate:.2f} {unit}/sec, {workers or 1} workers)")
+    return results
@@ -0,0 +1,361 @@
+from html.entities import html5
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor
+
+# Registered extraction backends, fastest first; "auto" picks the first one installed
+BACKENDS = {}
+BACKEND_PRIORITY = ["lxml", "selectolax", "python"]
+
+# Tag groups that mirror BeautifulSoup's html.parser tree builder
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem",
+    "meta", "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame",
+    "image", "isindex", "nextid", "spacer"
+}
+STRING_CONTAINERS = {"script", "style", "template"}
+PRESERVE_WHITESPACE = {"pre", "textarea"}
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+
+def register_backend(name):
+    def decorator(func):
+        BACKENDS[name] = func
+        return func
+    return decorator
+
+
+# Build the record every backend returns, so the output shape never drifts
+def make_record(url, title, description, paragraphs, images, links):
+    return {
+        "url": url,
+        "title": title,
+        "description": description,
+        "content": "".join(paragraphs).strip(),
+        "images": images,
+        "links": links
+    }
+
+
+# Reference extractor: the original three-walk BeautifulSoup implementation
+@register_backend("bs4")
+def extract_bs4(url, html):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+
+    title = soup.title.string if soup.title else "No Title"
+    description = soup.find('meta', attrs={'name': 'description'})
+    description = description['content'] if description else "No Description"
+
+    content = ''
+    for paragraph in soup.find_all('p'):
+        content += paragraph.get_text()
+
+    images = [img['src'] for img in soup.find_all('img', src=True)]
+    links = [a['href'] for a in soup.find_all('a', href=True)]
+
+    return {
+        "url": url,
+        "title": title,
+        "description": description,
+        "content": content.strip(),
+        "images": images,
+        "links": links
+    }
+
+
+# Single-pass tokenizer that reproduces what BeautifulSoup('html.parser') would extract
+class SinglePassParser(HTMLParser):
+    """
+    Uses the same stdlib tokenizer as BeautifulSoup's html.parser builder
+    and replays its tree-building rules (void elements, pop-to-tag on end
+    tags, whitespace collapsing, string containers) on a stack of tag
+    names, without ever materialising the tree.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.stack = []                 # [name, paragraph buffer or None, title node or None]
+        self.open_counts = {}
+        self.already_closed = []
+        self.pending = []
+        self.containers = []
+        self.preserve = 0
+
+        self.title = None               # Children of the first <title>, as a tiny tree
+        self.description = None
+        self.paragraphs = []            # One text buffer per <p>, in document order
+        self.open_paragraphs = []
+        self.images = []
+        self.links = []
+
+    # Text handling -------------------------------------------------------
+
+    def handle_data(self, data):
+        self.pending.append(data)
+
+    def handle_charref(self, name):
+        if name.startswith(("x", "X")):
+            code = int(name.lstrip("xX"), 16)
+        else:
+            code = int(name)
+        data = None
+        # Numeric references below 256 are often meant as windows-1252
+        if code < 256:
+            try:
+                data = bytearray([code]).decode("windows-1252")
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(code)
+            except (ValueError, OverflowError):
+                pass
+        self.handle_data(data or "\N{REPLACEMENT CHARACTER}")
+
+    def handle_entityref(self, name):
+        character = html5.get(name + ";")
+        self.handle_data(character if character is not None else f"&{name}")
+
+    def handle_comment(self, data):
+        self.flush()
+        self.pending.append(data)
+        self.flush("comment")
+
+    def handle_decl(self, data):
+        self.flush()
+        if data.startswith("DOCTYPE "):
+            data = data[len("DOCTYPE "):]
+        self.pending.append(data)
+        self.flush("declaration")
+
+    def unknown_decl(self, data):
+        self.flush()
+        if data.upper().startswith("CDATA["):
+            self.pending.append(data[len("CDATA["):])
+            self.flush("cdata")
+        else:
+            self.pending.append(data)
+            self.flush("declaration")
+
+    def handle_pi(self, data):
+        self.flush()
+        self.pending.append(data)
+        self.flush("declaration")
+
+    # Emit the pending text run as one string, the way BeautifulSoup.endData does
+    def flush(self, kind="text"):
+        if not self.pending:
+            return
+        data = "".join(self.pending)
+        self.pending = []
+        if not self.preserve and not data.strip(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+
+        if self.stack and self.stack[-1][2] is not None:
+            self.stack[-1][2].append(data)
+
+        # get_text() on a <p> only keeps plain strings and CDATA
+        if kind == "cdata" or (kind == "text" and not self.containers):
+            for buffer in self.open_paragraphs:
+                buffer.append(data)
+
+    # Tag handling --------------------------------------------------------
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        self.flush()
+        attributes = {}
+        for key, value in attrs:
+            attributes[key] = "" if value is None else value
+
+        title_node = None
+        if self.stack and self.stack[-1][2] is not None:
+            title_node = []
+            self.stack[-1][2].append(title_node)
+        elif tag == "title" and self.title is None:
+            title_node = self.title = []
+
+        paragraph = None
+        if tag == "p":
+            paragraph = []
+            self.paragraphs.append(paragraph)
+            self.open_paragraphs.append(paragraph)
+        elif tag == "meta" and self.description is None and attributes.get("name") == "description":
+            self.description = attributes
+        elif tag == "img" and "src" in attributes:
+            self.images.append(attributes["src"])
+        elif tag == "a" and "href" in attributes:
+            self.links.append(attributes["href"])
+
+        self.stack.append([tag, paragraph, title_node])
+        self.open_counts[tag] = self.open_counts.get(tag, 0) + 1
+        if tag in STRING_CONTAINERS:
+            self.containers.append(tag)
+        if tag in PRESERVE_WHITESPACE:
+            self.preserve += 1
+
+        if tag in VOID_ELEMENTS and handle_empty_element:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self.already_closed:
+            self.already_closed.remove(tag)
+            return
+        self.flush()
+        if not self.open_counts.get(tag):
+            return
+        while self.stack:
+            if self.pop()[0] == tag:
+                break
+
+    def pop(self):
+        entry = self.stack.pop()
+        name, paragraph = entry[0], entry[1]
+        self.open_counts[name] -= 1
+        # Paragraphs close in reverse order of opening, so the last one is this one
+        if paragraph is not None:
+            self.open_paragraphs.pop()
+        if self.containers and name in STRING_CONTAINERS:
+            self.containers.pop()
+        if name in PRESERVE_WHITESPACE:
+            self.preserve -= 1
+        return entry
+
+    def close(self):
+        super().close()
+        self.flush()
+        while self.stack:
+            self.pop()
+
+
+# Tag.string semantics: the only child's string, recursively, else None
+def _single_string(node):
+    if len(node) != 1:
+        return None
+    child = node[0]
+    return child if isinstance(child, str) else _single_string(child)
+
+
+@register_backend("python")
+def extract_python(url, html):
+    parser = SinglePassParser()
+    parser.feed(html)
+    parser.close()
+
+    title = _single_string(parser.title) if parser.title is not None else "No Title"
+    description = parser.description["content"] if parser.description is not None else "No Description"
+    paragraphs = ["".join(buffer) for buffer in parser.paragraphs]
+    return make_record(url, title, description, paragraphs, parser.images, parser.links)
+
+
+# lxml backend: C parser, one walk over the element tree
+@register_backend("lxml")
+def extract_lxml(url, html):
+    from lxml import etree
+    from lxml import html as lxml_html
+
+    try:
+        root = lxml_html.document_fromstring(
+            html.encode("utf-8"), parser=lxml_html.HTMLParser(encoding="utf-8"))
+    except etree.ParserError:
+        # lxml refuses empty documents; the fallback handles them like BeautifulSoup
+        return extract_python(url, html)
+
+    title = "No Title"
+    seen_title = False
+    description = None
+    paragraphs, images, links = [], [], []
+    for element in root.iter(etree.Element):
+        tag = element.tag
+        if tag == "title" and not seen_title:
+            seen_title = True
+            title = element.text if len(element) == 0 else None
+        elif tag == "meta" and description is None and element.get("name") == "description":
+            description = element.attrib["content"]
+        elif tag == "p":
+            paragraphs.append(element.text_content())
+        elif tag == "img" and "src" in element.attrib:
+            images.append(element.get("src"))
+        elif tag == "a" and "href" in element.attrib:
+            links.append(element.get("href"))
+
+    description = description if description is not None else "No Description"
+    return make_record(url, title, description, paragraphs, images, links)
+
+
+# selectolax backend: lexbor-based parser, one traversal of the DOM
+@register_backend("selectolax")
+def extract_selectolax(url, html):
+    from selectolax.parser import HTMLParser as SelectolaxParser
+
+    tree = SelectolaxParser(html)
+    if tree.root is None:
+        return extract_python(url, html)
+
+    title = "No Title"
+    seen_title = False
+    description = None
+    paragraphs, images, links = [], [], []
+    for node in tree.root.traverse(include_text=False):
+        tag = node.tag
+        if tag == "title" and not seen_title:
+            seen_title = True
+            children = list(node.iter(include_text=True))
+            title = children[0].text() if len(children) == 1 and children[0].tag == "-text" else None
+        elif tag == "meta" and description is None and node.attributes.get("name") == "description":
+            description = node.attributes["content"]
+        elif tag == "p":
+            paragraphs.append(node.text(deep=True))
+        elif tag == "img" and "src" in node.attributes:
+            images.append(node.attributes["src"] or "")
+        elif tag == "a" and "href" in node.attributes:
+            links.append(node.attributes["href"] or "")
+
+    description = description if description is not None else "No Description"
+    return make_record(url, title, description, paragraphs, images, links)
+
+
+# Backends whose parser library can actually be imported here
+def available_backends():
+    available = ["python"]
+    for name, module in (("lxml", "lxml.html"), ("selectolax", "selectolax.parser"), ("bs4", "bs4")):
+        try:
+            __import__(module)
+            available.append(name)
+        except ImportError:
+            pass
+    return available
+
+
+def resolve_backend(backend="auto"):
+    if backend != "auto":
+        return backend
+    installed = available_backends()
+    return next(name for name in BACKEND_PRIORITY if name in installed)
+
+
+# Extract one page with the given backend
+def extract(url, html, backend="auto"):
+    return BACKENDS[resolve_backend(backend)](url, html)
+
+
+# Process pool so parsing is not serialised behind the GIL
+def make_parse_pool(workers=None):
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def _extract_pair(args):
+    url, html, backend = args
+    return extract(url, html, backend)
+
+
+# Extract many (url, html) pages in parallel, keeping the input order
+def extract_many(pages, backend="auto", workers=None, chunksize=8):
+    backend = resolve_backend(backend)
+    with make_parse_pool(workers) as pool:
+        return list(pool.map(_extract_pair, ((url, html, backend) for url, html in pages),
+                             chunksize=chunksize))
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfTransformer, TfidfVectorizer
+from record_store import temp_path, write_json_atomic
+
+# Per-document term counts cached as memory-mapped CSR shards, keyed by a hash of the text
+
+FEATURE_DIR = "data/features"
+COMPACT_RATIO = 0.5     # Rewrite the cache once less than half of its rows are still used
+
+
+def text_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+# Cached counts are only valid for the analyzer that produced them
+def analyzer_signature(vectorizer):
+    params = {key: repr(value) for key, value in sorted(vectorizer.get_params().items())
+              if key in ("analyzer", "lowercase", "ngram_range", "preprocessor", "stop_words",
+                         "strip_accents", "token_pattern", "tokenizer")}
+    return hashlib.sha256(json.dumps(params).encode("utf-8")).hexdigest()[:16]
+
+
+class FeatureStore:
+    """
+    Each shard holds the raw term counts of a batch of documents as the three
+    CSR arrays (plus the document hashes), saved as .npy and memory-mapped on
+    load. Columns are ids in an append-only vocabulary shared by all shards,
+    so shards written in different runs stack without remapping.
+    """
+
+    def __init__(self, feature_dir=FEATURE_DIR, vectorizer=None):
+        self.feature_dir = feature_dir
+        self.vectorizer = vectorizer or TfidfVectorizer()
+        self.analyze = self.vectorizer.build_analyzer()
+        self.manifest_path = os.path.join(feature_dir, "manifest.json")
+        self.vocabulary_path = os.path.join(feature_dir, "vocabulary.txt")
+
+        manifest = self.load_manifest()
+        if manifest.get("analyzer") != analyzer_signature(self.vectorizer):
+            # Different tokenization settings: nothing cached is reusable
+            if os.path.exists(feature_dir):
+                shutil.rmtree(feature_dir)
+            manifest = {}
+        os.makedirs(os.path.join(feature_dir, "shards"), exist_ok=True)
+        self.manifest = {"analyzer": analyzer_signature(self.vectorizer), "shards": [], "next_shard": 1,
+                         "tokenized_documents": 0, "tokenize_seconds": 0.0}
+        self.manifest.update(manifest)
+
+        self.terms = []
+        if os.path.exists(self.vocabulary_path):
+            with open(self.vocabulary_path, "r", encoding="utf-8") as f:
+                self.terms = f.read().split("\n")[:self.manifest.get("terms", 0)]
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.load_shards()
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
+
+    def save_manifest(self):
+        self.manifest["terms"] = len(self.terms)
+        write_json_atomic(self.manifest_path, self.manifest)
+
+    def shard_path(self, name):
+        return os.path.join(self.feature_dir, "shards", name)
+
+    # Memory-map every shard and index the document hashes for searchsorted lookups
+    def load_shards(self):
+        self.shards = []
+        hashes, shard_numbers, rows = [], [], []
+        for number, name in enumerate(self.manifest["shards"]):
+            path = self.shard_path(name)
+            arrays = {key: np.load(os.path.join(path, f"{key}.npy"), mmap_mode="r")
+                      for key in ("indptr", "indices", "data", "hashes")}
+            self.shards.append(arrays)
+            hashes.append(np.asarray(arrays["hashes"]))
+            shard_numbers.append(np.full(len(arrays["hashes"]), number, dtype=np.int32))
+            rows.append(np.arange(len(arrays["hashes"]), dtype=np.int64))
+        self.hashes = np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64)
+        self.shard_numbers = np.concatenate(shard_numbers) if shard_numbers else np.zeros(0, dtype=np.int32)
+        self.rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        order = np.argsort(self.hashes, kind="stable")
+        self.hashes, self.shard_numbers, self.rows = self.hashes[order], self.shard_numbers[order], self.rows[order]
+
+    # Position of each hash in the cache, -1 when it is not cached
+    def lookup(self, hashes):
+        if not len(self.hashes):
+            return np.full(len(hashes), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        return np.where(self.hashes[positions] == hashes, positions, -1)
+
+    # Tokenize documents and store their counts as a new shard; returns the tokenizing time
+    def add_documents(self, texts, hashes):
+        start = time.perf_counter()
+        indptr = [0]
+        indices, data = [], []
+        for text in texts:
+            counts = {}
+            for token in self.analyze(text):
+                term_id = self.term_ids.get(token)
+                if term_id is None:
+                    term_id = self.term_ids[token] = len(self.terms)
+                    self.terms.append(token)
+                counts[term_id] = counts.get(term_id, 0) + 1
+            indices.extend(counts)
+            data.extend(counts.values())
+            indptr.append(len(indices))
+        seconds = time.perf_counter() - start
+        self.manifest["tokenized_documents"] += len(texts)
+        self.manifest["tokenize_seconds"] += seconds
+
+        # Term ids only ever grow, so the ids of older shards stay valid
+        tmp_path = temp_path(self.vocabulary_path)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.terms))
+        os.replace(tmp_path, self.vocabulary_path)
+
+        name = f"shard_{self.manifest['next_shard']:06d}"
+        self.write_shard(name, np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int32),
+                         np.asarray(data, dtype=np.int32), np.asarray(hashes, dtype=np.uint64))
+        self.manifest["next_shard"] += 1
+        self.manifest["shards"].append(name)
+        self.save_manifest()
+        self.load_shards()
+        return seconds
+
+    def write_shard(self, name, indptr, indices, data, hashes):
+        tmp_dir = self.shard_path(f".{name}.tmp")
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        for key, values in (("indptr", indptr), ("indices", indices), ("data", data), ("hashes", hashes)):
+            np.save(os.path.join(tmp_dir, f"{key}.npy"), values)
+        path = self.shard_path(name)
+        if os.path.exists(path):
+            # Left by a run that crashed before saving the manifest; next_shard never hands a name out twice otherwise
+            shutil.rmtree(path)
+        os.replace(tmp_dir, path)
+
+    # Rows of the cache as one CSR matrix over the whole vocabulary, in the order asked for
+    def gather(self, positions):
+        shard_numbers = self.shard_numbers[positions]
+        rows = self.rows[positions]
+        blocks, order = [], []
+        for number in np.unique(shard_numbers).tolist():
+            arrays = self.shards[number]
+            shard = sp.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]),
+                                  shape=(len(arrays["hashes"]), len(self.terms)))
+            selected = np.flatnonzero(shard_numbers == number)
+            blocks.append(shard[rows[selected]])
+            order.append(selected)
+        if not blocks:
+            return sp.csr_matrix((0, len(self.terms)), dtype=np.int64)
+        matrix = sp.vstack(blocks, format="csr")
+        # vstack put the rows in shard order; put them back in document order
+        inverse = np.empty(len(positions), dtype=np.int64)
+        inverse[np.concatenate(order)] = np.arange(len(positions))
+        return matrix[inverse]
+
+    # Average tokenizing cost over everything this cache has tokenized
+    def seconds_per_document(self):
+        documents = self.manifest["tokenized_documents"]
+        return self.manifest["tokenize_seconds"] / documents if documents else 0.0
+
+    # Term-count matrix of the documents, tokenizing only the ones not cached yet
+    def count_matrix(self, texts):
+        start = time.perf_counter()
+        hashes = np.array([text_hash(text) for text in texts], dtype=np.uint64)
+        self.last_hashes = hashes
+        positions = self.lookup(hashes)
+
+        missing = np.flatnonzero(positions < 0)
+        # Repeated texts in one batch are tokenized once
+        _, first = np.unique(hashes[missing], return_index=True)
+        new = missing[np.sort(first)]
+        tokenize_seconds = 0.0
+        if len(new):
+            tokenize_seconds = self.add_documents([texts[i] for i in new.tolist()], hashes[new])
+            positions = self.lookup(hashes)
+
+        matrix = self.gather(positions)
+        hits = len(texts) - len(missing)
+        self.last_stats = {
+            "documents": len(texts),
+            "hits": hits,
+            "tokenized": len(new),
+            "tokenize_seconds": tokenize_seconds,
+            "saved_seconds": hits * self.seconds_per_document(),
+            "seconds": time.perf_counter() - start
+        }
+        return matrix
+
+    # Same result as TfidfVectorizer().fit_transform(texts), built from the cached counts
+    def fit_tfidf(self, texts):
+        """
+        Returns (tf-idf matrix, fitted TfidfVectorizer). The vocabulary is
+        restricted to the terms of `texts` and sorted like scikit-learn does,
+        and the idf is computed from these documents only, so the vectorizer
+        can be saved and used by phase6_predictor exactly as before.
+        """
+        counts = self.count_matrix(texts)
+        used = np.unique(counts.indices)
+        terms = [self.terms[i] for i in used.tolist()]
+        order = sorted(range(len(terms)), key=terms.__getitem__)
+        columns = used[order]
+        counts = counts[:, columns]
+
+        vectorizer = TfidfVectorizer(**self.vectorizer.get_params())
+        vectorizer.vocabulary_ = {terms[i]: rank for rank, i in enumerate(order)}
+        transformer = TfidfTransformer(norm=vectorizer.norm, use_idf=vectorizer.use_idf,
+                                       smooth_idf=vectorizer.smooth_idf, sublinear_tf=vectorizer.sublinear_tf)
+        features = transformer.fit_transform(counts.astype(vectorizer.dtype))
+        vectorizer.idf_ = transformer.idf_
+
+        self.compact_if_stale()
+        return features, vectorizer
+
+    # Rewrite the cache into one shard once most of its rows belong to documents no longer used
+    def compact_if_stale(self):
+        used = np.unique(self.last_hashes)
+        if len(self.hashes) and len(used) < COMPACT_RATIO * len(self.hashes):
+            self.compact(used)
+
+    def compact(self, keep_hashes=None):
+        keep = self.hashes if keep_hashes is None else np.unique(np.asarray(keep_hashes, dtype=np.uint64))
+        positions = self.lookup(keep)
+        positions = positions[positions >= 0]
+        matrix = self.gather(positions)
+        name = f"shard_{self.manifest['next_shard']:06d}"
+        self.write_shard(name, matrix.indptr.astype(np.int64), matrix.indices.astype(np.int32),
+                         matrix.data.astype(np.int32), self.hashes[positions])
+        old = self.manifest["shards"]
+        self.manifest["next_shard"] += 1
+        self.manifest["shards"] = [name]
+        self.save_manifest()
+        for shard in old:
+            shutil.rmtree(self.shard_path(shard))
+        self.load_shards()
+
+    def size_bytes(self):
+        total = 0
+        for root, _, files in os.walk(self.feature_dir):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        return total
+
+    def report(self):
+        stats = self.last_stats
+        print(f"♻️ Feature cache: {stats['hits']}/{stats['documents']} documents cached, "
+              f"{stats['tokenized']} tokenized in {stats['tokenize_seconds']:.2f}s, "
+              f"~{stats['saved_seconds']:.2f}s of tokenizing saved, cache size {self.size_bytes() / 1e6:.1f} MB")
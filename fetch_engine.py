@@ -0,0 +1,315 @@
+import re
+import codecs
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+
+# Default limits for the concurrent fetch mode
+DEFAULT_CONCURRENCY = 16        # Pages in flight across all hosts
+DEFAULT_PER_HOST = 2            # Pages in flight against one host
+DEFAULT_HOST_DELAY = 1.0        # Minimum seconds between two requests to one host
+DEFAULT_TIMEOUT = (5, 20)       # (connect, read) timeout in seconds
+DEFAULT_RETRIES = 3             # Extra attempts after the first one
+DEFAULT_BACKOFF = 1.0           # Base of the exponential backoff, in seconds
+
+# Status codes that are worth retrying; anything else is a hard failure
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Body limits: bigger pages are cut off, other content types are never downloaded
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+CHUNK_SIZE = 64 * 1024
+SNIFF_BYTES = 4096              # A <meta charset> must appear this early to be honoured
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9._:-]+)""", re.IGNORECASE)
+BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+
+
+# Raised instead of downloading a page the limits rule out
+class PageSkipped(Exception):
+    def __init__(self, url, reason):
+        super().__init__(reason)
+        self.url = url
+        self.reason = reason
+
+
+# Thread-safe list of the pages that were skipped, truncated or failed, with the reason
+class FetchLog:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = []
+
+    def add(self, url, outcome, reason):
+        with self.lock:
+            self.entries.append({"url": url, "outcome": outcome, "reason": reason})
+
+    # url -> (outcome, reason) for the pages that produced no record
+    def failures(self):
+        with self.lock:
+            return {entry["url"]: (entry["outcome"], entry["reason"])
+                    for entry in self.entries if entry["outcome"] != "truncated"}
+
+    def counts(self):
+        counts = {}
+        with self.lock:
+            for entry in self.entries:
+                counts[entry["outcome"]] = counts.get(entry["outcome"], 0) + 1
+        return counts
+
+    def report(self, label="Fetch"):
+        counts = self.counts()
+        if counts:
+            summary = ", ".join(f"{count} {outcome}" for outcome, count in sorted(counts.items()))
+            print(f"⚠️ {label}: {summary}")
+
+
+# Keeps us polite to one host: caps parallel requests and spaces them out
+class HostLimiter:
+    def __init__(self, per_host, delay):
+        self.semaphore = asyncio.Semaphore(per_host)
+        self.delay = delay
+        self.lock = asyncio.Lock()
+        self.next_slot = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        # Reserve the next free time slot for this host, then wait for it
+        async with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.delay
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.semaphore.release()
+
+
+# Build a session whose connection pool is large enough for the worker threads
+def make_session(pool_size=DEFAULT_CONCURRENCY):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Work out how long to wait before the next attempt
+def backoff_delay(attempt, backoff, response=None):
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return float(retry_after)
+    return backoff * (2 ** attempt) + random.uniform(0, backoff)
+
+
+# Blocking fetch with bounded retries; runs inside the worker threads
+def fetch_with_retries(session, url, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                       backoff=DEFAULT_BACKOFF, headers=None):
+    """
+    Fetch a page and return the response, retrying timeouts, connection
+    errors and retryable status codes. Raises the last error when all
+    attempts fail.
+    """
+    for attempt in range(retries + 1):
+        response = None
+        try:
+            # Only the headers are read here; the body is streamed by read_body
+            response = session.get(url, timeout=timeout, headers=headers, stream=True)
+            response.raise_for_status()
+            return response
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.HTTPError) as e:
+            if response is not None:
+                response.close()
+            retryable = response is None or response.status_code in RETRY_STATUSES
+            if not retryable or attempt == retries:
+                raise
+            wait = backoff_delay(attempt, backoff, response)
+            print(f"🔁 Retrying {url} in {wait:.1f}s ({e})")
+            time.sleep(wait)
+
+
+# Is the Content-Type header one we parse? A missing header gets the benefit of the doubt
+def allowed_content_type(response, content_types=DEFAULT_CONTENT_TYPES):
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    return not content_type or content_types is None or content_type in content_types
+
+
+# Read at most max_bytes of the body; returns (bytes, truncated)
+def read_body(response, max_bytes=DEFAULT_MAX_BYTES):
+    chunks = []
+    size = 0
+    truncated = False
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if size + len(chunk) > max_bytes:
+                chunks.append(chunk[:max_bytes - size])
+                truncated = True
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+    finally:
+        # Closing drops the rest of a truncated body instead of downloading it
+        response.close()
+    return b"".join(chunks), truncated
+
+
+# Character set of a body: byte order mark, then the header, then a <meta> tag in the first bytes
+def sniff_encoding(head, content_type=""):
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    candidates = []
+    match = re.search(r"charset\s*=\s*[\"']?([\w.:-]+)", content_type, re.IGNORECASE)
+    if match:
+        candidates.append(match.group(1))
+    match = META_CHARSET.search(head[:SNIFF_BYTES])
+    if match:
+        candidates.append(match.group(1).decode("ascii"))
+    for candidate in candidates:
+        try:
+            return codecs.lookup(candidate).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+
+def decode_body(raw, content_type=""):
+    encoding = sniff_encoding(raw[:SNIFF_BYTES], content_type)
+    return raw.decode(encoding, errors="replace")
+
+
+# Fetch one page (conditionally, when a cache is given) and run `handle(url, html)` on it
+def fetch_page(session, url, handle, cache=None, timeout=DEFAULT_TIMEOUT,
+               retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, max_bytes=DEFAULT_MAX_BYTES,
+               content_types=DEFAULT_CONTENT_TYPES, log=None, record_key=None, conditional=True):
+    """
+    With an `http_cache.HttpCache`, a 304 answer returns the record stored
+    from the previous run without parsing the page again, as long as it was
+    made with the same `record_key` (e.g. the parser backend); otherwise the
+    cached body is parsed; when the cache no longer holds the page, it is
+    fetched again without conditional headers. The body is
+    streamed: a disallowed Content-Type raises PageSkipped before it is
+    read, and only the first `max_bytes` are kept (noted in `log`).
+    """
+    host = urlsplit(url).netloc.lower()
+    headers = cache.conditional_headers(url) if cache is not None and conditional else None
+    try:
+        # Latency per host covers the retries and reading the body
+        with metrics.span("fetch_seconds", host=host):
+            response = fetch_with_retries(session, url, timeout, retries, backoff, headers)
+            if headers and response.status_code == 304:
+                response.close()
+                outcome = "not_modified"
+            elif not allowed_content_type(response, content_types):
+                response.close()
+                raise PageSkipped(url, f"content type {response.headers.get('Content-Type')}")
+            else:
+                raw, truncated = read_body(response, max_bytes)
+                outcome = "truncated" if truncated else "ok"
+    except PageSkipped:
+        metrics.inc("pages_total", outcome="skipped")
+        raise
+    except requests.exceptions.RequestException:
+        metrics.inc("pages_total", outcome="failed")
+        raise
+    metrics.inc("pages_total", outcome=outcome)
+
+    if outcome == "not_modified":
+        record, body = cache.revalidated(url, record_key)
+        if record is not None:
+            return record
+        if body is None:
+            return fetch_page(session, url, handle, cache, timeout, retries, backoff, max_bytes,
+                              content_types, log, record_key, conditional=False)
+        with metrics.span("parse_seconds"):
+            result = handle(url, body)
+        if result is not None:
+            cache.store_record(url, result, record_key)
+        return result
+    metrics.inc("bytes_downloaded_total", len(raw), host=host)
+    if truncated and log is not None:
+        log.add(url, "truncated", f"body over {max_bytes} bytes")
+    body = decode_body(raw, response.headers.get("Content-Type", ""))
+
+    with metrics.span("parse_seconds"):
+        result = handle(url, body)
+    if cache is not None and result is not None:
+        cache.store(url, response, result, body, len(raw), record_key)
+    return result
+
+
+# Fetch every URL concurrently and hand each page to `handle(url, html)`
+async def fetch_all(urls, handle, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST,
+                    host_delay=DEFAULT_HOST_DELAY, timeout=DEFAULT_TIMEOUT,
+                    retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, session=None, cache=None,
+                    max_bytes=DEFAULT_MAX_BYTES, content_types=DEFAULT_CONTENT_TYPES, log=None,
+                    record_key=None):
+    """
+    Fetch `urls` with a global concurrency cap and a per-host limiter.
+    Returns the handler results in the same order as `urls`; pages that
+    could not be fetched come back as None. A caller-supplied `session`
+    is reused (and left open) so connections stay alive across calls.
+    Skipped, truncated and failed pages are noted in `log`, if given; any
+    other error from one page is logged as a failure of that page alone.
+    """
+    loop = asyncio.get_running_loop()
+    global_limit = asyncio.Semaphore(concurrency)
+    hosts = {}
+    own_session = session is None
+    if own_session:
+        session = make_session(concurrency)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        async def fetch_one(url):
+            host = urlsplit(url).netloc.lower()
+            limiter = hosts.setdefault(host, HostLimiter(per_host, host_delay))
+            async with limiter, global_limit:
+                print(f"➡️  Scraping: {url}")
+                try:
+                    return await loop.run_in_executor(
+                        executor, fetch_page, session, url, handle, cache, timeout, retries, backoff,
+                        max_bytes, content_types, log, record_key)
+                except PageSkipped as e:
+                    print(f"⏭️ Skipped {url}: {e.reason}")
+                    if log is not None:
+                        log.add(url, "skipped", e.reason)
+                    return None
+                except requests.exceptions.RequestException as e:
+                    print(f"❌ Failed to scrape {url}: {e}")
+                    if log is not None:
+                        log.add(url, "failed", str(e))
+                    return None
+                except Exception as e:
+                    # e.g. a cache or archive write that failed; one page must not abort the category
+                    print(f"❌ Error scraping {url}: {e}")
+                    if log is not None:
+                        log.add(url, "failed", str(e))
+                    return None
+
+        try:
+            return await asyncio.gather(*(fetch_one(url) for url in urls))
+        finally:
+            if own_session:
+                session.close()
+
+
+# Synchronous entry point used by phase2_scraper
+def fetch_pages(urls, handle, **limits):
+    """
+    Run `fetch_all` to completion and log the throughput of the run.
+    """
+    start = time.perf_counter()
+    results = asyncio.run(fetch_all(urls, handle, **limits))
+    elapsed = time.perf_counter() - start
+    fetched = sum(1 for result in results if result is not None)
+    rate = fetched / elapsed if elapsed > 0 else 0.0
+    print(f"📊 Fetched {fetched}/{len(urls)} pages in {elapsed:.1f}s ({rate:.2f} pages/sec)")
+    return results
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, one scraper process at a time
+    fcntl = None
+
+# Default location and size cap of the on-disk response cache
+CACHE_DIR = "data/http_cache"
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+
+# Content-addressed HTTP cache with ETag/Last-Modified revalidation and LRU eviction
+class HttpCache:
+    """
+    Response bodies are stored once per SHA-256 of their content under
+    `bodies/`, and the record extracted from a page under `records/`, so a
+    304 can skip parsing entirely. `index.json` only maps each URL to its
+    validators, body hash and record file. A record is tagged with the
+    `record_key` it was made with (e.g. the parser backend) and only reused
+    for the same key. Bodies and records both count towards `max_bytes`.
+    Several processes can share one cache: `save` merges the entries this
+    process changed into the index on disk under a file lock.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, "bodies"), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, "records"), exist_ok=True)
+
+        self.entries = self.read_index()
+        self.changed = {}   # url -> entry (or None when dropped) since the last save
+        self.reset_stats()
+
+    def read_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path, "r") as f:
+            entries = json.load(f)
+        for entry in entries.values():
+            # Older caches kept the whole record in the index; those pages are parsed again once
+            if isinstance(entry.get("record"), dict):
+                del entry["record"]
+        return entries
+
+    def reset_stats(self):
+        self.stats = {"requests": 0, "hits": 0, "bytes_saved": 0, "bytes_downloaded": 0}
+
+    def body_path(self, digest):
+        return os.path.join(self.cache_dir, "bodies", digest[:2], digest)
+
+    def record_path(self, name):
+        return os.path.join(self.cache_dir, "records", name[:2], f"{name}.json")
+
+    def write_file(self, path, raw):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(raw)
+        os.replace(tmp_path, path)
+
+    # Headers that turn the next request for `url` into a conditional GET
+    def conditional_headers(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+        if not entry or not os.path.exists(self.body_path(entry["body"])):
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    # Called on a 304: returns (cached record, cached body text); the record is None
+    # when the page was parsed with another `record_key` last time. Both are None when
+    # the entry or its body went away since the conditional headers were sent (eviction,
+    # or another process merging the index), and the page has to be fetched in full
+    def revalidated(self, url, record_key=None):
+        with self.lock:
+            entry = self.entries.get(url)
+        if entry is None:
+            return None, None
+        try:
+            with open(self.body_path(entry["body"]), "r", encoding="utf-8") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None, None
+        with self.lock:
+            entry["last_used"] = time.time()
+            self.changed[url] = entry
+            self.stats["requests"] += 1
+            self.stats["hits"] += 1
+            self.stats["bytes_saved"] += entry["size"]
+        record = None
+        if entry.get("record") and entry.get("record_key") == record_key:
+            try:
+                with open(self.record_path(entry["record"]), "r", encoding="utf-8") as f:
+                    record = json.load(f)
+            except FileNotFoundError:
+                pass
+        return record, body
+
+    # Keep the record parsed from the cached body of `url`, for 304s with the same `record_key`
+    def store_record(self, url, record, record_key=None):
+        name = hashlib.sha256(f"{record_key}\n{url}".encode("utf-8")).hexdigest()
+        raw = json.dumps(record).encode("utf-8")
+        self.write_file(self.record_path(name), raw)
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return
+            entry.update({"record": name, "record_key": record_key, "record_size": len(raw)})
+            self.changed[url] = entry
+
+    # Remember a fresh 200 response (its headers and decoded body) together with the record parsed from it
+    def store(self, url, response, record, body, downloaded, record_key=None):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes_downloaded"] += downloaded
+
+        # Without validators we could never revalidate, so keep nothing
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            with self.lock:
+                if self.entries.pop(url, None) is not None:
+                    self.changed[url] = None
+            return
+
+        raw = body.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self.body_path(digest)
+        if not os.path.exists(path):
+            self.write_file(path, raw)
+
+        with self.lock:
+            self.entries[url] = self.changed[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "body": digest,
+                "size": len(raw),
+                "last_used": time.time()
+            }
+        self.store_record(url, record, record_key)
+
+    # Drop orphaned bodies and records, then the least recently used entries until the cache fits the cap
+    def evict(self):
+        with self.lock:
+            refs = {}
+            sizes = {}
+            records = set()
+            for entry in self.entries.values():
+                refs[entry["body"]] = refs.get(entry["body"], 0) + 1
+                sizes[entry["body"]] = entry["size"]
+                if entry.get("record"):
+                    records.add(f"{entry['record']}.json")
+
+            # Bodies left behind when a page changed content, records of another parser
+            for kind, known in (("bodies", refs), ("records", records)):
+                for root, _, files in os.walk(os.path.join(self.cache_dir, kind)):
+                    for name in files:
+                        if name not in known:
+                            os.remove(os.path.join(root, name))
+
+            total = sum(sizes.values()) + sum(entry.get("record_size", 0) for entry in self.entries.values())
+            by_age = sorted(self.entries.items(), key=lambda item: item[1]["last_used"])
+            for url, entry in by_age:
+                if total <= self.max_bytes:
+                    break
+                del self.entries[url]
+                if entry.get("record"):
+                    total -= entry.get("record_size", 0)
+                    if os.path.exists(self.record_path(entry["record"])):
+                        os.remove(self.record_path(entry["record"]))
+                digest = entry["body"]
+                refs[digest] -= 1
+                # Bodies are shared between URLs, so only delete the last reference
+                if refs[digest] == 0:
+                    total -= sizes[digest]
+                    if os.path.exists(self.body_path(digest)):
+                        os.remove(self.body_path(digest))
+
+    # Merge our changes into the index on disk, evict, and persist it atomically
+    def save(self, evict=True):
+        """
+        Pass `evict=False` while other processes may still be storing bodies:
+        eviction deletes bodies the index does not know about yet.
+        """
+        with open(f"{self.index_path}.lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with self.lock:
+                entries = self.read_index()
+                for url, entry in self.changed.items():
+                    if entry is None:
+                        entries.pop(url, None)
+                    else:
+                        entries[url] = entry
+                self.entries = entries
+                self.changed = {}
+            if evict:
+                self.evict()
+            with self.lock:
+                tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(self.entries, f)
+                os.replace(tmp_path, self.index_path)
+
+    def report(self):
+        requests_made = self.stats["requests"]
+        hit_rate = self.stats["hits"] / requests_made * 100 if requests_made else 0.0
+        saved_kb = self.stats["bytes_saved"] / 1024
+        downloaded_kb = self.stats["bytes_downloaded"] / 1024
+        print(f"💾 HTTP cache: {self.stats['hits']}/{requests_made} hits ({hit_rate:.1f}%), "
+              f"{saved_kb:.1f} KB saved, {downloaded_kb:.1f} KB downloaded")
@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from functools import partial
+import numpy as np
+import scipy.sparse as sp
+from record_store import current_record_file, iter_parquet_records, iter_records, temp_path, write_json_atomic
+from url_frontier import canonicalize
+from category_pool import add_category_arguments, load_categories, run_per_category
+
+# Out-link graph of the scraped pages as CSR arrays on disk, with PageRank and in-degree
+
+GRAPH_DIR = "data/graph"
+PROCESSED_BASE = "data/processed/{}_processed_current"
+DAMPING = 0.85
+TOLERANCE = 1e-6            # Stop once the L1 change of the ranks drops below this
+MAX_ITERATIONS = 100
+
+
+def url_hash(url):
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def pending_dir(graph_dir):
+    return os.path.join(graph_dir, "pending")
+
+
+def state_path(graph_dir):
+    return os.path.join(graph_dir, "state.json")
+
+
+def urls_path(graph_dir):
+    return os.path.join(graph_dir, "urls.txt")
+
+
+def load_state(graph_dir=GRAPH_DIR):
+    path = state_path(graph_dir)
+    if not os.path.exists(path):
+        return {"version": None, "next_version": 1, "nodes": 0, "edges": 0, "urls_bytes": 0}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+# Writing snapshots -------------------------------------------------------------
+
+# Save the out-links of a batch of scraped pages as a pending segment; returns the number of edges
+def add_snapshot(records, name, graph_dir=GRAPH_DIR):
+    """
+    Cheap enough to call from every refine worker: URLs are only canonicalised
+    and hashed here, ids are assigned when update_graph() merges the pending
+    segments. Every page in `records` replaces the out-links it had before,
+    so a page that lost all its links also loses its edges. Malformed URLs
+    (bad ports, broken IPv6 literals) are skipped: a page with one is left
+    out, a link with one is dropped.
+    """
+    sources, src, dst = [], [], []
+    urls = {}
+    for record in records:
+        page = canonicalize(record["url"])
+        if page is None:
+            continue
+        page_hash = url_hash(page)
+        urls[page_hash] = page
+        sources.append(page_hash)
+        for link in record.get("links") or ():
+            target = canonicalize(link)
+            if target is None or target == page:
+                continue
+            target_hash = url_hash(target)
+            urls.setdefault(target_hash, target)
+            src.append(page_hash)
+            dst.append(target_hash)
+    if not sources:
+        return 0
+
+    os.makedirs(pending_dir(graph_dir), exist_ok=True)
+    # Named by time first, so segments are merged in the order the snapshots arrived
+    base = os.path.join(pending_dir(graph_dir), f"{time.time_ns():020d}_{os.getpid()}_{name.replace(' ', '_')}")
+    with open(temp_path(base + ".urls"), "w", encoding="utf-8") as f:
+        f.write("\n".join(urls.values()))
+    os.replace(temp_path(base + ".urls"), base + ".urls")
+    # The .npz is written last: a segment without one is unfinished and ignored
+    with open(temp_path(base + ".npz"), "wb") as f:
+        np.savez(f, sources=np.asarray(sources, dtype=np.uint64), src=np.asarray(src, dtype=np.uint64),
+                 dst=np.asarray(dst, dtype=np.uint64), url_hashes=np.fromiter(urls, dtype=np.uint64, count=len(urls)))
+    os.replace(temp_path(base + ".npz"), base + ".npz")
+    return len(src)
+
+
+# Every record of a category's current processed dataset, reading only the columns we need
+def iter_category_links(category):
+    path = current_record_file(PROCESSED_BASE.format(category.replace(" ", "_")))
+    if path is None:
+        return
+    if path.endswith(".parquet"):
+        yield from iter_parquet_records(path, columns=["url", "links"])
+    else:
+        yield from iter_records(path)
+
+
+def extract_category(category, graph_dir=GRAPH_DIR):
+    return add_snapshot(iter_category_links(category), category, graph_dir)
+
+
+# Merging -----------------------------------------------------------------------
+
+def version_dir(graph_dir, version):
+    return os.path.join(graph_dir, f"v{version:06d}")
+
+
+# Memory-map the arrays of the current graph; None before the first update
+def load_graph(graph_dir=GRAPH_DIR, mmap_mode="r"):
+    state = load_state(graph_dir)
+    if state["version"] is None:
+        return None
+    path = version_dir(graph_dir, state["version"])
+    return {key: np.load(os.path.join(path, f"{key}.npy"), mmap_mode=mmap_mode)
+            for key in ("indptr", "indices", "node_hashes", "pagerank", "in_degree")}
+
+
+# Position of each hash in `sorted_hashes` (via `order`), -1 when it is not there
+def lookup(sorted_hashes, order, hashes):
+    if not len(sorted_hashes):
+        return np.full(len(hashes), -1, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(sorted_hashes, hashes), len(sorted_hashes) - 1)
+    return np.where(sorted_hashes[positions] == hashes, order[positions], -1)
+
+
+def load_pending(graph_dir):
+    names = sorted(name[:-len(".npz")] for name in os.listdir(pending_dir(graph_dir)) if name.endswith(".npz")) \
+        if os.path.isdir(pending_dir(graph_dir)) else []
+    segments = []
+    for name in names:
+        base = os.path.join(pending_dir(graph_dir), name)
+        with np.load(base + ".npz") as arrays:
+            segment = {key: arrays[key] for key in ("sources", "src", "dst", "url_hashes")}
+        with open(base + ".urls", "r", encoding="utf-8") as f:
+            segment["urls"] = f.read().split("\n")
+        segment["base"] = base
+        segments.append(segment)
+    return segments
+
+
+# Merge the pending segments into a new version of the graph and rank it
+def update_graph(graph_dir=GRAPH_DIR):
+    """
+    Node ids are assigned in order of first appearance and never change, so
+    urls.txt is only ever appended to. Edges are deduplicated and kept sorted
+    by (source, target) as CSR arrays: indptr (int64, one entry per node + 1)
+    and indices (int32). A page in a newer segment drops all of its older
+    out-links first. Returns the number of pending segments merged.
+    """
+    start = time.perf_counter()
+    segments = load_pending(graph_dir)
+    if not segments:
+        print("✅ No new link snapshots")
+        return 0
+    state = load_state(graph_dir)
+    graph = load_graph(graph_dir, mmap_mode=None)
+    node_hashes = graph["node_hashes"] if graph else np.zeros(0, dtype=np.uint64)
+
+    # Newest segment of every page: only its out-links survive
+    numbers = np.concatenate([np.full(len(s["sources"]), i, dtype=np.int64) for i, s in enumerate(segments)])
+    sources = np.concatenate([s["sources"] for s in segments])
+    order = np.lexsort((numbers, sources))
+    sources, numbers = sources[order], numbers[order]
+    last = np.append(sources[1:] != sources[:-1], True)
+    sources, latest = sources[last], numbers[last]
+    src = np.concatenate([s["src"] for s in segments])
+    dst = np.concatenate([s["dst"] for s in segments])
+    edge_numbers = np.concatenate([np.full(len(s["src"]), i, dtype=np.int64) for i, s in enumerate(segments)])
+    keep = latest[np.searchsorted(sources, src)] == edge_numbers
+    src, dst = src[keep], dst[keep]
+
+    # Intern hashes the graph has not seen, with their URLs, in order of appearance
+    seen = np.concatenate([s["url_hashes"] for s in segments])
+    seen_urls = [url for s in segments for url in s["urls"]]
+    node_order = np.argsort(node_hashes, kind="stable")
+    unknown = lookup(node_hashes[node_order], node_order, seen) < 0
+    _, first = np.unique(seen, return_index=True)
+    first = np.sort(first[unknown[first]])
+    with open(urls_path(graph_dir), "r+b" if os.path.exists(urls_path(graph_dir)) else "wb") as f:
+        # Anything past the recorded size was left by an update that did not finish
+        f.truncate(state["urls_bytes"])
+        f.seek(state["urls_bytes"])
+        f.write("".join(seen_urls[i] + "\n" for i in first).encode("utf-8"))
+        urls_bytes = f.tell()
+    node_hashes = np.concatenate([node_hashes, seen[first]])
+    n = len(node_hashes)
+    node_order = np.argsort(node_hashes, kind="stable")
+    sorted_hashes = node_hashes[node_order]
+
+    # Old edges of pages that were not re-scraped, plus the new ones
+    if graph is not None:
+        old_src = np.repeat(np.arange(len(graph["indptr"]) - 1, dtype=np.int64), np.diff(graph["indptr"]))
+        replaced = np.zeros(n, dtype=bool)
+        replaced[lookup(sorted_hashes, node_order, sources)] = True
+        old_keep = ~replaced[old_src]
+        old_keys = (old_src[old_keep] << 32) | graph["indices"][old_keep].astype(np.int64)
+    else:
+        old_keys = np.zeros(0, dtype=np.int64)
+    new_keys = (lookup(sorted_hashes, node_order, src) << 32) | lookup(sorted_hashes, node_order, dst)
+    keys = np.unique(np.concatenate([old_keys, new_keys]))
+    edge_src = (keys >> 32).astype(np.int64)
+    indices = (keys & 0xFFFFFFFF).astype(np.int32)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edge_src, minlength=n), out=indptr[1:])
+
+    ranks, iterations = pagerank(indptr, indices)
+    arrays = {"indptr": indptr, "indices": indices, "node_hashes": node_hashes, "pagerank": ranks,
+              "in_degree": np.bincount(indices, minlength=n).astype(np.int32)}
+    version = state["next_version"]
+    tmp_dir = version_dir(graph_dir, version) + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    for key, values in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{key}.npy"), values)
+    path = version_dir(graph_dir, version)
+    if os.path.exists(path):
+        # Left by a run that crashed before saving state.json; next_version is never reused otherwise
+        shutil.rmtree(path)
+    os.replace(tmp_dir, path)
+
+    previous = state["version"]
+    state.update(version=version, next_version=version + 1, nodes=n, edges=len(indices), urls_bytes=urls_bytes)
+    write_json_atomic(state_path(graph_dir), state)
+    if previous is not None:
+        shutil.rmtree(version_dir(graph_dir, previous), ignore_errors=True)
+    for segment in segments:
+        os.remove(segment["base"] + ".npz")
+        os.remove(segment["base"] + ".urls")
+
+    print(f"🧭 Link graph: merged {len(segments)} snapshots into {n} pages and {len(indices)} links "
+          f"(PageRank converged in {iterations} iterations, {time.perf_counter() - start:.1f}s)")
+    return len(segments)
+
+
+# Ranking -----------------------------------------------------------------------
+
+# Power iteration over the CSR graph; pages without out-links spread their rank evenly
+def pagerank(indptr, indices, damping=DAMPING, tol=TOLERANCE, max_iterations=MAX_ITERATIONS):
+    """
+    Each iteration is one sparse matrix-vector product over the transposed
+    adjacency matrix (a CSC view of the CSR arrays, so nothing is copied).
+    Returns (ranks summing to 1, iterations run).
+    """
+    n = len(indptr) - 1
+    if n == 0:
+        return np.zeros(0), 0
+    out_degree = np.diff(indptr)
+    dangling = out_degree == 0
+    inverse_degree = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+    transposed = sp.csr_matrix((np.ones(len(indices), dtype=np.float64), indices, indptr), shape=(n, n)).T
+    ranks = np.full(n, 1.0 / n)
+    for iteration in range(1, max_iterations + 1):
+        new_ranks = damping * (transposed @ (ranks * inverse_degree))
+        new_ranks += (damping * ranks[dangling].sum() + 1.0 - damping) / n
+        change = np.abs(new_ranks - ranks).sum()
+        ranks = new_ranks
+        if change < tol:
+            break
+    return ranks, iteration
+
+
+# Scores of the given URLs as {url: (pagerank, in_degree)}; unknown URLs are left out
+def scores(urls, graph_dir=GRAPH_DIR):
+    graph = load_graph(graph_dir)
+    if graph is None or not urls:
+        return {}
+    node_hashes = np.asarray(graph["node_hashes"])
+    node_order = np.argsort(node_hashes, kind="stable")
+    ids = lookup(node_hashes[node_order], node_order,
+                 np.fromiter((url_hash(canonicalize(url) or "") for url in urls), dtype=np.uint64, count=len(urls)))
+    return {url: (float(graph["pagerank"][i]), int(graph["in_degree"][i])) for url, i in zip(urls, ids) if i >= 0}
+
+
+# Order a crawl list by PageRank, best first; URLs the graph does not know keep their order at the end
+def rank_urls(urls, graph_dir=GRAPH_DIR):
+    known = scores(urls, graph_dir)
+    if not known:
+        return list(urls)
+    return sorted(urls, key=lambda url: -known[url][0] if url in known else 0.0)
+
+
+# The highest ranked pages as (url, pagerank, in_degree)
+def top_pages(limit=20, graph_dir=GRAPH_DIR):
+    graph = load_graph(graph_dir)
+    if graph is None:
+        return []
+    ranks = np.asarray(graph["pagerank"])
+    best = np.argsort(-ranks, kind="stable")[:limit]
+    wanted = {int(i): None for i in best}
+    with open(urls_path(graph_dir), "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if i in wanted:
+                wanted[i] = line.rstrip("\n")
+    return [(wanted[int(i)], float(ranks[i]), int(graph["in_degree"][i])) for i in best]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Build the out-link graph of the scraped pages and rank them")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    extract_parser = commands.add_parser("extract", help="snapshot the links of every processed dataset, then update")
+    add_category_arguments(extract_parser)
+    commands.add_parser("update", help="merge pending snapshots and recompute PageRank")
+    top_parser = commands.add_parser("top", help="show the highest ranked pages")
+    top_parser.add_argument("--limit", type=int, default=20, help="pages to show")
+    arg_parser.add_argument("--graph-dir", default=GRAPH_DIR, help="where the graph is stored")
+    args = arg_parser.parse_args()
+
+    if args.command == "extract":
+        run_per_category(partial(extract_category, graph_dir=args.graph_dir), load_categories(args.categories_file),
+                         args.workers, unit="links")
+    if args.command in ("extract", "update"):
+        update_graph(args.graph_dir)
+    else:
+        for url, rank, in_degree in top_pages(args.limit, args.graph_dir):
+            print(f"{rank:.6f}  {in_degree:>6} in-links  {url}")
@@ -0,0 +1,301 @@
+import os
+import sys
+import json
+import time
+import runpy
+import atexit
+import pstats
+import cProfile
+import argparse
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from record_store import temp_path
+
+try:
+    import fcntl
+except ImportError:  # Windows: processes cannot flush at the same moment safely, run one at a time
+    fcntl = None
+
+# Counters, duration histograms and spans, written to JSONL and a Prometheus text file
+
+DEFAULT_METRICS_DIR = "data/metrics"
+METRICS_DIR_ENV = "PIPELINE_METRICS_DIR"    # Set (and inherited by worker processes) when metrics are on
+RUN_ID_ENV = "PIPELINE_METRICS_RUN"
+# Upper bounds in seconds of the histogram buckets; every histogram holds durations
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, float("inf"))
+PROFILE_LINES = 20          # Functions shown from a cProfile run
+MEMORY_LINES = 10           # Allocation sites shown from a tracemalloc run
+
+
+def series_key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+# In-process store; flush() hands its contents to the files and starts from zero
+class Registry:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.spans = []
+
+    def inc(self, name, value=1, **labels):
+        key = series_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = series_key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"count": 0, "sum": 0.0, "max": 0.0,
+                                                    "buckets": [0] * len(BUCKETS)}
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            histogram["max"] = max(histogram["max"], seconds)
+            histogram["buckets"][next(i for i, bound in enumerate(BUCKETS) if seconds <= bound)] += 1
+
+    # Everything collected since the last call, as JSONL-ready dicts
+    def drain(self):
+        with self.lock:
+            counters, histograms, spans = self.counters, self.histograms, self.spans
+            self.counters, self.histograms, self.spans = {}, {}, []
+        lines = [{"type": "counter", "name": name, "labels": dict(labels), "value": value}
+                 for (name, labels), value in counters.items()]
+        lines += [dict(histogram, type="histogram", name=name, labels=dict(labels))
+                  for (name, labels), histogram in histograms.items()]
+        return lines + spans
+
+
+registry = Registry()
+# A forked worker starts empty instead of re-reporting what its parent collected
+os.register_at_fork(after_in_child=registry.reset)
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    registry.observe(name, seconds, **labels)
+
+
+# Time a block into the `name` histogram; with trace=True the span is also written as an event
+@contextmanager
+def span(name, trace=False, **labels):
+    start = time.perf_counter()
+    started = time.time()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe(name, seconds, **labels)
+        if trace:
+            with registry.lock:
+                registry.spans.append({"type": "span", "name": name, "labels": {k: str(v) for k, v in labels.items()},
+                                       "start": started, "seconds": seconds})
+
+
+def metrics_dir():
+    return os.environ.get(METRICS_DIR_ENV)
+
+
+# Turn file output on for this process and every worker it starts
+def enable(directory=DEFAULT_METRICS_DIR):
+    os.environ[METRICS_DIR_ENV] = directory
+    start_run()
+    atexit.register(flush, prometheus=True)
+
+
+# Lines written from now on belong to a new run (e.g. the next scheduled pipeline run)
+def start_run():
+    os.environ[RUN_ID_ENV] = time.strftime("%Y%m%d_%H%M%S") + f"_{os.getpid()}"
+    return os.environ[RUN_ID_ENV]
+
+
+def jsonl_path(directory):
+    return os.path.join(directory, "metrics.jsonl")
+
+
+def prometheus_path(directory):
+    return os.path.join(directory, "metrics.prom")
+
+
+# Append what this process collected; with prometheus=True also rewrite the Prometheus file for the run
+def flush(prometheus=False):
+    """
+    Cheap to call after every task: worker processes flush after each
+    category so nothing is lost when the pool shuts them down. Totals are
+    only re-aggregated from metrics.jsonl with `prometheus`, which the
+    process driving the run passes once at its end. Does nothing (besides
+    clearing) unless metrics were enabled.
+    """
+    lines = registry.drain()
+    directory = metrics_dir()
+    if directory is None or not (lines or prometheus):
+        return
+    run_id = os.environ.get(RUN_ID_ENV) or start_run()
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "metrics.lock"), "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if lines:
+            with open(jsonl_path(directory), "a", encoding="utf-8") as f:
+                for line in lines:
+                    f.write(json.dumps(dict(line, run=run_id, pid=os.getpid(), time=time.time())) + "\n")
+        if prometheus:
+            write_prometheus(directory, run_id)
+
+
+# Sum every line of one run (all processes) per series
+def merge_run(directory, run_id=None):
+    """
+    Returns (counters, histograms, spans, run_id); the latest run is used
+    when `run_id` is None.
+    """
+    lines = []
+    if os.path.exists(jsonl_path(directory)):
+        with open(jsonl_path(directory), "r", encoding="utf-8") as f:
+            # Older runs are skipped without parsing them; the file keeps every run
+            marker = f'"run": "{run_id}"' if run_id else ""
+            lines = [json.loads(line) for line in f if line.strip() and marker in line]
+    run_id = run_id or (lines[-1]["run"] if lines else None)
+    counters, histograms, spans = {}, {}, []
+    for line in lines:
+        if line["run"] != run_id:
+            continue
+        key = series_key(line["name"], line["labels"])
+        if line["type"] == "counter":
+            counters[key] = counters.get(key, 0) + line["value"]
+        elif line["type"] == "histogram":
+            merged = histograms.setdefault(key, {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(BUCKETS)})
+            merged["count"] += line["count"]
+            merged["sum"] += line["sum"]
+            merged["max"] = max(merged["max"], line["max"])
+            merged["buckets"] = [a + b for a, b in zip(merged["buckets"], line["buckets"])]
+        else:
+            spans.append(line)
+    return counters, histograms, spans, run_id
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+# Prometheus text exposition format, e.g. for node_exporter's textfile collector
+def write_prometheus(directory, run_id=None):
+    counters, histograms, _, _ = merge_run(directory, run_id)
+    out = []
+    for name in sorted({name for name, _ in counters}):
+        out.append(f"# TYPE {name} counter")
+        for (series, labels), value in sorted(counters.items()):
+            if series == name:
+                out.append(f"{name}{format_labels(labels)} {value}")
+    for name in sorted({name for name, _ in histograms}):
+        out.append(f"# TYPE {name} histogram")
+        for (series, labels), histogram in sorted(histograms.items()):
+            if series != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram["buckets"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                out.append(f"{name}_bucket{format_labels(labels, [('le', le)])} {cumulative}")
+            out.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+            out.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+    path = prometheus_path(directory)
+    tmp_path = temp_path(path)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(out) + "\n")
+    os.replace(tmp_path, path)
+
+
+def report(directory=DEFAULT_METRICS_DIR, run_id=None):
+    counters, histograms, spans, run_id = merge_run(directory, run_id)
+    if run_id is None:
+        print(f"❌ No metrics in {directory}")
+        return
+    print(f"📊 Metrics of run {run_id}")
+    for (name, labels), value in sorted(counters.items()):
+        print(f"   {name}{format_labels(labels)} = {value:g}")
+    for (name, labels), histogram in sorted(histograms.items(), key=lambda item: -item[1]["sum"]):
+        mean = histogram["sum"] / histogram["count"] if histogram["count"] else 0.0
+        print(f"   {name}{format_labels(labels)}: {histogram['count']} x, {histogram['sum']:.3f}s total, "
+              f"{mean * 1000:.1f} ms mean, {histogram['max'] * 1000:.1f} ms max")
+    for event in sorted(spans, key=lambda event: event["start"]):
+        print(f"   🧭 {time.strftime('%H:%M:%S', time.localtime(event['start']))} "
+              f"{event['name']}{format_labels(series_key('', event['labels'])[1])} {event['seconds']:.2f}s")
+
+
+# Command-line switches shared by the phase scripts
+def add_arguments(arg_parser):
+    arg_parser.add_argument("--metrics", nargs="?", const=DEFAULT_METRICS_DIR, metavar="DIR",
+                            help=f"write metrics to DIR/metrics.jsonl and DIR/metrics.prom (default {DEFAULT_METRICS_DIR})")
+    arg_parser.add_argument("--profile", action="store_true",
+                            help="run under cProfile (main process only) and print the hottest functions")
+    arg_parser.add_argument("--trace-memory", action="store_true",
+                            help="trace allocations with tracemalloc and print the biggest allocation sites")
+
+
+# Wrap a phase run with whatever the --metrics / --profile / --trace-memory flags asked for
+@contextmanager
+def instrumented(args, name):
+    if args.metrics:
+        enable(args.metrics)
+    profiler = cProfile.Profile() if args.profile else None
+    if args.trace_memory:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        with span("phase_seconds", trace=True, phase=name):
+            yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            output_dir = args.metrics or DEFAULT_METRICS_DIR
+            os.makedirs(output_dir, exist_ok=True)
+            path = os.path.join(output_dir, f"{name}.prof")
+            profiler.dump_stats(path)
+            print(f"🔍 Profile of {name} (full data in {path}, open with `python -m pstats {path}`):")
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        if args.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"🔍 Peak traced memory of {name}: {peak / 1024 / 1024:.1f} MB; biggest allocation sites:")
+            for stat in snapshot.statistics("lineno")[:MEMORY_LINES]:
+                print(f"   {stat}")
+        flush(prometheus=True)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Show collected metrics, or run any script instrumented")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    report_parser = commands.add_parser("report", help="summarise the metrics of a run")
+    report_parser.add_argument("--dir", default=DEFAULT_METRICS_DIR, help="metrics directory")
+    report_parser.add_argument("--run", help="run id (default: the latest)")
+    run_parser = commands.add_parser("run", help="run a script with metrics, cProfile and/or tracemalloc")
+    add_arguments(run_parser)
+    run_parser.add_argument("script", help="e.g. phase6_predictor.py")
+    run_parser.add_argument("script_args", nargs=argparse.REMAINDER, help="arguments for the script")
+    args = arg_parser.parse_args()
+
+    # The script's own `import metrics` must see the same registry, not a second copy of this __main__
+    import metrics
+    if args.command == "report":
+        metrics.report(args.dir, args.run)
+    else:
+        sys.argv = [args.script] + args.script_args
+        sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+        with metrics.instrumented(args, os.path.splitext(os.path.basename(args.script))[0]):
+            runpy.run_path(args.script, run_name="__main__")
@@ -0,0 +1,270 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import numpy as np
+import scipy.sparse as sp
+from record_store import temp_path
+
+# Versioned, memory-mappable model artifacts: plain NumPy arrays instead of pickles
+
+ARTIFACT_DIR = "model/artifacts"
+FORMAT_VERSION = 1
+KEEP_VERSIONS = 3       # Older artifact versions are deleted after a save
+
+# Vectorizer settings the artifact reproduces without scikit-learn
+TFIDF_PARAMS = ("lowercase", "token_pattern", "ngram_range", "binary", "norm", "use_idf", "smooth_idf", "sublinear_tf")
+
+
+def term_hashes(terms):
+    return np.array([int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+                     for term in terms], dtype=np.uint64)
+
+
+def current_path(artifact_dir=ARTIFACT_DIR):
+    return os.path.join(artifact_dir, "CURRENT")
+
+
+# Name of the artifact version predictors should load, or None when there is none
+def current_version(artifact_dir=ARTIFACT_DIR):
+    path = current_path(artifact_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return f.read().strip() or None
+
+
+# Stop predictors from loading an artifact, e.g. when the new model could not be stored as one
+def clear_current(artifact_dir=ARTIFACT_DIR):
+    if os.path.exists(current_path(artifact_dir)):
+        os.remove(current_path(artifact_dir))
+
+
+# Saving ------------------------------------------------------------------------
+
+def save_arrays(directory, arrays):
+    for name, values in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(values))
+
+
+# Write a fitted vectorizer + MultinomialNB as a new artifact version and make it current
+def save_artifact(model, vectorizer, artifact_dir=ARTIFACT_DIR):
+    """
+    Supports TfidfVectorizer and HashingVectorizer with a MultinomialNB (or any
+    model with feature_log_prob_ and class_log_prior_). Raises ValueError for
+    anything else; the joblib files remain the fallback for those.
+    """
+    from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+
+    if not (hasattr(model, "feature_log_prob_") and hasattr(model, "class_log_prior_")):
+        raise ValueError(f"{type(model).__name__} cannot be stored as an artifact")
+    if callable(getattr(vectorizer, "tokenizer", None)) or callable(getattr(vectorizer, "preprocessor", None)):
+        raise ValueError("vectorizers with custom tokenizer/preprocessor callables cannot be stored")
+    if getattr(vectorizer, "analyzer", "word") != "word" or getattr(vectorizer, "stop_words", None) \
+            or getattr(vectorizer, "strip_accents", None):
+        raise ValueError("only plain word analyzers without stop words or accent stripping can be stored")
+
+    # Labels go to meta.json with their dtype, so they come back as the joblib model gives them
+    classes = np.asarray(model.classes_)
+    labels = classes.tolist()
+    if not all(isinstance(label, (str, int, float, bool)) for label in labels):
+        raise ValueError("only string, integer, float or boolean class labels can be stored")
+
+    arrays = {
+        "feature_log_prob": np.asarray(model.feature_log_prob_, dtype=np.float64),
+        "class_log_prior": np.asarray(model.class_log_prior_, dtype=np.float64),
+    }
+    meta = {"format": FORMAT_VERSION, "classes": labels, "classes_dtype": classes.dtype.str}
+    if isinstance(vectorizer, TfidfVectorizer):
+        # Columns are in sorted term order, so a term's column is its position in the sorted list
+        terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        encoded = [term.encode("utf-8") for term in terms]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+        np.cumsum([len(term) for term in encoded], out=offsets[1:])
+        hashes = term_hashes(terms)
+        order = np.argsort(hashes)
+        arrays.update({
+            "terms": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            "term_offsets": offsets,
+            "hash_keys": hashes[order],             # sorted, for searchsorted lookups
+            "hash_columns": order.astype(np.int64),
+            "idf": np.asarray(vectorizer.idf_ if vectorizer.use_idf else np.ones(len(terms)), dtype=np.float64),
+        })
+        meta.update({"vectorizer": "tfidf",
+                     "params": {key: getattr(vectorizer, key) for key in TFIDF_PARAMS}})
+    elif isinstance(vectorizer, HashingVectorizer):
+        meta.update({"vectorizer": "hashing", "params": {
+            key: value for key, value in vectorizer.get_params().items() if key != "dtype"
+            and isinstance(value, (str, int, float, bool, tuple, type(None)))}})
+    else:
+        raise ValueError(f"{type(vectorizer).__name__} cannot be stored as an artifact")
+
+    os.makedirs(artifact_dir, exist_ok=True)
+    existing = [int(name[1:]) for name in os.listdir(artifact_dir) if re.fullmatch(r"v\d+", name)]
+    name = f"v{max(existing, default=0) + 1:06d}"
+    tmp_dir = os.path.join(artifact_dir, f".{name}.tmp")
+    os.makedirs(tmp_dir)
+    save_arrays(tmp_dir, arrays)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_dir, os.path.join(artifact_dir, name))
+
+    # Switch predictors over atomically, then drop the oldest versions
+    pointer_tmp = temp_path(current_path(artifact_dir))
+    with open(pointer_tmp, "w") as f:
+        f.write(name)
+    os.replace(pointer_tmp, current_path(artifact_dir))
+    versions = sorted(entry for entry in os.listdir(artifact_dir) if re.fullmatch(r"v\d+", entry))
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(artifact_dir, old))
+    return os.path.join(artifact_dir, name)
+
+
+# Loading -----------------------------------------------------------------------
+
+# Same tokens as scikit-learn's default word analyzer for the stored settings
+def make_analyzer(params):
+    token_pattern = re.compile(params["token_pattern"])
+    low, high = params["ngram_range"]
+
+    def analyze(text):
+        if params["lowercase"]:
+            text = text.lower()
+        tokens = token_pattern.findall(text)
+        if (low, high) == (1, 1):
+            return tokens
+        grams = []
+        for n in range(low, high + 1):
+            grams.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return grams
+
+    return analyze
+
+
+# TF-IDF transform over a memory-mapped vocabulary; a drop-in for TfidfVectorizer.transform
+class MappedTfidfVectorizer:
+    def __init__(self, arrays, params):
+        self.params = params
+        self.terms = arrays["terms"]
+        self.term_offsets = arrays["term_offsets"]
+        self.hash_keys = arrays["hash_keys"]
+        self.hash_columns = arrays["hash_columns"]
+        self.idf_ = arrays["idf"]
+        self.analyze = make_analyzer(params)
+
+    def __len__(self):
+        return len(self.idf_)
+
+    def term(self, column):
+        return self.terms[self.term_offsets[column]:self.term_offsets[column + 1]].tobytes().decode("utf-8")
+
+    # Column of each term, -1 when it is not in the vocabulary
+    def columns(self, terms):
+        if not terms or not len(self.hash_keys):
+            return np.full(len(terms), -1, dtype=np.int64)
+        hashes = term_hashes(terms)
+        positions = np.minimum(np.searchsorted(self.hash_keys, hashes), len(self.hash_keys) - 1)
+        columns = np.where(self.hash_keys[positions] == hashes, self.hash_columns[positions], -1)
+        # A 64-bit hash match is checked against the stored term, so collisions cannot leak in
+        for i in np.flatnonzero(columns >= 0).tolist():
+            if self.term(columns[i]) != terms[i]:
+                columns[i] = -1
+        return columns
+
+    def transform(self, texts):
+        if isinstance(texts, str):
+            raise ValueError("Iterable over raw text documents expected, string object received.")
+        counts = [{} for _ in texts]
+        for row, text in zip(counts, texts):
+            for token in self.analyze(text):
+                row[token] = row.get(token, 0) + 1
+
+        # Look every distinct token of the batch up once
+        vocabulary = list({token for row in counts for token in row})
+        columns = dict(zip(vocabulary, self.columns(vocabulary).tolist()))
+        indptr, indices, data = [0], [], []
+        for row in counts:
+            for token, count in row.items():
+                column = columns[token]
+                if column >= 0:
+                    indices.append(column)
+                    data.append(count)
+            indptr.append(len(indices))
+
+        matrix = sp.csr_matrix((np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64),
+                                np.asarray(indptr, dtype=np.int64)), shape=(len(counts), len(self)))
+        matrix.sum_duplicates()
+        matrix.sort_indices()
+        # Artifacts written before `binary` was stored have no such key and used counts
+        if self.params.get("binary"):
+            matrix.data[:] = 1
+        if self.params["sublinear_tf"]:
+            np.log(matrix.data, matrix.data)
+            matrix.data += 1
+        if self.params["use_idf"]:
+            matrix.data *= np.asarray(self.idf_)[matrix.indices]
+        if self.params["norm"]:
+            self.normalize(matrix, self.params["norm"])
+        return matrix
+
+    @staticmethod
+    def normalize(matrix, norm):
+        values = abs(matrix) if norm == "l1" else matrix.multiply(matrix)
+        row_norms = np.asarray(values.sum(axis=1)).ravel()
+        if norm == "l2":
+            row_norms = np.sqrt(row_norms)
+        row_norms[row_norms == 0] = 1
+        matrix.data /= np.repeat(row_norms, np.diff(matrix.indptr))
+
+
+# MultinomialNB prediction from the memory-mapped log probabilities
+class MappedNaiveBayes:
+    def __init__(self, arrays, classes, dtype=None):
+        self.feature_log_prob_ = arrays["feature_log_prob"]
+        self.class_log_prior_ = arrays["class_log_prior"]
+        self.classes_ = np.array(classes, dtype=dtype)
+
+    def joint_log_likelihood(self, X):
+        return np.asarray(X @ np.asarray(self.feature_log_prob_).T) + self.class_log_prior_
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.joint_log_likelihood(X), axis=1)]
+
+    def predict_log_proba(self, X):
+        jll = self.joint_log_likelihood(X)
+        highest = jll.max(axis=1, keepdims=True)
+        return jll - (highest + np.log(np.exp(jll - highest).sum(axis=1, keepdims=True)))
+
+    def predict_proba(self, X):
+        return np.exp(self.predict_log_proba(X))
+
+
+# Load an artifact version (default: the current one) as (model, vectorizer)
+def load_artifact(version=None, artifact_dir=ARTIFACT_DIR, mmap_mode="r"):
+    """
+    Arrays are opened with `mmap_mode`, so loading only maps the files and
+    several predictor processes share one copy of the pages.
+    """
+    version = version or current_version(artifact_dir)
+    if version is None:
+        raise FileNotFoundError(f"no model artifact in {artifact_dir}")
+    path = os.path.join(artifact_dir, version)
+    with open(os.path.join(path, "meta.json"), "r") as f:
+        meta = json.load(f)
+    if meta["format"] != FORMAT_VERSION:
+        raise ValueError(f"unsupported artifact format {meta['format']}")
+
+    arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+              for name in os.listdir(path) if name.endswith(".npy")}
+    model = MappedNaiveBayes(arrays, meta["classes"], meta.get("classes_dtype"))
+    if meta["vectorizer"] == "tfidf":
+        params = dict(meta["params"], ngram_range=tuple(meta["params"]["ngram_range"]))
+        return model, MappedTfidfVectorizer(arrays, params)
+
+    # Hashing is stateless: rebuilding the vectorizer from its settings is all it takes
+    from sklearn.feature_extraction.text import HashingVectorizer
+    params = dict(meta["params"])
+    if "ngram_range" in params:
+        params["ngram_range"] = tuple(params["ngram_range"])
+    return model, HashingVectorizer(**params)
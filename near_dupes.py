@@ -0,0 +1,215 @@
+import os
+import time
+import zlib
+import argparse
+from array import array
+import numpy as np
+from record_store import RecordWriter, iter_records, temp_path
+
+# Near-duplicate detection: 64-bit SimHash of the cleaned content, indexed in LSH band tables
+
+SHINGLE_SIZE = 3        # Words per shingle
+MIN_TOKENS = 10         # Shorter content is too thin to compare and always kept
+MAX_DISTANCE = 3        # Pages whose fingerprints differ in at most 3 of 64 bits are near-duplicates
+SHINGLE_PRIME = np.uint64(1099511628211)
+
+
+# splitmix64 finalizer: spreads the combined token hashes over all 64 bits
+def mix64(x):
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+# 64-bit hashes of the word shingles of a text (deterministic across processes and runs)
+def shingle_hashes(text, shingle_size=SHINGLE_SIZE):
+    tokens = text.split()
+    words = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens),
+                        dtype=np.uint64, count=len(tokens))
+    if len(words) < shingle_size:
+        return mix64(words)
+    count = len(words) - shingle_size + 1
+    combined = np.zeros(count, dtype=np.uint64)
+    for offset in range(shingle_size):
+        combined = combined * SHINGLE_PRIME + words[offset:offset + count]
+    return mix64(combined)
+
+
+# Every bit of the fingerprint is the majority vote of that bit over all shingle hashes
+def simhash(text, shingle_size=SHINGLE_SIZE):
+    hashes = shingle_hashes(text, shingle_size)
+    if not len(hashes):
+        return 0
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)
+    votes = bits.sum(axis=0, dtype=np.int64)
+    return int(np.packbits(votes * 2 > len(hashes)).view(np.uint64)[0])
+
+
+# Number of differing bits between one fingerprint and an array of them
+def hamming_distances(fingerprint, fingerprints):
+    differing = np.bitwise_xor(fingerprints, np.uint64(fingerprint))
+    return np.unpackbits(differing.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+# Fingerprints of the kept pages, looked up through one hash table per band
+class SimHashIndex:
+    """
+    The 64 bits are cut into max_distance + 1 bands, so two fingerprints
+    within max_distance bits agree exactly on at least one band. Memory per
+    page is the 8-byte fingerprint, 4 bytes per band table and the URL, so
+    millions of pages fit comfortably. A lookup only compares against the
+    pages sharing a band, not against every page; wider distances mean
+    narrower bands and bigger buckets.
+    """
+
+    def __init__(self, max_distance=MAX_DISTANCE):
+        if not 0 <= max_distance < 16:
+            raise ValueError("max_distance must be between 0 and 15")
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        edges = [64 * band // bands for band in range(bands + 1)]
+        self.band_shifts = [(start, (1 << (end - start)) - 1) for start, end in zip(edges, edges[1:])]
+        self.fingerprints = np.zeros(1024, dtype=np.uint64)
+        self.urls = []
+        self.ids = {}       # url -> doc id, so a re-scraped page replaces its own entry
+        self.tables = [{} for _ in range(bands)]
+
+    def __len__(self):
+        return len(self.urls)
+
+    def bands(self, fingerprint):
+        return [(fingerprint >> shift) & mask for shift, mask in self.band_shifts]
+
+    def add(self, url, fingerprint):
+        doc_id = self.ids.get(url)
+        if doc_id is not None:
+            if int(self.fingerprints[doc_id]) == fingerprint:
+                return doc_id
+            # The page changed: take its old fingerprint out of the band tables and reuse the slot
+            for table, key in zip(self.tables, self.bands(int(self.fingerprints[doc_id]))):
+                table[key].remove(doc_id)
+                if not table[key]:
+                    del table[key]
+        else:
+            doc_id = len(self.urls)
+            if doc_id == len(self.fingerprints):
+                self.fingerprints = np.resize(self.fingerprints, 2 * doc_id)
+            self.urls.append(url)
+            self.ids[url] = doc_id
+        self.fingerprints[doc_id] = fingerprint
+        for table, key in zip(self.tables, self.bands(fingerprint)):
+            table.setdefault(key, array("I")).append(doc_id)
+        return doc_id
+
+    # (url, distance) of the closest indexed page within max_distance, or None; the entry of
+    # `exclude` (the page being checked, when it was indexed before) is never a match
+    def find(self, fingerprint, exclude=None):
+        candidates = [np.frombuffer(table[key], dtype=np.uint32)
+                      for table, key in zip(self.tables, self.bands(fingerprint)) if key in table]
+        if not candidates:
+            return None
+        ids = np.unique(np.concatenate(candidates))
+        if exclude in self.ids:
+            ids = ids[ids != self.ids[exclude]]
+            if not len(ids):
+                return None
+        distances = hamming_distances(fingerprint, self.fingerprints[ids])
+        best = int(np.argmin(distances))
+        if distances[best] > self.max_distance:
+            return None
+        return self.urls[ids[best]], int(distances[best])
+
+    # Fingerprints and URLs go to one .npz file; the band tables are rebuilt on load
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = temp_path(path)
+        urls = np.frombuffer("\n".join(self.urls).encode("utf-8"), dtype=np.uint8)
+        with open(tmp_path, "wb") as f:
+            np.savez(f, fingerprints=self.fingerprints[:len(self.urls)], urls=urls)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, max_distance=MAX_DISTANCE):
+        index = cls(max_distance)
+        if not os.path.exists(path):
+            return index
+        with np.load(path) as data:
+            fingerprints = data["fingerprints"]
+            urls = data["urls"].tobytes().decode("utf-8")
+        for url, fingerprint in zip(urls.split("\n") if urls else [], fingerprints.tolist()):
+            index.add(url, fingerprint)
+        return index
+
+
+# Drop (or label) records whose content nearly duplicates a page seen before
+def iter_unique(records, index=None, field="content", clusters=None, stats=None, mode="drop"):
+    """
+    Yields the records to keep, in order. A record is never matched against
+    the indexed page with its own URL (a re-scrape of that page), only
+    against other pages. With
+    mode="cluster" near-duplicates are kept too, tagged with "duplicate_of".
+    Each near-duplicate is written to the `clusters` RecordWriter, if given,
+    and `stats` collects seen / duplicates / seconds.
+    """
+    index = index if index is not None else SimHashIndex()
+    stats = stats if stats is not None else {}
+    for key in ("seen", "duplicates", "seconds"):
+        stats.setdefault(key, 0)
+
+    for record in records:
+        start = time.perf_counter()
+        stats["seen"] += 1
+        text = record.get(field) or ""
+        match = None
+        if len(text.split()) >= MIN_TOKENS:
+            fingerprint = simhash(text)
+            match = index.find(fingerprint, exclude=record.get("url"))
+            if match is None:
+                # A re-scraped page replaces its own entry instead of adding a second one
+                index.add(record.get("url"), fingerprint)
+        stats["seconds"] += time.perf_counter() - start
+
+        if match is None:
+            yield record
+            continue
+        stats["duplicates"] += 1
+        if clusters is not None:
+            clusters.write({"url": record.get("url"), "duplicate_of": match[0], "distance": match[1]})
+        if mode == "cluster":
+            yield dict(record, duplicate_of=match[0])
+
+
+def report(stats, label="Near-duplicates"):
+    ratio = stats["duplicates"] / stats["seen"] * 100 if stats["seen"] else 0.0
+    print(f"🧬 {label}: {stats['duplicates']} of {stats['seen']} records ({ratio:.1f}%) "
+          f"in {stats['seconds']:.2f}s")
+
+
+# Deduplicate a set of record files into one output file (across categories, if given several)
+def dedupe_files(paths, output_path, clusters_path=None, mode="drop", max_distance=MAX_DISTANCE):
+    index = SimHashIndex(max_distance)
+    stats = {}
+    start = time.perf_counter()
+    records = (record for path in paths for record in iter_records(path))
+    clusters = RecordWriter(clusters_path, atomic=True) if clusters_path else None
+    with RecordWriter(output_path, atomic=True) as writer:
+        writer.write_all(iter_unique(records, index, clusters=clusters, stats=stats, mode=mode))
+    if clusters is not None:
+        clusters.close()
+    report(stats)
+    print(f"📊 Wrote {writer.count} records to {output_path} in {time.perf_counter() - start:.1f}s")
+    return stats
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Drop near-duplicate pages from record files")
+    arg_parser.add_argument("inputs", nargs="+", help="record files (.json, .jsonl, .jsonl.gz)")
+    arg_parser.add_argument("--output", required=True, help="deduplicated .jsonl / .jsonl.gz file")
+    arg_parser.add_argument("--clusters", help="also write url -> duplicate_of pairs to this file")
+    arg_parser.add_argument("--mode", choices=["drop", "cluster"], default="drop",
+                            help="drop near-duplicates, or keep them tagged with duplicate_of")
+    arg_parser.add_argument("--max-distance", type=int, default=MAX_DISTANCE,
+                            help="max differing fingerprint bits out of 64 (higher finds more, slower)")
+    args = arg_parser.parse_args()
+
+    dedupe_files(args.inputs, args.output, args.clusters, args.mode, args.max_distance)
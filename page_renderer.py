@@ -0,0 +1,178 @@
+import time
+import asyncio
+import threading
+import metrics
+
+try:
+    from playwright.async_api import async_playwright
+except ImportError:  # Rendering is optional: `pip install playwright && playwright install chromium`
+    async_playwright = None
+
+# Headless-browser fallback for client-rendered pages, shared by every fetch thread of a process
+
+DEFAULT_TABS = 2                # Pages rendered at the same time (one tab per browser context)
+MIN_CONTENT_CHARS = 200         # A parsed page with less text than this is rendered
+RENDER_TIMEOUT = 30             # Seconds for the page to load
+NETWORK_IDLE_TIMEOUT = 3        # Extra seconds granted for scripts to finish fetching content
+RECYCLE_AFTER = 100             # Pages per context before it is replaced, to bound its memory
+# Resource types that are never downloaded while rendering; text does not need them
+BLOCKED_RESOURCES = {"image", "font", "media"}
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36")
+
+
+class PageRenderer:
+    """
+    One Chromium and `tabs` long-lived browser contexts, started on the first
+    page that needs them. The browser runs on an event loop in a background
+    thread, so the blocking `render(url)` can be called from any fetch thread;
+    callers queue for a free context, which caps the open tabs.
+    """
+
+    def __init__(self, tabs=DEFAULT_TABS, min_chars=MIN_CONTENT_CHARS, timeout=RENDER_TIMEOUT,
+                 blocked=BLOCKED_RESOURCES):
+        if async_playwright is None:
+            raise RuntimeError("Rendering needs playwright: pip install playwright && playwright install chromium")
+        self.tabs = tabs
+        self.min_chars = min_chars
+        self.timeout = timeout
+        self.blocked = set(blocked)
+        self.lock = threading.Lock()
+        self.starting = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.error = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"checked": 0, "needed": 0, "rendered": 0, "failed": 0, "seconds": 0.0}
+
+    # Does this parsed record look like an empty client-side shell?
+    def needs_rendering(self, record):
+        if record is None:
+            return False
+        needed = len(record.get("content") or "") < self.min_chars
+        with self.lock:
+            self.stats["checked"] += 1
+            self.stats["needed"] += needed
+        return needed
+
+    # Launch the browser once; other threads wait here until its contexts are ready
+    def start(self):
+        with self.starting:
+            if self.error is not None:
+                raise RuntimeError(f"Browser is unavailable: {self.error}")
+            if self.loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=loop.run_forever, daemon=True)
+            self.thread.start()
+            try:
+                asyncio.run_coroutine_threadsafe(self.open(), loop).result()
+            except Exception as e:
+                # Not retried for every page: a missing browser stays missing for the rest of the run
+                self.error = str(e).splitlines()[0]
+                loop.call_soon_threadsafe(loop.stop)
+                self.thread.join()
+                loop.close()
+                print(f"❌ Could not launch Chromium (run `playwright install chromium`): {self.error}")
+                raise
+            self.loop = loop
+
+    async def open(self):
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(headless=True)
+        self.contexts = asyncio.Queue()
+        for _ in range(self.tabs):
+            self.contexts.put_nowait([await self.new_context(), 0])
+
+    async def new_context(self):
+        context = await self.browser.new_context(user_agent=USER_AGENT, viewport={"width": 1280, "height": 800})
+        await context.route("**/*", self.filter_request)
+        return context
+
+    async def filter_request(self, route):
+        if route.request.resource_type in self.blocked:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def render_page(self, url):
+        entry = await self.contexts.get()
+        try:
+            if entry[1] >= RECYCLE_AFTER:
+                await entry[0].close()
+                entry[:] = [await self.new_context(), 0]
+            page = await entry[0].new_page()
+            entry[1] += 1
+            try:
+                await page.goto(url, timeout=self.timeout * 1000, wait_until="domcontentloaded")
+                try:
+                    await page.wait_for_load_state("networkidle", timeout=NETWORK_IDLE_TIMEOUT * 1000)
+                except Exception:
+                    # Pages that keep polling never go idle; take what has rendered so far
+                    pass
+                return await page.content()
+            finally:
+                await page.close()
+        finally:
+            self.contexts.put_nowait(entry)
+
+    # Render `url` and return its HTML after scripts ran; blocks the calling thread
+    def render(self, url):
+        start = time.perf_counter()
+        try:
+            self.start()
+            html = asyncio.run_coroutine_threadsafe(self.render_page(url), self.loop).result()
+        except Exception:
+            with self.lock:
+                self.stats["failed"] += 1
+            metrics.inc("pages_rendered_total", outcome="failed")
+            raise
+        seconds = time.perf_counter() - start
+        with self.lock:
+            self.stats["rendered"] += 1
+            self.stats["seconds"] += seconds
+        metrics.observe("render_seconds", seconds)
+        metrics.inc("pages_rendered_total", outcome="ok")
+        return html
+
+    async def shutdown(self):
+        while not self.contexts.empty():
+            context, _ = self.contexts.get_nowait()
+            await context.close()
+        await self.browser.close()
+        await self.playwright.stop()
+
+    def close(self):
+        with self.starting:
+            loop, self.loop = self.loop, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        self.thread.join()
+        loop.close()
+
+    def report(self, label="Rendering"):
+        checked, needed, rendered = self.stats["checked"], self.stats["needed"], self.stats["rendered"]
+        share = needed / checked * 100 if checked else 0.0
+        average = self.stats["seconds"] / rendered if rendered else 0.0
+        print(f"🖥️ {label}: {needed}/{checked} pages needed rendering ({share:.1f}%), "
+              f"{rendered} rendered in {average:.2f}s on average, {self.stats['failed']} failed")
+
+
+# Wrap a page handler: parse the plain HTML first and render only pages that came back (nearly) empty
+def rendering_handler(handle, renderer):
+    def handle_or_render(url, html):
+        record = handle(url, html)
+        if not renderer.needs_rendering(record):
+            return record
+        try:
+            html = renderer.render(url)
+        except Exception as e:
+            if renderer.error is None:
+                print(f"⚠️ Rendering {url} failed, keeping the plain page: {e}")
+            return record
+        return handle(url, html)
+    return handle_or_render
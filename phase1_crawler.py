@@ -1,9 +1,13 @@
 import os
 import json
+import argparse
 import time
 import random
-from datetime import datetime
-from serpapi import GoogleSearch
+from functools import partial
+from url_frontier import Frontier
+from category_pool import add_category_arguments, load_categories, run_per_category
+from record_store import write_json_atomic
+from snapshot_archive import SnapshotArchive
 
 # === Setup ===
 os.makedirs("logs", exist_ok=True)
@@ -12,13 +16,13 @@ os.makedirs("data/urls", exist_ok=True)
 # Your SerpAPI API Key (sign up at https://serpapi.com/)
 SERP_API_KEY = ''
 
-# Categories for search
-CATEGORIES = [
-    "best food in ahmedabad",
-    "vayu app"
-]
+# Result URLs of a SerpAPI response; also used to replay archived responses offline
+def extract_result_urls(results):
+    return [result['link'] for result in results.get('organic_results', [])]
 
 def run_search(query):
+    # serpapi is only needed when a search actually runs, not to replay archived results
+    from serpapi import GoogleSearch
     print(f"➡️  Searching for: {query}")
     
     search_params = {
@@ -31,38 +35,50 @@ def run_search(query):
     search = GoogleSearch(search_params)
     results = search.get_dict()
     
+    # Keep the raw response in the compressed snapshot archive, so it can be re-parsed later
+    with SnapshotArchive() as archive:
+        archive.add("serp", query, json.dumps(results), category=query, content_type="application/json")
+
     # Check for results and extract URLs
-    if 'organic_results' in results:
-        urls = [result['link'] for result in results['organic_results']]
-    else:
+    if 'organic_results' not in results:
         print(f"❌ No results found for query: {query}")
         return []
-    
-    # Save raw HTML
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    with open(f"logs/{query.replace(' ', '_')}_{timestamp}.json", "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2)
-    
-    return urls
+    return extract_result_urls(results)
 
-def save_urls(query, urls):
+def save_urls(query, urls, use_frontier=False):
     filename = f"data/urls/{query.replace(' ', '_')}.json"
-    with open(filename, "w") as f:
-        json.dump(urls, f, indent=2)
-    print(f"📝 Saved {len(urls)} URLs to {filename}\n")
+    write_json_atomic(filename, urls, indent=2)
+    print(f"📝 Saved {len(urls)} URLs to {filename}")
+    if not use_frontier:
+        return
 
-def main():
-    for query in CATEGORIES:
-        try:
-            urls = run_search(query)
-            if urls:
-                save_urls(query, urls)
-            # Random delay between queries to avoid overloading
-            time.sleep(random.randint(10, 25))
-        except Exception as e:
-            print(f"❌ Error with query '{query}': {e}")
+    # Register the URLs in the crawl frontier, where they are deduplicated across queries
+    frontier = Frontier()
+    added = frontier.add_urls(urls, query)
+    frontier.close()
+    print(f"🧭 {added} of them are new to the frontier\n")
+
+# Search one category and save its URLs; returns how many were found
+def crawl_category(query, use_frontier=False):
+    urls = run_search(query)
+    if urls:
+        save_urls(query, urls, use_frontier)
+    # Random delay between queries to avoid overloading
+    time.sleep(random.randint(10, 25))
+    return len(urls)
+
+def main(categories=None, workers=0, use_frontier=False):
+    # Each worker searches its own share of the categories (see categories.json)
+    crawl = partial(crawl_category, use_frontier=use_frontier)
+    run_per_category(crawl, categories or load_categories(), workers, unit="URLs")
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Phase 1: collect search result URLs per category")
+    add_category_arguments(arg_parser)
+    arg_parser.add_argument("--frontier", dest="use_frontier", action="store_true",
+                            help="also register the URLs in the crawl frontier (data/frontier.db)")
+    args = arg_parser.parse_args()
+
     print("🚀 Starting Google Search with SerpAPI")
-    main()
+    main(load_categories(args.categories_file), args.workers, args.use_frontier)
     print("✅ All done!")
@@ -1,14 +1,36 @@
 import os
 import json
 import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
 import time
+import argparse
+import hashlib
+import multiprocessing.util
+from functools import partial
+from fetch_engine import DEFAULT_CONTENT_TYPES, DEFAULT_MAX_BYTES, FetchLog, PageSkipped, \
+    fetch_pages, fetch_page, make_session
+from http_cache import HttpCache
+from extractors import extract, make_parse_pool, resolve_backend
+from url_frontier import Frontier, REFRESH_INTERVAL
+from link_graph import rank_urls
+from snapshot_archive import SnapshotArchive
+from page_renderer import MIN_CONTENT_CHARS, PageRenderer, rendering_handler
+from category_pool import add_category_arguments, load_categories, run_per_category
+from record_store import DEFAULT_FORMAT, FORMATS, RecordWriter, record_path, save_records
+import metrics
 
 # Create necessary directories for storing refined (scraped) data
 os.makedirs("data/urls", exist_ok=True)  # For crawled URLs (metadata)
 os.makedirs("data/refined", exist_ok=True)  # For detailed scraped data
 
+# Keep-alive session shared by every request of the run
+_session = None
+
+def get_session():
+    global _session
+    if _session is None:
+        _session = make_session()
+    return _session
+
 # Load URLs from Phase 1 (Crawling phase)
 def load_urls_from_file(category):
     """
@@ -26,127 +48,368 @@ def load_urls_from_file(category):
         print(f"❌ File {file_path} not found!")
         return []
 
+# Function to pull the structured fields out of a page's HTML
+def extract_page_data(url, html, backend="python"):
+    """
+    Extracts title, description, content, images and links from raw HTML in
+    a single pass. The default "python" backend gives exactly the records the
+    old BeautifulSoup walk produced; "lxml"/"selectolax"/"auto" are faster
+    but may differ on malformed markup (see bench_extractors.py).
+    """
+    return extract(url, html, backend)
+
+# Cached records are only reused when the same parser (and rendering threshold) made them
+def record_key(parser, renderer=None):
+    key = resolve_backend(parser)
+    return key if renderer is None else f"{key}+render{renderer.min_chars}"
+
 # Function to extract detailed data from a webpage (scraping)
-def scrape_detailed_data_from_page(url):
+def scrape_detailed_data_from_page(url, cache=None, parser="python", log=None,
+                                   max_bytes=DEFAULT_MAX_BYTES, content_types=DEFAULT_CONTENT_TYPES,
+                                   archive=None, category=None, renderer=None):
     """
     Scrapes detailed data from the given webpage (title, description, content, images, and links).
+    With an HttpCache the request is conditional and an unchanged page is not parsed again.
+    Pages of other content types are skipped and bodies over `max_bytes` cut off; both end up in `log`.
+    With a SnapshotArchive the downloaded HTML is archived under `category` before it is parsed.
+    With a PageRenderer a page that parses to (almost) no content is rendered in a browser and parsed again.
     """
+    handle = partial(extract_page_data, backend=parser)
+    if archive is not None:
+        handle = archiving_handler(handle, archive, category)
+    if renderer is not None:
+        handle = rendering_handler(handle, renderer)
     try:
         print(f"➡️  Scraping: {url}")
-        # Send request to the webpage
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Extracting title, description, and other data
-        title = soup.title.string if soup.title else "No Title"
-        description = soup.find('meta', attrs={'name': 'description'})
-        description = description['content'] if description else "No Description"
-        
-        # Extracting main content (paragraphs, links, etc.)
-        content = ''
-        for paragraph in soup.find_all('p'):
-            content += paragraph.get_text()
-
-        # Extracting all images
-        images = [img['src'] for img in soup.find_all('img', src=True)]
-        
-        # Extracting all links
-        links = [a['href'] for a in soup.find_all('a', href=True)]
-
-        # Store all scraped data in a structured way
-        data = {
-            "url": url,
-            "title": title,
-            "description": description,
-            "content": content.strip(),
-            "images": images,
-            "links": links
-        }
-
-        return data
+        # Send request to the webpage over the pooled session; HTTP errors raise
+        return fetch_page(get_session(), url, handle, cache,
+                          max_bytes=max_bytes, content_types=content_types, log=log,
+                          record_key=record_key(parser, renderer))
+    except PageSkipped as e:
+        print(f"⏭️ Skipped {url}: {e.reason}")
+        if log is not None:
+            log.add(url, "skipped", e.reason)
+        return None
     except requests.exceptions.RequestException as e:
         print(f"❌ Failed to scrape {url}: {e}")
+        if log is not None:
+            log.add(url, "failed", str(e))
         return None
     except Exception as e:
         print(f"❌ Error scraping {url}: {e}")
+        if log is not None:
+            log.add(url, "failed", str(e))
         return None
 
-# Save crawled data (basic metadata) to a JSON file
-def save_crawled_data(category, data):
+# Handler used by the concurrent fetch mode once a page has been downloaded
+def make_page_handler(parser="python", parse_pool=None):
     """
-    Save metadata of the crawled data (e.g., titles, URLs) to a JSON file.
+    Fetch threads call the handler with the page HTML; with a process pool the
+    thread just waits on the worker, so parsing is not serialised behind the GIL.
     """
-    safe_name = category.replace(" ", "_")
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    file_path = f"data/urls/{safe_name}_crawled_{timestamp}.json"
+    def handle(url, html):
+        try:
+            if parse_pool is not None:
+                return parse_pool.submit(extract, url, html, parser).result()
+            return extract_page_data(url, html, parser)
+        except Exception as e:
+            print(f"❌ Error scraping {url}: {e}")
+            return None
+    return handle
 
-    with open(file_path, "w") as f:
-        json.dump(data, f, indent=2)
-    print(f"📝 Saved crawled data to {file_path}")
+# Store the raw HTML of every downloaded page in the snapshot archive, then parse it
+def archiving_handler(handle, archive, category):
+    def archived(url, html):
+        archive.add("page", url, html, category=category, content_type="text/html")
+        return handle(url, html)
+    return archived
+
+# Fingerprint of a scraped record, stored in the frontier to spot changed pages
+def content_hash(page_data):
+    return hashlib.sha256(json.dumps(page_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+# Note the content hash of every page as it streams past
+def track_in_frontier(pages, fetched):
+    for page_data in pages:
+        fetched[page_data["url"]] = content_hash(page_data)
+        yield page_data
+
+# Record the outcome of every URL once the category's files are safely written
+def record_in_frontier(frontier, urls, fetched, log=None):
+    failures = log.failures() if log is not None else {}
+    for url, digest in fetched.items():
+        frontier.mark_done(url, digest)
+    for url in urls:
+        if url in fetched:
+            continue
+        outcome, reason = failures.get(url, ("failed", "scrape failed"))
+        if outcome == "skipped":
+            # Not an HTML page: retrying would only skip it again
+            frontier.mark_skipped(url, reason)
+        else:
+            frontier.mark_failed(url, reason)
+
+# Keep the skipped, truncated and failed URLs of a category next to its logs
+def save_fetch_log(category, log):
+    path = f"logs/{category.replace(' ', '_')}_fetch_issues.jsonl"
+    if not log.entries:
+        # A clean run leaves no stale list behind
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    os.makedirs("logs", exist_ok=True)
+    save_records(path, log.entries)
+    log.report(category)
+    print(f"📝 Saved fetch issues to {path}")
 
-# Save detailed scraped data to a JSON file
-def save_scraped_data(category, data):
+# Scrape a whole list of URLs, either one by one or through the async fetch engine
+def iter_scraped_pages(urls, async_mode=False, cache=None, parser="python", parse_pool=None, log=None,
+                       archive=None, category=None, renderer=None, **limits):
     """
-    Save the detailed scraped data to a JSON file.
+    Yields the scraped records in the same order as `urls`, skipping failures.
+    The one-by-one mode yields each page as soon as it is scraped.
     """
-    safe_name = category.replace(" ", "_")
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    file_path = f"data/refined/{safe_name}_scraped_{timestamp}.json"
+    if async_mode:
+        handle = make_page_handler(parser, parse_pool)
+        if archive is not None:
+            handle = archiving_handler(handle, archive, category)
+        if renderer is not None:
+            handle = rendering_handler(handle, renderer)
+        results = fetch_pages(urls, handle, session=get_session(), cache=cache, log=log,
+                              record_key=record_key(parser, renderer), **limits)
+    else:
+        body_limits = {key: limits[key] for key in ("max_bytes", "content_types") if key in limits}
+        results = (scrape_detailed_data_from_page(url, cache, parser, log, archive=archive, category=category,
+                                                  renderer=renderer, **body_limits) for url in urls)
+    for page_data in results:
+        if page_data:
+            yield page_data
+
+def scrape_pages(urls, async_mode=False, cache=None, parser="python", parse_pool=None, **limits):
+    return list(iter_scraped_pages(urls, async_mode, cache, parser, parse_pool, **limits))
+
+# Basic metadata kept for every scraped page
+def crawled_entry(page_data):
+    return {
+        "url": page_data["url"],
+        "title": page_data["title"],
+        "description": page_data["description"]
+    }
 
-    with open(file_path, "w") as f:
-        json.dump(data, f, indent=2)
+# Save crawled data (basic metadata) to a record file
+def save_crawled_data(category, data, fmt=DEFAULT_FORMAT):
+    """
+    Save metadata of the crawled data (e.g., titles, URLs) as JSON Lines (or legacy JSON).
+    """
+    file_path = record_path("data/urls", category, "crawled", fmt)
+    save_records(file_path, data, fmt)
+    print(f"📝 Saved crawled data to {file_path}")
+
+# Save detailed scraped data to a record file
+def save_scraped_data(category, data, fmt=DEFAULT_FORMAT):
+    """
+    Save the detailed scraped data as JSON Lines (or legacy JSON).
+    """
+    file_path = record_path("data/refined", category, "scraped", fmt)
+    save_records(file_path, data, fmt)
     print(f"📝 Saved scraped data to {file_path}")
 
-# Main function to scrape detailed data for all categories
-def run_scraping():
+# Stream pages straight into record files as they are scraped
+def stream_category(category, pages, fmt=DEFAULT_FORMAT):
     """
-    Main function to scrape detailed data for multiple categories.
+    Returns the number of pages written. The files are written under a
+    temporary name and renamed when complete, so readers never see half a
+    category. The legacy "json" format has to collect the whole category first.
     """
-    categories = [
-        "best food in ahmedabad",  # Example category 1
-        "vayu app"  # Example category 2
-    ]
-    
-    for category in categories:
-        # Load URLs for the category (from Phase 1 Crawling)
-        urls = load_urls_from_file(category)
-        
-        if not urls:
-            print(f"❌ No URLs found for category: {category}")
-            continue
-        
-        # List to hold detailed scraped data
-        scraped_data = []
-
-        # Crawl and save metadata (title, description, URL) for each URL
-        crawled_data = []
-        for url in urls:
-            # Scrape detailed data from each URL
-            page_data = scrape_detailed_data_from_page(url)
-            if page_data:
-                scraped_data.append(page_data)
-
-                # Store crawled data (metadata) - we are storing titles and URLs here
-                crawled_entry = {
-                    "url": page_data["url"],
-                    "title": page_data["title"],
-                    "description": page_data["description"]
-                }
-                crawled_data.append(crawled_entry)
-        
-        # Save both crawled and scraped data in separate files
-        if crawled_data:
-            save_crawled_data(category, crawled_data)  # Save crawled metadata
-        
+    if fmt == "json":
+        scraped_data = list(pages)
         if scraped_data:
-            save_scraped_data(category, scraped_data)  # Save scraped detailed content
-        
-        # Sleep to avoid being blocked (be polite)
+            save_crawled_data(category, [crawled_entry(page_data) for page_data in scraped_data], fmt)
+            save_scraped_data(category, scraped_data, fmt)
+        return len(scraped_data)
+
+    scraped_path = record_path("data/refined", category, "scraped", fmt)
+    crawled_path = record_path("data/urls", category, "crawled", fmt)
+    with RecordWriter(scraped_path, atomic=True) as scraped_out, \
+            RecordWriter(crawled_path, atomic=True) as crawled_out:
+        for page_data in pages:
+            scraped_out.write(page_data)
+            crawled_out.write(crawled_entry(page_data))
+    if scraped_out.count:
+        print(f"📝 Saved crawled data to {crawled_path}")
+        print(f"📝 Saved scraped data to {scraped_path}")
+    return scraped_out.count
+
+# Scrape one category and save its records; returns the number of pages scraped
+def scrape_category(category, async_mode=False, cache=None, parser="python", parse_pool=None,
+                    fmt=DEFAULT_FORMAT, frontier=None, archive=None, renderer=None, **limits):
+    # Load URLs for the category (from Phase 1 Crawling)
+    urls = load_urls_from_file(category)
+
+    if frontier is not None:
+        added = frontier.add_urls(urls, category)
+        # Pages with the most PageRank in the link graph (link_graph.py) are fetched first
+        urls = rank_urls(frontier.due(category))
+        print(f"🧭 {category}: {added} new URLs, {len(urls)} due for fetching")
+
+    if not urls:
+        print(f"❌ No URLs found for category: {category}")
+        return 0
+
+    # Scrape detailed data from each URL and save both the crawled
+    # metadata and the scraped content as the pages come in
+    log = FetchLog()
+    pages = iter_scraped_pages(urls, async_mode, cache, parser, parse_pool, log, archive, category, renderer,
+                               **limits)
+    fetched = {}
+    if frontier is not None:
+        pages = track_in_frontier(pages, fetched)
+    count = stream_category(category, pages, fmt)
+    save_fetch_log(category, log)
+    if renderer is not None:
+        renderer.report(category)
+        renderer.reset_stats()
+    if frontier is not None:
+        record_in_frontier(frontier, urls, fetched, log)
+
+    if cache is not None:
+        cache.save(evict=False)
+
+    # Sleep to avoid being blocked (be polite); the async mode already
+    # spaces out requests per host, so it does not need the pause
+    if not async_mode:
         print(f"⏳ Sleeping for a few seconds...\n")
         time.sleep(5)
+    return count
+
+# Cache, frontier, archive and renderer of a worker process, opened once by the pool initializer
+_worker_cache = None
+_worker_frontier = None
+_worker_archive = None
+_worker_renderer = None
+
+def init_scrape_worker(use_cache, use_frontier, refresh_interval, use_archive=False, render_tabs=0,
+                       render_min_chars=MIN_CONTENT_CHARS):
+    global _worker_cache, _worker_frontier, _worker_archive, _worker_renderer
+    _worker_cache = HttpCache() if use_cache else None
+    _worker_frontier = Frontier(refresh_interval=refresh_interval) if use_frontier else None
+    # Each process appends to segment files of its own
+    _worker_archive = SnapshotArchive() if use_archive else None
+    # The browser is only launched once a page needs it, and then kept for every category of the worker
+    _worker_renderer = PageRenderer(render_tabs, render_min_chars) if render_tabs > 0 else None
+    if _worker_renderer is not None:
+        # Pool workers skip atexit handlers but run multiprocessing finalizers
+        multiprocessing.util.Finalize(_worker_renderer, _worker_renderer.close, exitpriority=10)
+
+def scrape_category_in_worker(category, async_mode, parser, fmt, limits):
+    return scrape_category(category, async_mode, _worker_cache, parser, None, fmt, _worker_frontier,
+                           _worker_archive, _worker_renderer, **limits)
+
+# Main function to scrape detailed data for all categories
+def run_scraping(async_mode=False, use_cache=True, parser="python", parse_workers=0,
+                 fmt=DEFAULT_FORMAT, use_frontier=False, refresh_interval=REFRESH_INTERVAL,
+                 categories=None, workers=0, use_archive=False, render_tabs=0,
+                 render_min_chars=MIN_CONTENT_CHARS, **limits):
+    """
+    Main function to scrape detailed data for multiple categories.
+    With `async_mode=True` pages are fetched concurrently; `limits` are passed
+    through to `fetch_engine.fetch_all` (concurrency, per_host, host_delay, ...).
+    `max_bytes` and `content_types` in `limits` bound every download in both
+    modes; skipped and truncated pages are listed in logs/<category>_fetch_issues.jsonl.
+    With `use_cache=True` unchanged pages are revalidated from the on-disk HTTP cache.
+    `parser` picks the extraction backend; `parse_workers` > 0 parses pages in a
+    process pool while the async mode keeps fetching. `fmt` is the output
+    format: "jsonl" (default), "jsonl.gz" or the legacy "json".
+    With `use_frontier=True` URLs go through the SQLite frontier: they are
+    canonicalised and deduplicated across categories, only URLs that are due
+    are fetched, and an interrupted run resumes with the categories it had
+    not finished (URLs are marked once their category's files are written).
+    `categories` defaults to categories.json; with `workers` > 0 they are
+    sharded over a process pool (each worker parses its own pages).
+    With `use_archive=True` the raw HTML of every downloaded page is kept in
+    the compressed snapshot archive (data/archive) for offline re-parsing.
+    With `render_tabs` > 0 pages whose plain fetch parses to fewer than
+    `render_min_chars` characters of content are rendered in headless
+    Chromium, with at most `render_tabs` tabs open per process.
+    """
+    categories = categories or load_categories()
+
+    if workers > 0:
+        scrape = partial(scrape_category_in_worker, async_mode=async_mode, parser=parser, fmt=fmt,
+                         limits=limits)
+        run_per_category(scrape, categories, workers, unit="pages", initializer=init_scrape_worker,
+                         initargs=(use_cache, use_frontier, refresh_interval, use_archive, render_tabs,
+                                   render_min_chars))
+        # Workers only merge their cache entries; evict once they are all done
+        if use_cache:
+            HttpCache().save()
+        return
+
+    init_scrape_worker(use_cache, use_frontier, refresh_interval, use_archive, render_tabs, render_min_chars)
+    cache, frontier, archive, renderer = _worker_cache, _worker_frontier, _worker_archive, _worker_renderer
+    parse_pool = make_parse_pool(parse_workers) if async_mode and parse_workers > 0 else None
+    scrape = partial(scrape_category, async_mode=async_mode, cache=cache, parser=parser,
+                     parse_pool=parse_pool, fmt=fmt, frontier=frontier, archive=archive, renderer=renderer,
+                     **limits)
+    run_per_category(scrape, categories, unit="pages")
+
+    if parse_pool is not None:
+        parse_pool.shutdown()
+    if cache is not None:
+        cache.save()
+        cache.report()
+    if frontier is not None:
+        print(f"🧭 Frontier: {frontier.stats()}")
+        frontier.close()
+    if archive is not None:
+        archive.close()
+    if renderer is not None:
+        renderer.close()
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Phase 2: scrape detailed data for each category")
+    arg_parser.add_argument("--async", dest="async_mode", action="store_true",
+                            help="fetch pages concurrently with per-host politeness limits")
+    arg_parser.add_argument("--concurrency", type=int, default=16, help="max pages in flight overall")
+    arg_parser.add_argument("--per-host", type=int, default=2, help="max pages in flight per host")
+    arg_parser.add_argument("--host-delay", type=float, default=1.0,
+                            help="minimum seconds between requests to the same host")
+    arg_parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+                            help="always download full pages instead of revalidating cached ones")
+    arg_parser.add_argument("--parser", default="python",
+                            help="extraction backend: python (default), lxml, selectolax, bs4 or auto")
+    arg_parser.add_argument("--parse-workers", type=int, default=0,
+                            help="parse pages in a process pool of this size (async mode only)")
+    arg_parser.add_argument("--format", dest="fmt", default=DEFAULT_FORMAT, choices=sorted(FORMATS),
+                            help="output format for scraped and crawled records")
+    arg_parser.add_argument("--frontier", dest="use_frontier", action="store_true",
+                            help="fetch through the persistent URL frontier (dedupe, resume, refresh interval)")
+    arg_parser.add_argument("--refresh-days", type=float, default=REFRESH_INTERVAL / 86400,
+                            help="with --frontier: days before a fetched URL is due again")
+    arg_parser.add_argument("--max-body-mb", type=float, default=DEFAULT_MAX_BYTES / 1024 / 1024,
+                            help="stop reading a page after this many MB and parse what arrived")
+    arg_parser.add_argument("--content-types", default=",".join(DEFAULT_CONTENT_TYPES),
+                            help="comma-separated Content-Type allow-list; other pages are not downloaded")
+    arg_parser.add_argument("--archive", dest="use_archive", action="store_true",
+                            help="keep the raw HTML of every page in data/archive for offline re-parsing")
+    arg_parser.add_argument("--render-tabs", type=int, default=0,
+                            help="render client-side pages in headless Chromium with this many tabs "
+                                 "per process (0 = off; needs playwright)")
+    arg_parser.add_argument("--render-min-chars", type=int, default=MIN_CONTENT_CHARS,
+                            help="with --render-tabs: render pages whose content is shorter than this")
+    add_category_arguments(arg_parser)
+    metrics.add_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    limits = {"max_bytes": int(args.max_body_mb * 1024 * 1024),
+              "content_types": tuple(value.strip().lower() for value in args.content_types.split(","))}
+    if args.async_mode:
+        limits.update({"concurrency": args.concurrency, "per_host": args.per_host,
+                       "host_delay": args.host_delay})
+
     print("🚀 Starting Phase 3: Scraping Detailed Data")
-    run_scraping()
+    with metrics.instrumented(args, "phase2_scraper"):
+        run_scraping(args.async_mode, args.use_cache, args.parser, args.parse_workers, args.fmt,
+                     args.use_frontier, args.refresh_days * 86400, load_categories(args.categories_file),
+                     args.workers, args.use_archive, args.render_tabs, args.render_min_chars, **limits)
     print("✅ Phase 3 Complete!")
@@ -1,10 +1,29 @@
 import json
 import os
+import time
+import zlib
+import argparse
+import resource
 import joblib
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
+from record_store import current_record_files, iter_records, parquet_columns, read_columns
+from feature_store import FeatureStore
+from model_artifact import clear_current, save_artifact
+import metrics
+
+# Streaming mode settings
+HASHING_FEATURES = 2 ** 20      # Width of the hashed feature space
+BATCH_SIZE = 10000              # Records vectorized and fitted at a time
+HOLDOUT_EVERY = 5               # Every 5th record is held out for evaluation (the 80/20 split)
+TRAINING_MANIFEST = 'model/training_manifest.json'
+
+# Cleaned fields of a processed page (phase 4 output), joined into one training text
+PAGE_TEXT_FIELDS = ['title', 'description', 'content']
+# The deduplicated dataset phase 4 keeps per category, in whichever record format it was written
+PROCESSED_PATTERN = 'data/processed/*_processed_current'
 
 # Helper function to check if the file exists
 def check_and_create_data_file():
@@ -33,26 +52,73 @@ def check_and_create_data_file():
         
         print(f"✅ Sample data saved to '{data_file_path}'")
 
-# Helper function to load data from JSON files
-def load_data():
-    data_file_path = 'data/raw_data.json'
-    
-    # Load your data (URLs and their labels) from the JSON files
-    with open(data_file_path, 'r') as f:
-        data = json.load(f)
-    
-    # Extract features (text) and labels from the data
-    features = [item['text'] for item in data]  # Replace 'text' with the actual key for the textual data
-    labels = [item['category'] for item in data]  # Replace 'category' with the actual key for the category/label
+# Label of processed data without a category column: from a category=<name> directory of a
+# partitioned dataset, or a file name like vayu_app_processed_current.parquet
+def category_from_path(path):
+    for part in reversed(os.path.normpath(path).split(os.sep)):
+        if part.startswith('category='):
+            return part[len('category='):]
+    name = os.path.basename(os.path.normpath(path))
+    if '_processed' not in name:
+        raise ValueError(f"{path} has no category column and its name does not say the category")
+    return name.split('_processed')[0]
+
+# What the TF-IDF model trains on: the labelled data file, plus every category's processed pages
+# when asked for. Those are labelled with the category name, a different label set than raw_data.json
+def training_data_files(include_processed=False):
+    if not include_processed:
+        return ['data/raw_data.json']
+    return ['data/raw_data.json'] + current_record_files(PROCESSED_PATTERN)
+
+# Texts and labels of a Parquet file or partitioned directory, decompressing only the columns used
+def load_parquet_data(data_file_path):
+    """
+    Reads `text` and `category` columns when the data has them. Phase 4
+    output has neither: its title, description and content are joined into
+    the text, and the label comes from the `category` partition key or,
+    for a single file, from the file name.
+    """
+    names = parquet_columns(data_file_path)
+    text_columns = ['text'] if 'text' in names else [name for name in PAGE_TEXT_FIELDS if name in names]
+    label_columns = ['category'] if 'category' in names else []
+    columns = read_columns(data_file_path, text_columns + label_columns)
+    features = [' '.join(part for part in parts if part) for parts in zip(*(columns[name] for name in text_columns))]
+    if label_columns:
+        return features, columns['category']
+    return features, [category_from_path(data_file_path)] * len(features)
+
+# Helper function to load data from JSON / JSON Lines / Parquet files
+def load_data(data_file_path='data/raw_data.json'):
+    if data_file_path.endswith('.parquet') or os.path.isdir(data_file_path):
+        return load_parquet_data(data_file_path)
+
+    # Load your data (URLs and their labels) record by record; .json, .jsonl and .jsonl.gz all work
+    features = []
+    labels = []
+    for item in iter_records(data_file_path):
+        if 'text' not in item:
+            # A processed page: same text and label as load_parquet_data gives it
+            features.append(' '.join(part for part in (item.get(name) for name in PAGE_TEXT_FIELDS) if part))
+            labels.append(item.get('category') or category_from_path(data_file_path))
+            continue
+        # Extract features (text) and labels from the data
+        features.append(item['text'])  # Replace 'text' with the actual key for the textual data
+        labels.append(item['category'])  # Replace 'category' with the actual key for the category/label
     return features, labels
 
 # Model training function
-def train_model(features, labels):
-    # Initialize TfidfVectorizer
-    tfidf_vectorizer = TfidfVectorizer()
+def train_model(features, labels, feature_store=None):
+    with metrics.span("vectorize_seconds", mode="tfidf"):
+        if feature_store is not None:
+            # Same matrix and vectorizer as below, but only new or changed documents are tokenized
+            features_tfidf, tfidf_vectorizer = feature_store.fit_tfidf(features)
+            feature_store.report()
+        else:
+            # Initialize TfidfVectorizer
+            tfidf_vectorizer = TfidfVectorizer()
 
-    # Fit the TF-IDF vectorizer on the features
-    features_tfidf = tfidf_vectorizer.fit_transform(features)
+            # Fit the TF-IDF vectorizer on the features
+            features_tfidf = tfidf_vectorizer.fit_transform(features)
 
     # Split the data into training and testing sets
     X_train, X_test, y_train, y_test = train_test_split(features_tfidf, labels, test_size=0.2, random_state=42)
@@ -61,7 +127,8 @@ def train_model(features, labels):
     model = MultinomialNB()
 
     # Train the model on the training data
-    model.fit(X_train, y_train)
+    with metrics.span("fit_seconds", mode="tfidf"):
+        model.fit(X_train, y_train)
 
     # Evaluate the model
     predictions = model.predict(X_test)
@@ -80,24 +147,192 @@ def save_model(model, tfidf_vectorizer):
     
     # Saving the vectorizer using joblib
     joblib.dump(tfidf_vectorizer, 'model/tfidf_vectorizer.joblib')
+
+    # Versioned memory-mapped copy, which the predictors load instead of the pickles
+    try:
+        path = save_artifact(model, tfidf_vectorizer)
+        print(f"✅ Model artifact saved to {path}")
+    except ValueError as e:
+        clear_current()
+        print(f"⚠️ No model artifact written, predictors will use the joblib files: {e}")
     
     print("✅ Model and vectorizer saved successfully!")
 
+# Peak resident memory of this process so far, in MB (ru_maxrss is in KB on Linux)
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# Stateless vectorizer for streaming: no vocabulary to fit, so batches can come and go
+def make_hashing_vectorizer():
+    # MultinomialNB needs non-negative features, hence alternate_sign=False
+    return HashingVectorizer(n_features=HASHING_FEATURES, alternate_sign=False, norm='l2')
+
+# Which records of each data file the streaming model has already seen
+def load_training_manifest():
+    if not os.path.exists(TRAINING_MANIFEST):
+        return {}
+    with open(TRAINING_MANIFEST, 'r') as f:
+        return json.load(f)
+
+def save_training_manifest(manifest):
+    os.makedirs('model', exist_ok=True)
+    tmp_path = f"{TRAINING_MANIFEST}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, TRAINING_MANIFEST)
+
+# Deterministic holdout so a record stays on the same side across weekly updates
+def is_holdout(text):
+    return zlib.crc32(text.encode('utf-8')) % HOLDOUT_EVERY == 0
+
+# Lazily read (texts, labels) mini-batches, skipping records already trained on
+def iter_batches(data_files, skip=None, batch_size=BATCH_SIZE):
+    """
+    Records are appended to data files over time, so `skip` maps each path to
+    the number of leading records that were consumed by an earlier run.
+    """
+    skip = skip or {}
+    texts, labels = [], []
+    for path in data_files:
+        for position, item in enumerate(iter_records(path)):
+            if position < skip.get(path, 0):
+                continue
+            texts.append(item['text'])
+            labels.append(item['category'])
+            if len(texts) == batch_size:
+                yield texts, labels
+                texts, labels = [], []
+    if texts:
+        yield texts, labels
+
+# Cheap first pass: every label, so partial_fit knows all classes up front
+def scan_classes(data_files, skip=None):
+    classes = set()
+    for _, labels in iter_batches(data_files, skip):
+        classes.update(labels)
+    return sorted(classes)
+
+# Out-of-core training with HashingVectorizer + MultinomialNB.partial_fit
+def train_streaming(data_files, model=None, skip=None, batch_size=BATCH_SIZE):
+    """
+    Peak memory is bounded by `batch_size`. With an existing `model` only the
+    records after `skip` are fitted; labels the model has never seen are
+    dropped, because MultinomialNB cannot add classes after its first fit.
+    Returns the model, the vectorizer and the number of records trained on.
+    """
+    vectorizer = make_hashing_vectorizer()
+    if model is None:
+        model = MultinomialNB()
+        classes = scan_classes(data_files, skip)
+    else:
+        classes = list(model.classes_)
+    known = set(classes)
+
+    trained = 0
+    dropped = 0
+    y_test, predictions = [], []
+    for texts, labels in iter_batches(data_files, skip, batch_size):
+        train_texts, train_labels = [], []
+        test_texts, test_labels = [], []
+        for text, label in zip(texts, labels):
+            if label not in known:
+                dropped += 1
+            elif is_holdout(text):
+                test_texts.append(text)
+                test_labels.append(label)
+            else:
+                train_texts.append(text)
+                train_labels.append(label)
+
+        if train_texts:
+            model.partial_fit(vectorizer.transform(train_texts), train_labels, classes=classes)
+            trained += len(train_texts)
+        if test_texts and hasattr(model, 'classes_'):
+            predictions.extend(model.predict(vectorizer.transform(test_texts)))
+            y_test.extend(test_labels)
+
+    if dropped:
+        print(f"⚠️ Skipped {dropped} records with labels the model was not trained on; run a full retrain to add them")
+    if y_test:
+        print("Classification Report:\n", classification_report(y_test, predictions, zero_division=0))
+    return model, vectorizer, trained
+
+# Count the records of each data file, so the next update starts after them
+def count_records(data_files):
+    return {path: sum(1 for _ in iter_records(path)) for path in data_files}
+
+# Train (or update) the streaming model and save it where the predictor expects it
+def train_streaming_model(data_files=None, update=False, batch_size=BATCH_SIZE):
+    data_files = data_files or ['data/raw_data.json']
+    model = None
+    skip = None
+    if update and os.path.exists('model/trained_model.joblib') and os.path.exists(TRAINING_MANIFEST):
+        vectorizer = joblib.load('model/tfidf_vectorizer.joblib')
+        # A TF-IDF model has a fitted vocabulary and cannot be updated in place
+        if isinstance(vectorizer, HashingVectorizer):
+            model = joblib.load('model/trained_model.joblib')
+            skip = load_training_manifest()
+        else:
+            print("⚠️ Existing model was trained with TF-IDF, training a streaming model from scratch")
+
+    start = time.perf_counter()
+    with metrics.span("train_seconds", trace=True, mode="streaming"):
+        model, vectorizer, trained = train_streaming(data_files, model, skip, batch_size)
+    elapsed = time.perf_counter() - start
+    metrics.inc("training_records_total", trained, mode="streaming")
+
+    if not hasattr(model, 'classes_'):
+        print("❌ No training records found")
+        return None, None
+    if trained or skip is None:
+        save_model(model, vectorizer)
+    save_training_manifest(count_records(data_files))
+    print(f"📊 Streaming training: {trained} new records in {elapsed:.2f}s, peak RSS {peak_rss_mb():.1f} MB")
+    return model, vectorizer
+
 # Main function to run the training process
-def load_model():
+def load_model(use_feature_cache=True, include_processed=False):
     # Check if the raw_data.json file exists, create if not
     check_and_create_data_file()
 
     # Load your dataset (features and labels)
-    features, labels = load_data()
+    features, labels = [], []
+    for data_file_path in training_data_files(include_processed):
+        file_features, file_labels = load_data(data_file_path)
+        features.extend(file_features)
+        labels.extend(file_labels)
 
     # Train the model
-    model, tfidf_vectorizer = train_model(features, labels)
+    start = time.perf_counter()
+    with metrics.span("train_seconds", trace=True, mode="tfidf"):
+        model, tfidf_vectorizer = train_model(features, labels, FeatureStore() if use_feature_cache else None)
+    elapsed = time.perf_counter() - start
+    metrics.inc("training_records_total", len(features), mode="tfidf")
 
     # Save the trained model and vectorizer
     save_model(model, tfidf_vectorizer)
 
     print("Model and vectorizer trained and saved successfully!")
+    print(f"📊 TF-IDF training: {len(features)} records in {elapsed:.2f}s, peak RSS {peak_rss_mb():.1f} MB")
 
 if __name__ == "__main__":
-    load_model()
+    arg_parser = argparse.ArgumentParser(description="Phase 3: train the classification model")
+    arg_parser.add_argument("--mode", choices=["tfidf", "streaming"], default="tfidf",
+                            help="tfidf fits on the whole corpus (default); streaming uses mini-batches")
+    arg_parser.add_argument("--update", action="store_true",
+                            help="streaming mode: only fit records added since the last run")
+    arg_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                            help="streaming mode: records per mini-batch")
+    arg_parser.add_argument("--data", nargs="+", help="streaming mode: training data files")
+    arg_parser.add_argument("--no-feature-cache", dest="use_feature_cache", action="store_false",
+                            help="tfidf mode: tokenize every document instead of reusing cached term counts")
+    arg_parser.add_argument("--include-processed", action="store_true",
+                            help="tfidf mode: also train on the processed pages, labelled with their category name")
+    metrics.add_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    with metrics.instrumented(args, "phase3_model"):
+        if args.mode == "streaming":
+            train_streaming_model(args.data, args.update, args.batch_size)
+        else:
+            load_model(args.use_feature_cache, args.include_processed)
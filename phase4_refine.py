@@ -1,30 +1,42 @@
 import os
-import json
 import re
-from datetime import datetime
+import json
+import argparse
+from functools import partial
+from itertools import chain
+import numpy as np
 import pandas as pd
+from record_store import (DEFAULT_FORMAT, FORMATS, RecordWriter, category_files, current_record_file,
+                          iter_category_records, iter_records, record_path, save_records, temp_path, write_json_atomic,
+                          write_partition)
+from near_dupes import SimHashIndex, iter_unique, report as report_near_duplicates
+from category_pool import add_category_arguments, load_categories, run_per_category
+import link_graph
+import metrics
 
 # Create the directory to store processed (refined) data
 os.makedirs("data/processed", exist_ok=True)
+os.makedirs("data/processed/manifests", exist_ok=True)
 
-# Load the scraped data from a JSON file
-def load_scraped_data(category):
-    safe_name = category.replace(" ", "_")
-    files = os.listdir("data/refined")
-    relevant_files = [file for file in files if file.startswith(safe_name) and file.endswith('.json')]
+# Rows per chunk when appending the CSV copy
+CSV_CHUNK_SIZE = 10000
 
-    all_data = []
-    for file in relevant_files:
-        with open(f"data/refined/{file}", "r") as f:
-            data = json.load(f)
-            all_data.extend(data)
-    
-    return all_data
+# Rows per DataFrame in the columnar cleaning path
+CLEAN_CHUNK_SIZE = 50000
 
-# Clean and normalize the scraped data
-def clean_and_normalize_data(data):
-    cleaned_data = []
+# Columns of a scraped / cleaned record, in output order
+TEXT_COLUMNS = ["title", "description", "content"]
+LIST_COLUMNS = ["images", "links"]
 
+# Load the scraped data from the category's record files (JSON Lines or legacy JSON)
+def load_scraped_data(category):
+    """
+    Yields scraped records one at a time, so memory does not grow with the crawl.
+    """
+    yield from iter_category_records("data/refined", category)
+
+# Clean and normalize the scraped data, one record at a time (reference implementation)
+def iter_cleaned_data_loop(data):
     for entry in data:
         # Extract the title and description
         title = entry.get('title', '').strip()
@@ -52,46 +64,351 @@ def clean_and_normalize_data(data):
             "links": cleaned_links
         }
 
-        cleaned_data.append(cleaned_entry)
+        yield cleaned_entry
+
+# Lowercase and collapse whitespace in one go; same result as strip + lower + re.sub(r'\s+', ' ')
+def normalize_text(text):
+    return ' '.join(text.lower().split())
+
+# Keep only the absolute http(s) entries of a list column, masking the exploded values at once
+def filter_http_lists(column):
+    lengths = np.fromiter((len(value) for value in column), dtype=np.int64, count=len(column))
+    exploded = np.array([item for value in column for item in value], dtype=object)
+    if not len(exploded):
+        return [[] for _ in range(len(column))]
+    mask = pd.Series(exploded).str.startswith('http', na=False).to_numpy(dtype=bool)
+
+    # Count the kept entries per row, then cut the kept values back into per-row lists
+    rows = np.repeat(np.arange(len(column)), lengths)
+    kept_counts = np.bincount(rows[mask], minlength=len(column))
+    kept = exploded[mask].tolist()
+    lists = []
+    start = 0
+    for end in np.cumsum(kept_counts).tolist():
+        lists.append(kept[start:end])
+        start = end
+    return lists
+
+# Clean one chunk of scraped records column by column
+def clean_frame(frame):
+    frame = frame.reindex(columns=["url"] + TEXT_COLUMNS + LIST_COLUMNS)
+    cleaned = pd.DataFrame(index=frame.index)
+    cleaned["url"] = frame["url"].astype(object).where(frame["url"].notna(), None)
 
-    return cleaned_data
+    for column in TEXT_COLUMNS:
+        cleaned[column] = frame[column].fillna('').astype(str).map(normalize_text)
 
-# Save the cleaned data to a new JSON or CSV file
-def save_cleaned_data(category, data):
+    for column in LIST_COLUMNS:
+        values = [value if isinstance(value, list) else [] for value in frame[column]]
+        cleaned[column] = filter_http_lists(values)
+    return cleaned
+
+# Group an iterable of records into DataFrames of at most `chunk_size` rows
+def iter_frames(data, chunk_size=CLEAN_CHUNK_SIZE):
+    chunk = []
+    for entry in data:
+        chunk.append(entry)
+        if len(chunk) == chunk_size:
+            yield pd.DataFrame.from_records(chunk)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame.from_records(chunk)
+
+# Clean and normalize the scraped data chunk by chunk, yielding cleaned records
+def iter_cleaned_data(data, chunk_size=CLEAN_CHUNK_SIZE):
+    columns = ["url"] + TEXT_COLUMNS + LIST_COLUMNS
+    for frame in iter_frames(data, chunk_size):
+        cleaned = clean_frame(frame)
+        for row in zip(*(cleaned[column].tolist() for column in columns)):
+            yield dict(zip(columns, row))
+
+# Clean and normalize the scraped data
+def clean_and_normalize_data(data):
+    return list(iter_cleaned_data(data))
+
+# Append a chunk of records to the CSV copy, writing the header only once
+def append_csv_chunk(csv_file_path, rows, header):
+    pd.DataFrame(rows).to_csv(csv_file_path, mode="a", header=header, index=False)
+
+# Save the cleaned data to a new record file and a CSV file
+def save_cleaned_data(category, data, fmt=DEFAULT_FORMAT):
+    """
+    Streams the cleaned records into the record file and appends the CSV in
+    chunks of CSV_CHUNK_SIZE rows. Parquet keeps the lists as list columns,
+    so no CSV copy is written for it. Returns the number of records saved.
+    """
+    json_file_path = record_path("data/processed", category, "processed", fmt)
+    csv_file_path = json_file_path[:-len(FORMATS[fmt])] + ".csv"
+
+    if fmt == "parquet":
+        count = save_records(json_file_path, data, fmt)
+        if count:
+            print(f"📝 Saved cleaned data to {json_file_path}")
+        return count
+    if fmt == "json":
+        data = list(data)
+        save_records(json_file_path, data, fmt)
+        count = len(data)
+        if count:
+            pd.DataFrame(data).to_csv(csv_file_path, index=False)
+    else:
+        count = 0
+        chunk = []
+        with RecordWriter(json_file_path) as writer:
+            for entry in data:
+                writer.write(entry)
+                chunk.append(entry)
+                if len(chunk) == CSV_CHUNK_SIZE:
+                    append_csv_chunk(csv_file_path, chunk, header=count == 0)
+                    count += len(chunk)
+                    chunk = []
+        if chunk:
+            append_csv_chunk(csv_file_path, chunk, header=count == 0)
+            count += len(chunk)
+
+    if count:
+        print(f"📝 Saved cleaned data to {json_file_path}")
+        print(f"📝 Saved cleaned data to {csv_file_path}")
+    return count
+
+# Per-category manifest: which refined files were already merged, and which URLs we hold
+def manifest_path(category):
     safe_name = category.replace(" ", "_")
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    
-    # Save as JSON
-    json_file_path = f"data/processed/{safe_name}_processed_{timestamp}.json"
-    with open(json_file_path, "w") as f:
-        json.dump(data, f, indent=2)
-    print(f"📝 Saved cleaned data to {json_file_path}")
-    
-    # Optionally, save as CSV for AI model training
-    csv_file_path = f"data/processed/{safe_name}_processed_{timestamp}.csv"
-    df = pd.DataFrame(data)
-    df.to_csv(csv_file_path, index=False)
-    print(f"📝 Saved cleaned data to {csv_file_path}")
+    return f"data/processed/manifests/{safe_name}.json"
+
+def load_manifest(category):
+    path = manifest_path(category)
+    if not os.path.exists(path):
+        return {"files": {}, "urls": []}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_manifest(category, manifest):
+    write_json_atomic(manifest_path(category), manifest)
+
+# Size and modification time identify a version of an input file
+def file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+# The deduplicated, always-up-to-date processed dataset of a category
+def current_paths(category, fmt=DEFAULT_FORMAT):
+    safe_name = category.replace(" ", "_")
+    base = f"data/processed/{safe_name}_processed_current"
+    return base + FORMATS[fmt], base + ".csv"
+
+# SimHash fingerprints of the pages kept so far, and the log of the pages dropped as near-duplicates
+def near_duplicate_index_path(category):
+    safe_name = category.replace(" ", "_")
+    return f"data/processed/manifests/{safe_name}.simhash.npz"
+
+def near_duplicates_path(category):
+    safe_name = category.replace(" ", "_")
+    return f"data/processed/{safe_name}_near_duplicates.jsonl"
+
+# Rebuild the CSV copy of the current dataset in chunks, then swap it in
+def rewrite_csv(records_path, csv_file_path):
+    tmp_path = temp_path(csv_file_path)
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    chunk = []
+    written = 0
+    for entry in iter_records(records_path):
+        chunk.append(entry)
+        if len(chunk) == CSV_CHUNK_SIZE:
+            append_csv_chunk(tmp_path, chunk, header=written == 0)
+            written += len(chunk)
+            chunk = []
+    if chunk:
+        append_csv_chunk(tmp_path, chunk, header=written == 0)
+    if os.path.exists(tmp_path):
+        os.replace(tmp_path, csv_file_path)
+
+# Sizes of the current dataset files, 0 for one not written yet
+def current_sizes(records_path, csv_file_path):
+    return {name: os.path.getsize(path) if os.path.exists(path) else 0
+            for name, path in (("records", records_path), ("csv", csv_file_path))}
+
+# Cut the current dataset back to the sizes recorded with the manifest
+def roll_back_partial_append(manifest, records_path, csv_file_path):
+    """
+    Appending is not atomic, so a worker that died mid-merge may have left
+    records the manifest does not know about. The sizes are saved with the
+    pending marker before the first byte is appended, so they mark the last
+    consistent state; a file without a recorded size did not exist then.
+    Only call this after an interrupted append: an interrupted rewrite may
+    have swapped in a complete, larger file, which must not be cut.
+    """
+    sizes = manifest.get("sizes", {})
+    for path, size in ((records_path, sizes.get("records", 0)), (csv_file_path, sizes.get("csv", 0))):
+        if not os.path.exists(path) or os.path.getsize(path) <= size:
+            continue
+        if size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+        else:
+            os.remove(path)
+        print(f"⚠️ Rolled back an unfinished merge in {path}")
+
+# After a --format change, carry the category's dataset over to the new format and drop the other copies
+def switch_format(category, fmt, manifest):
+    records_path, csv_file_path = current_paths(category, fmt)
+    base = records_path[:-len(FORMATS[fmt])]
+    others = [base + extension for extension in FORMATS.values()
+              if base + extension != records_path and os.path.exists(base + extension)]
+    if not others:
+        return
+    previous = current_record_file(base)
+    if previous != records_path:
+        save_records(records_path, iter_records(previous), fmt)
+        if fmt != "parquet":
+            rewrite_csv(records_path, csv_file_path)
+        elif os.path.exists(csv_file_path):
+            os.remove(csv_file_path)
+        print(f"📝 Converted {previous} to {records_path}")
+    # Otherwise they are left from a conversion that stopped before removing them
+    for path in others:
+        os.remove(path)
+    manifest["sizes"] = {} if fmt == "parquet" else current_sizes(records_path, csv_file_path)
+    save_manifest(category, manifest)
+
+# Clean only refined files not merged before and merge them into the current dataset
+def refine_category(category, fmt=DEFAULT_FORMAT, full_rebuild=False, drop_near_duplicates=True, partitioned=False):
+    """
+    Newer records replace older ones with the same URL. Only records from new
+    or changed input files are cleaned; when none of their URLs are known yet
+    they are simply appended. With `drop_near_duplicates` a page whose content
+    nearly matches one already kept under another URL is left out and logged
+    in <category>_near_duplicates.jsonl. With `partitioned` the merged records
+    are also added to the Parquet dataset under data/processed/parquet,
+    partitioned by category and date. Returns the number of new records merged.
+    """
+    with metrics.span("refine_seconds", category=category):
+        return refine_category_files(category, fmt, full_rebuild, drop_near_duplicates, partitioned)
+
+def refine_category_files(category, fmt, full_rebuild, drop_near_duplicates, partitioned=False):
+    records_path, csv_file_path = current_paths(category, fmt)
+    # Parquet keeps list columns natively, so it gets no CSV copy
+    columnar = fmt == "parquet"
+    index_path = near_duplicate_index_path(category)
+    base = records_path[:-len(FORMATS[fmt])]
+    if full_rebuild:
+        for path in [base + extension for extension in FORMATS.values()] + [csv_file_path, manifest_path(category),
+                                                                             index_path]:
+            if os.path.exists(path):
+                os.remove(path)
+    manifest = load_manifest(category)
+    # Kind of merge ("append" or "rewrite") that was still running when the last run stopped;
+    # an append went to the newest copy, which is in the old format if --format changed since
+    interrupted = manifest.get("pending")
+    if interrupted == "append":
+        roll_back_partial_append(manifest, current_record_file(base) or records_path, csv_file_path)
+    switch_format(category, fmt, manifest)
+    manifest.pop("pending", None)
+
+    new_files = [path for path in category_files("data/refined", category)
+                 if manifest["files"].get(path) != file_signature(path)]
+    if not new_files:
+        print(f"✅ No new scraped data for category: {category}")
+        return 0
+
+    # Deduplicate the new records by URL, keeping the latest one
+    new_records = {}
+    cleaned = 0
+    with metrics.span("clean_seconds", category=category):
+        for path in new_files:
+            for entry in iter_cleaned_data(iter_records(path)):
+                cleaned += 1
+                new_records.pop(entry["url"], None)
+                new_records[entry["url"]] = entry
+    metrics.inc("records_cleaned_total", cleaned, category=category)
+
+    if drop_near_duplicates:
+        index = SimHashIndex.load(index_path)
+        stats = {}
+        with RecordWriter(near_duplicates_path(category)) as clusters:
+            kept = list(iter_unique(new_records.values(), index, clusters=clusters, stats=stats))
+        new_records = {entry["url"]: entry for entry in kept}
+        index.save(index_path)
+        report_near_duplicates(stats, f"Near-duplicates in {category}")
+        metrics.inc("near_duplicates_total", stats["duplicates"], category=category)
+
+    known_urls = set(manifest["urls"])
+    replaced = known_urls.intersection(new_records)
+    # A rewrite that was interrupted may already have swapped in some of these records,
+    # so they are written the same way again: dropped from the old file, then re-added
+    rewrite = bool(replaced) or interrupted == "rewrite"
+    if not columnar:
+        # A Parquet dataset is only ever replaced whole, so there is nothing to roll back
+        manifest["pending"] = "rewrite" if rewrite else "append"
+        manifest["sizes"] = current_sizes(records_path, csv_file_path)
+        save_manifest(category, manifest)
+        del manifest["pending"]
+    if columnar:
+        # A Parquet file cannot be appended to: stream the old row groups into a new file.
+        # Dropping every URL we are about to write (not just `replaced`) keeps a re-run
+        # after a crash between this write and the manifest from duplicating records.
+        old_records = iter_records(records_path) if os.path.exists(records_path) else ()
+        save_records(records_path, chain((entry for entry in old_records if entry["url"] not in new_records),
+                                         new_records.values()), fmt)
+    elif rewrite:
+        # Stream the old dataset into a new file, dropping records that were re-scraped
+        with RecordWriter(records_path, atomic=True) as writer:
+            for entry in iter_records(records_path) if os.path.exists(records_path) else ():
+                if entry["url"] not in new_records:
+                    writer.write(entry)
+            writer.write_all(new_records.values())
+        rewrite_csv(records_path, csv_file_path)
+    else:
+        with RecordWriter(records_path) as writer:
+            writer.write_all(new_records.values())
+        append_csv_chunk(csv_file_path, list(new_records.values()),
+                         header=not os.path.exists(csv_file_path))
+
+    if partitioned and new_records:
+        partition_path, _ = write_partition(new_records.values(), category)
+        print(f"📝 Added {len(new_records)} records to {partition_path}")
+
+    for path in new_files:
+        manifest["files"][path] = file_signature(path)
+    manifest["urls"] = sorted(known_urls.union(new_records))
+    manifest["sizes"] = {} if columnar else current_sizes(records_path, csv_file_path)
+    save_manifest(category, manifest)
+
+    # Out-links of the merged pages, for link_graph.py to fold into the graph. Taken after the
+    # manifest is saved, so a failure here cannot make the next run merge the same files again
+    link_graph.add_snapshot(new_records.values(), category)
+
+    print(f"📝 Merged {len(new_records)} records from {len(new_files)} new files into {records_path} "
+          f"({len(replaced)} replaced, {len(manifest['urls'])} total)")
+    return len(new_records)
 
 # Main function to clean and structure data for all categories
-def main():
-    categories = [
-        "best food in ahmedabad",  # Add your other categories here
-        "vayu app"
-    ]
-
-    for category in categories:
-        # Load the scraped data for the category
-        scraped_data = load_scraped_data(category)
-        
-        # Clean and normalize the scraped data
-        cleaned_data = clean_and_normalize_data(scraped_data)
-        
-        # Save the cleaned data to files
-        if cleaned_data:
-            save_cleaned_data(category, cleaned_data)
+def main(fmt=DEFAULT_FORMAT, full_rebuild=False, categories=None, workers=0, drop_near_duplicates=True,
+         partitioned=False):
+    # Clean the scraped files not seen before and merge them into the current dataset;
+    # categories are independent, so each worker takes its own share
+    refine = partial(refine_category, fmt=fmt, full_rebuild=full_rebuild,
+                     drop_near_duplicates=drop_near_duplicates, partitioned=partitioned)
+    run_per_category(refine, categories or load_categories(), workers, unit="records")
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Phase 4: clean and structure scraped data")
+    arg_parser.add_argument("--format", dest="fmt", default=DEFAULT_FORMAT, choices=["jsonl", "jsonl.gz", "parquet"],
+                            help="format of the current processed dataset (parquet needs pyarrow)")
+    arg_parser.add_argument("--full-rebuild", action="store_true",
+                            help="forget what was processed before and re-clean every scraped file")
+    arg_parser.add_argument("--keep-near-duplicates", dest="drop_near_duplicates", action="store_false",
+                            help="keep pages whose content nearly duplicates another URL's")
+    arg_parser.add_argument("--partitioned", action="store_true",
+                            help="also add merged records to the Parquet dataset in data/processed/parquet, "
+                                 "partitioned by category and date")
+    add_category_arguments(arg_parser)
+    metrics.add_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
     print("🚀 Starting Phase 4: Refining and Structuring Data")
-    main()
+    with metrics.instrumented(args, "phase4_refine"):
+        main(args.fmt, args.full_rebuild, load_categories(args.categories_file), args.workers,
+             args.drop_near_duplicates, args.partitioned)
     print("✅ Phase 4 Complete!")
@@ -1,32 +1,21 @@
-import os
+
 import time
-import json
 import schedule
 from datetime import datetime
-from phase2_scraper import run_scraping  # Assume this is your scraping function
-from phase3_model import train_model, save_model, load_model  # From your previous code
+from pipeline import run_pipeline
+import metrics
 
-# Function to run the scraping and model retraining process
+# Function to run the whole pipeline; stages whose inputs did not change are skipped
 def run_automation():
     print(f"Running automation at {datetime.now()}")
-    
-    # Step 1: Run Scraping Process (Phase 1)
-    print("Starting web scraping...")
-    run_scraping()  # Scrape new data and store it
-    
-    # Step 2: Load new data for retraining
-    print("Loading new data...")
-    new_data = load_new_data('data/raw_data.json')  # Load scraped data
-    
-    # Step 3: Retrain Model (Phase 5)
-    print("Retraining model...")
-    features, labels = preprocess_data(new_data)  # Preprocess the new data
-    model, vectorizer = train_model(features, labels)  # Retrain model
-    
-    # Step 4: Save the retrained model
-    print("Saving the retrained model...")
-    save_model(model, vectorizer)  # Save model to disk
-    
+    # With PIPELINE_METRICS_DIR set, every weekly run gets its own run id in the metrics files
+    metrics.start_run()
+
+    # Crawl, scrape, refine, retrain and predict, paying only for what changed
+    # (see pipeline.py for the stages and what each of them depends on)
+    run_pipeline()
+    metrics.flush(prometheus=True)
+
     print(f"Automation process completed at {datetime.now()}")
 
 # Set up automatic scheduling (e.g., every week)
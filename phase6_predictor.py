@@ -1,26 +1,55 @@
-import joblib
 import os
 import json
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.naive_bayes import MultinomialNB
+import hashlib
+import argparse
+from model_artifact import current_version, load_artifact
+from prediction_cache import CACHE_DB, PredictionCache
+import metrics
+
+# Files written by phase3_model.save_model
+MODEL_FILES = ['model/trained_model.joblib', 'model/tfidf_vectorizer.joblib']
+
+# Identifies the saved model; every save_model call (a new artifact, rewritten joblib files) changes it
+def model_version():
+    parts = [current_version() or '']
+    for path in MODEL_FILES:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+    return hashlib.blake2b('|'.join(parts).encode('utf-8'), digest_size=8).hexdigest()
 
 # Function to load the trained model and vectorizer
 def load_model_and_vectorizer():
-    # Load the model and vectorizer using joblib
+    # The memory-mapped artifact loads in milliseconds and is shared between processes
+    if current_version() is not None:
+        return load_artifact()
+
+    # Models that cannot be stored as an artifact are loaded from the joblib files
+    import joblib
     model = joblib.load('model/trained_model.joblib')
     tfidf_vectorizer = joblib.load('model/tfidf_vectorizer.joblib')
     return model, tfidf_vectorizer
 
 # Function to make predictions on new data
-def predict_new_data(model, tfidf_vectorizer, new_data):
-    # Transform the new data using the vectorizer
-    new_data_tfidf = tfidf_vectorizer.transform(new_data)
-    
-    # Make predictions
-    predictions = model.predict(new_data_tfidf)
-    
-    # Return predictions
-    return predictions
+def predict_new_data(model, tfidf_vectorizer, new_data, cache=None):
+    """
+    With a PredictionCache (created for the version of `model`) texts seen
+    before are answered from the cache and only the rest are vectorized and
+    predicted, together in one call.
+    """
+    def predict_batch(texts):
+        with metrics.span("predict_seconds"):
+            # Transform the new data using the vectorizer
+            new_data_tfidf = tfidf_vectorizer.transform(texts)
+
+            # Make predictions
+            predictions = model.predict(new_data_tfidf)
+        metrics.inc("predictions_total", len(texts))
+        return predictions
+
+    if cache is None:
+        return predict_batch(new_data)
+    return cache.predict(new_data, predict_batch)
 
 # Function to save predictions to a JSON file
 def save_predictions(predictions, output_file='predictions.json'):
@@ -30,9 +59,13 @@ def save_predictions(predictions, output_file='predictions.json'):
     print(f"✅ Predictions saved to {output_file}")
 
 # Main function to run the predictions
-def main():
+def main(use_cache=True):
+    # Read the version before loading, so a model saved in between is not cached under the old one
+    version = model_version()
+
     # Load the trained model and vectorizer
     model, tfidf_vectorizer = load_model_and_vectorizer()
+    cache = PredictionCache(version, path=CACHE_DB) if use_cache else None
     
     # Example new data (replace with actual data you want to predict)
     new_data = [
@@ -42,7 +75,10 @@ def main():
     ]
     
     # Make predictions on new data
-    predictions = predict_new_data(model, tfidf_vectorizer, new_data)
+    predictions = predict_new_data(model, tfidf_vectorizer, new_data, cache)
+    if cache is not None:
+        cache.report()
+        cache.close()
     
     # Print out the predictions
     for text, prediction in zip(new_data, predictions):
@@ -52,4 +88,8 @@ def main():
     save_predictions(predictions)
 
 if __name__ == "__main__":
-    main()
+    arg_parser = argparse.ArgumentParser(description="Phase 6: predict categories of new texts")
+    arg_parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+                            help=f"predict every text instead of reusing predictions from {CACHE_DB}")
+    args = arg_parser.parse_args()
+    main(args.use_cache)
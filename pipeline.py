@@ -0,0 +1,333 @@
+import os
+import glob
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from http_cache import HttpCache
+from record_store import category_files
+from category_pool import CATEGORIES_FILE, load_categories
+from url_frontier import REFRESH_INTERVAL
+import metrics
+
+# Runs the phases as a DAG of stages and skips the ones whose inputs did not change
+
+PIPELINE_STATE = "data/pipeline_state.json"
+
+
+# A phase with declared inputs and outputs; per-category stages run once per category
+class Stage:
+    def __init__(self, name, run, inputs, outputs, after=(), per_category=False, code=(), max_age=None):
+        self.name = name
+        self.run = run                      # run(category) or run()
+        self.inputs = inputs                # inputs(category) -> list of paths / glob patterns
+        self.outputs = outputs              # outputs(category) -> list of paths / glob patterns
+        self.after = list(after)            # names of stages that must finish first
+        self.per_category = per_category
+        self.code = list(code)              # source files; editing them invalidates the stage
+        self.max_age = max_age              # seconds after which the stage runs again regardless
+
+
+def safe_name(category):
+    return category.replace(" ", "_")
+
+
+# Stage bodies ----------------------------------------------------------------
+# Top-level functions so they can be sent to worker processes.
+
+def crawl_category(category):
+    # serpapi is only needed when the crawl actually runs
+    from phase1_crawler import run_search, save_urls
+    urls = run_search(category)
+    if not urls:
+        raise RuntimeError(f"no search results for {category}")
+    save_urls(category, urls)
+
+
+def scrape_category(category):
+    from phase2_scraper import scrape_category as scrape
+    # Other categories may be scraping at the same time, so the cache is only
+    # merged here and evicted once the pipeline is done
+    return scrape(category, async_mode=True, cache=HttpCache())
+
+
+def refine_category(category):
+    from phase4_refine import refine_category as refine
+    refine(category)
+
+
+def build_search_index():
+    from search_index import update_index
+    update_index()
+
+
+def update_link_graph():
+    from link_graph import update_graph
+    update_graph()
+
+
+def train_model():
+    from phase3_model import load_model
+    load_model()
+
+
+def predict_examples():
+    from phase6_predictor import main
+    main()
+
+
+def default_stages():
+    return [
+        Stage("crawl", crawl_category,
+              inputs=lambda c: [],
+              outputs=lambda c: [f"data/urls/{safe_name(c)}.json"],
+              per_category=True),
+        Stage("scrape", scrape_category,
+              inputs=lambda c: [f"data/urls/{safe_name(c)}.json"],
+              outputs=lambda c: [f"data/refined/{safe_name(c)}_scraped_*"],
+              after=["crawl"], per_category=True,
+              code=["phase2_scraper.py", "fetch_engine.py", "extractors.py"],
+              max_age=REFRESH_INTERVAL),
+        Stage("refine", refine_category,
+              inputs=lambda c: category_files("data/refined", c),
+              outputs=lambda c: [f"data/processed/{safe_name(c)}_processed_current.*"],
+              after=["scrape"], per_category=True, code=["phase4_refine.py", "near_dupes.py"]),
+        Stage("index", build_search_index,
+              inputs=lambda c: ["data/processed/*_processed_current.*"],
+              outputs=lambda c: ["data/index/index.json"],
+              after=["refine"], code=["search_index.py"]),
+        # update_graph consumes the pending snapshots, so they cannot be fingerprinted
+        Stage("links", update_link_graph,
+              inputs=lambda c: ["data/graph/state.json", "data/processed/*_processed_current.*"],
+              outputs=lambda c: ["data/graph/state.json"],
+              after=["refine"], code=["link_graph.py"]),
+        Stage("train", train_model,
+              inputs=lambda c: ["data/raw_data.json"],
+              outputs=lambda c: ["model/trained_model.joblib", "model/tfidf_vectorizer.joblib"],
+              after=["refine"], code=["phase3_model.py", "feature_store.py", "model_artifact.py"]),
+        Stage("predict", predict_examples,
+              inputs=lambda c: ["model/trained_model.joblib", "model/tfidf_vectorizer.joblib"],
+              outputs=lambda c: ["predictions.json"],
+              after=["train"], code=["phase6_predictor.py"]),
+    ]
+
+
+# Fingerprints ------------------------------------------------------------------
+
+def expand(patterns):
+    paths = set()
+    for pattern in patterns:
+        paths.update(glob.glob(pattern))
+    return sorted(path for path in paths if os.path.isfile(path))
+
+
+# Content hash of a file; re-read only when its size or mtime changed since the last run
+def file_digest(path, digests):
+    stat = os.stat(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    cached = digests.get(path)
+    if cached and cached[:2] == signature:
+        return cached[2]
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    digests[path] = signature + [sha.hexdigest()]
+    return sha.hexdigest()
+
+
+def fingerprint(stage, category, digests):
+    sha = hashlib.sha256(f"{stage.name}\0{category}".encode("utf-8"))
+    for path in expand(stage.code) + expand(stage.inputs(category)):
+        sha.update(f"\0{path}\0{file_digest(path, digests)}".encode("utf-8"))
+    return sha.hexdigest()
+
+
+def load_state(path=PIPELINE_STATE):
+    if not os.path.exists(path):
+        return {"tasks": {}, "digests": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_state(state, path=PIPELINE_STATE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# Skip when the inputs hash the same as last time, every output exists and the run is recent enough
+def is_up_to_date(stage, category, current, previous, now):
+    outputs_exist = all(glob.glob(pattern) for pattern in stage.outputs(category))
+    # Source stages (nothing to fingerprint, e.g. the paid search API) only run for missing outputs
+    if not stage.code and not stage.inputs(category):
+        return outputs_exist
+    if not previous or previous["fingerprint"] != current:
+        return False
+    if stage.max_age is not None and now - previous["finished"] >= stage.max_age:
+        return False
+    return outputs_exist
+
+
+# Scheduler ---------------------------------------------------------------------
+
+# Run one task and return its wall time; `run` must be a top-level function to reach a worker
+def run_task(run, category, stage_name=None):
+    start = time.perf_counter()
+    labels = {"stage": stage_name or run.__name__}
+    if category is not None:
+        labels["category"] = category
+    try:
+        with metrics.span("stage_seconds", trace=True, **labels):
+            if category is None:
+                run()
+            else:
+                run(category)
+    finally:
+        metrics.flush()
+    return time.perf_counter() - start
+
+
+def build_tasks(stages, categories, skip=()):
+    """
+    One task per (stage, category) — category is None for global stages.
+    A per-category stage waits for the same category of a per-category
+    dependency; global stages wait for every task of their dependencies.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    tasks = {}
+    for stage in stages:
+        if stage.name in skip:
+            continue
+        for category in (categories if stage.per_category else [None]):
+            deps = set()
+            for name in stage.after:
+                if name in skip:
+                    continue
+                if stage.per_category and by_name[name].per_category:
+                    deps.add((name, category))
+                else:
+                    deps.update(key for key in tasks if key[0] == name)
+            tasks[(stage.name, category)] = deps
+    return tasks
+
+
+def task_label(key):
+    stage_name, category = key
+    return stage_name if category is None else f"{stage_name}[{category}]"
+
+
+def run_pipeline(categories=None, stages=None, workers=4, force=(), skip=(), dry_run=False):
+    """
+    Runs every stage whose inputs changed since its last successful run.
+    Independent tasks (different categories) run side by side in a process pool
+    of `workers` (0 = in this process). `force` lists stages that run anyway,
+    `skip` stages that are left out. Returns {task label: (status, seconds)}.
+    """
+    categories = categories if categories is not None else load_categories()
+    stages = stages or default_stages()
+    by_name = {stage.name: stage for stage in stages}
+    tasks = build_tasks(stages, categories, skip)
+    state = load_state()
+    report = {}
+    fingerprints = {}
+    pending = dict(tasks)
+    running = {}
+    run_start = time.perf_counter()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 0 and not dry_run else None
+
+    def finish(key, status, seconds=0.0):
+        report[task_label(key)] = (status, seconds)
+        if status == "done":
+            stage = by_name[key[0]]
+            if set(expand(stage.inputs(key[1]))) & set(expand(stage.outputs(key[1]))):
+                # The stage rewrote its own inputs (links updates state.json); record them as it left them
+                fingerprints[key] = fingerprint(stage, key[1], state["digests"])
+            state["tasks"][task_label(key)] = {"fingerprint": fingerprints[key], "finished": time.time(),
+                                               "seconds": round(seconds, 3)}
+            save_state(state)
+
+    try:
+        while pending or running:
+            # Tasks behind a failure cannot run
+            for key, deps in list(pending.items()):
+                if any(report.get(task_label(dep), ("",))[0] in ("failed", "blocked") for dep in deps):
+                    del pending[key]
+                    finish(key, "blocked")
+
+            # Start (or skip) every task whose dependencies are finished
+            ready = [key for key, deps in pending.items() if all(task_label(dep) in report for dep in deps)]
+            for key in ready:
+                del pending[key]
+                stage = by_name[key[0]]
+                fingerprints[key] = fingerprint(stage, key[1], state["digests"])
+                previous = state["tasks"].get(task_label(key))
+                if (stage.name not in force
+                        and is_up_to_date(stage, key[1], fingerprints[key], previous, time.time())):
+                    finish(key, "skipped")
+                elif dry_run:
+                    finish(key, "would run")
+                elif executor is None:
+                    print(f"▶️  {task_label(key)}")
+                    try:
+                        finish(key, "done", run_task(stage.run, key[1], stage.name))
+                    except Exception as e:
+                        print(f"❌ {task_label(key)} failed: {e}")
+                        finish(key, "failed")
+                else:
+                    print(f"▶️  {task_label(key)}")
+                    running[executor.submit(run_task, stage.run, key[1], stage.name)] = key
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                try:
+                    finish(key, "done", future.result())
+                except Exception as e:
+                    print(f"❌ {task_label(key)} failed: {e}")
+                    finish(key, "failed")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if any(label.startswith("scrape[") and status == "done" for label, (status, _) in report.items()):
+        HttpCache().save()
+
+    print_report(report, stages, time.perf_counter() - run_start)
+    return report
+
+
+def print_report(report, stages, elapsed):
+    print(f"\n📊 Pipeline finished in {elapsed:.1f}s")
+    print(f"{'task':<40}{'status':<12}{'seconds':>10}")
+    for label, (status, seconds) in report.items():
+        print(f"{label:<40}{status:<12}{seconds:>10.2f}")
+    for stage in stages:
+        rows = [value for label, value in report.items() if label.split("[")[0] == stage.name]
+        if rows:
+            ran = sum(1 for status, _ in rows if status == "done")
+            total = sum(seconds for _, seconds in rows)
+            print(f"   {stage.name}: {ran}/{len(rows)} ran, {total:.2f}s of work")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Run the phases as a pipeline, skipping up-to-date stages")
+    arg_parser.add_argument("--categories", nargs="+", help="categories to process (default: --categories-file)")
+    arg_parser.add_argument("--categories-file", default=CATEGORIES_FILE,
+                            help="JSON array or text file (one per line) of categories")
+    arg_parser.add_argument("--workers", type=int, default=4, help="parallel tasks (0 = run in this process)")
+    arg_parser.add_argument("--force", nargs="+", default=[], metavar="STAGE", help="run these stages anyway")
+    arg_parser.add_argument("--skip", nargs="+", default=[], metavar="STAGE",
+                            help="leave these stages out (e.g. crawl without a SerpAPI key)")
+    arg_parser.add_argument("--dry-run", action="store_true", help="only show which stages would run")
+    metrics.add_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    categories = args.categories or load_categories(args.categories_file)
+    with metrics.instrumented(args, "pipeline"):
+        run_pipeline(categories, workers=args.workers, force=args.force, skip=args.skip, dry_run=args.dry_run)
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from model_artifact import current_path
+from phase6_predictor import load_model_and_vectorizer, model_version, predict_new_data
+from prediction_cache import MAX_ENTRIES, PredictionCache
+
+# Files whose modification time decides when the model is reloaded
+MODEL_FILES = ['model/trained_model.joblib', 'model/tfidf_vectorizer.joblib']
+
+
+# Keeps the model in memory and reloads it when the model files change on disk
+class ModelCache:
+    def __init__(self, check_interval=1.0, predictions=None):
+        self.check_interval = check_interval
+        self.predictions = predictions
+        self.lock = threading.Lock()
+        self.version = None
+        self.model = None
+        self.vectorizer = None
+        self.last_check = 0.0
+        self.reload()
+
+    def current_version(self):
+        # The artifact pointer is optional: it disappears when a model cannot be stored as one
+        artifact = [current_path()] if os.path.exists(current_path()) else []
+        return tuple(os.stat(path).st_mtime_ns for path in MODEL_FILES + artifact)
+
+    def reload(self):
+        version = self.current_version()
+        predictions_version = model_version()
+        model, vectorizer = load_model_and_vectorizer()
+        self.model, self.vectorizer, self.version = model, vectorizer, version
+        if self.predictions is not None:
+            # Cached predictions of the previous model are dropped
+            self.predictions.set_version(predictions_version)
+        print(f"✅ Loaded model (version {max(version)})")
+
+    # Return (model, vectorizer), checking the files at most once per interval
+    def get(self):
+        now = time.monotonic()
+        if now - self.last_check >= self.check_interval:
+            with self.lock:
+                self.last_check = now
+                try:
+                    if self.current_version() != self.version:
+                        self.reload()
+                except (OSError, EOFError, ValueError) as e:
+                    # Files are mid-write or missing; keep serving the old model
+                    print(f"⚠️ Model reload skipped: {e}")
+        return self.model, self.vectorizer
+
+
+# One client request waiting for its slice of a batch
+class PendingRequest:
+    def __init__(self, texts):
+        self.texts = texts
+        self.done = threading.Event()
+        self.predictions = None
+        self.error = None
+
+
+# Groups concurrent requests into one transform + predict call
+class MicroBatcher:
+    def __init__(self, cache, max_batch=64, max_wait=0.005):
+        self.cache = cache
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.texts = 0
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def predict(self, texts):
+        if not texts:
+            return []
+        pending = PendingRequest(texts)
+        self.queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.predictions
+
+    # Wait for the first request, then collect more until the batch is full or max_wait passes
+    def collect(self):
+        batch = [self.queue.get()]
+        count = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(pending)
+            count += len(pending.texts)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect()
+            texts = [text for pending in batch for text in pending.texts]
+            try:
+                model, vectorizer = self.cache.get()
+                predictions = predict_new_data(model, vectorizer, texts, self.cache.predictions).tolist()
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+                    pending.done.set()
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+            start = 0
+            for pending in batch:
+                pending.predictions = predictions[start:start + len(pending.texts)]
+                start += len(pending.texts)
+                pending.done.set()
+
+
+# POST /predict {"texts": [...]} -> {"predictions": [...]}; GET /health -> model version and batch stats
+def make_handler(batcher):
+    class PredictionHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != "/health":
+                self.send_json(404, {"error": "not found"})
+                return
+            health = {
+                "model_version": max(batcher.cache.version),
+                "batches": batcher.batches,
+                "texts": batcher.texts
+            }
+            if batcher.cache.predictions is not None:
+                health["cache_hit_ratio"] = round(batcher.cache.predictions.hit_ratio(), 4)
+            self.send_json(200, health)
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self.send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                texts = json.loads(self.rfile.read(length))["texts"]
+                if isinstance(texts, str):
+                    texts = [texts]
+                if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                    raise TypeError('"texts" must be a string or a list of strings')
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_json(400, {"error": f"bad request: {e}"})
+                return
+            try:
+                predictions = batcher.predict(texts)
+            except Exception as e:
+                self.send_json(500, {"error": str(e)})
+                return
+            self.send_json(200, {"predictions": predictions})
+
+        # Keep the console quiet; one line per request would dominate the cost
+        def log_message(self, format, *args):
+            pass
+
+    return PredictionHandler
+
+
+# Threaded server with a listen backlog large enough for bursts of clients
+class PredictionServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(host="127.0.0.1", port=8000, max_batch=64, max_wait=0.005, check_interval=1.0,
+                cache_size=MAX_ENTRIES, cache_db=None):
+    # The version is set by the model cache once it has loaded the model
+    predictions = PredictionCache(None, cache_size, cache_db) if cache_size > 0 else None
+    batcher = MicroBatcher(ModelCache(check_interval, predictions), max_batch, max_wait)
+    server = PredictionServer((host, port), make_handler(batcher))
+    server.batcher = batcher
+    return server
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Serve model predictions over HTTP")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--max-batch", type=int, default=64, help="max texts per predict call")
+    arg_parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                            help="how long to wait for more requests before predicting")
+    arg_parser.add_argument("--reload-interval", type=float, default=1.0,
+                            help="seconds between checks of the model files")
+    arg_parser.add_argument("--cache-size", type=int, default=MAX_ENTRIES,
+                            help="predictions of repeated texts kept in memory (0 = no cache)")
+    arg_parser.add_argument("--cache-db", help="also keep cached predictions in this SQLite file")
+    args = arg_parser.parse_args()
+
+    server = make_server(args.host, args.port, args.max_batch, args.max_wait_ms / 1000, args.reload_interval,
+                         args.cache_size, args.cache_db)
+    print(f"🚀 Prediction server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        predictions = server.batcher.cache.predictions
+        if predictions is not None:
+            predictions.report()
+        print("✅ Server stopped")
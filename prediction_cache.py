@@ -0,0 +1,143 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import metrics
+
+# Predictions of texts seen before, keyed by a hash of the normalized text and the model version
+
+MAX_ENTRIES = 100000            # Predictions kept in memory, least recently used dropped first
+CACHE_DB = "data/prediction_cache.db"
+SQL_BATCH = 500                 # Keys per SELECT; older SQLite builds allow 999 parameters
+
+
+# Same normalization as phase4_refine.normalize_text (not imported from there: phase4 pulls in pandas)
+def normalize_text(text):
+    return ' '.join(text.lower().split())
+
+
+def text_key(text):
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+# Labels go to disk as JSON, so integer and string classes come back as they were
+def encode_label(label):
+    return json.dumps(label.item() if isinstance(label, np.generic) else label)
+
+
+class PredictionCache:
+    """
+    In-memory LRU of label per normalized text, optionally backed by an
+    SQLite file shared between runs and processes. Every entry belongs to
+    one model version: `set_version` with a new version empties the memory
+    and drops the rows of other versions from the file, so a retrained
+    model never answers from the old model's predictions.
+    """
+
+    def __init__(self, version, max_entries=MAX_ENTRIES, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.db = None
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS predictions "
+                            "(version TEXT, key TEXT, label TEXT, PRIMARY KEY (version, key))")
+            self.db.commit()
+        self.version = None
+        self.set_version(version)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"texts": 0, "hits": 0, "disk_hits": 0}
+
+    # Switch to the predictions of another model; a no-op while the version stays the same
+    def set_version(self, version):
+        with self.lock:
+            if version == self.version:
+                return
+            self.version = version
+            self.entries.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM predictions WHERE version != ?", (version,))
+                self.db.commit()
+
+    def remember(self, key, label):
+        self.entries[key] = label
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    # Labels of the keys seen before, as {key: label}; memory first, then the file
+    def lookup(self, keys):
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    found[key] = self.entries[key]
+            missing = [key for key in dict.fromkeys(keys) if key not in found]
+            from_disk = 0
+            if self.db is not None:
+                for start in range(0, len(missing), SQL_BATCH):
+                    batch = missing[start:start + SQL_BATCH]
+                    rows = self.db.execute(
+                        f"SELECT key, label FROM predictions WHERE version = ? AND key IN "
+                        f"({','.join('?' * len(batch))})", [self.version] + batch).fetchall()
+                    for key, label in rows:
+                        found[key] = json.loads(label)
+                        self.remember(key, found[key])
+                        from_disk += 1
+            self.stats["disk_hits"] += from_disk
+        return found
+
+    def store(self, labels):
+        with self.lock:
+            for key, label in labels.items():
+                self.remember(key, label)
+            if self.db is not None:
+                self.db.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)",
+                                    [(self.version, key, encode_label(label)) for key, label in labels.items()])
+                self.db.commit()
+
+    # Predict `texts`, sending only the ones not cached through `predict_batch` (in one call)
+    def predict(self, texts, predict_batch):
+        keys = [text_key(text) for text in texts]
+        found = self.lookup(keys)
+        # Repeats within the batch are predicted once
+        misses = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in misses:
+                misses[key] = text
+        if misses:
+            labels = dict(zip(misses, predict_batch(list(misses.values()))))
+            self.store(labels)
+            found.update(labels)
+
+        # A repeat of a miss within the batch counts as a hit: it was not predicted again
+        hits = len(texts) - len(misses)
+        with self.lock:
+            self.stats["texts"] += len(texts)
+            self.stats["hits"] += hits
+        metrics.inc("prediction_cache_total", hits, outcome="hit")
+        metrics.inc("prediction_cache_total", len(texts) - hits, outcome="miss")
+        return np.asarray([found[key] for key in keys])
+
+    def hit_ratio(self):
+        return self.stats["hits"] / self.stats["texts"] if self.stats["texts"] else 0.0
+
+    def report(self):
+        print(f"📊 Prediction cache: {self.stats['hits']}/{self.stats['texts']} hits "
+              f"({self.hit_ratio() * 100:.1f}%), {self.stats['disk_hits']} from disk, "
+              f"{len(self.entries)} in memory")
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
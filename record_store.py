@@ -0,0 +1,319 @@
+import os
+import glob
+import gzip
+import json
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet is optional: `pip install pyarrow` to read or write it
+    pa = ds = pq = None
+
+# File formats understood by the loaders; new data is written as JSON Lines
+FORMATS = {"json": ".json", "jsonl": ".jsonl", "jsonl.gz": ".jsonl.gz", "parquet": ".parquet"}
+DEFAULT_FORMAT = "jsonl"
+
+# Parquet layout: rows per row group (the unit a reader can skip to) and the column codec
+PARQUET_ROW_GROUP_SIZE = 10000
+PARQUET_COMPRESSION = "zstd"
+# Root of the dataset partitioned by category and date (category=<name>/date=<YYYY-MM-DD>/)
+PARTITIONED_DIR = "data/processed/parquet"
+
+
+# Open a data file for text I/O, transparently handling gzip compression
+def open_text(path, mode="r", compressed=None):
+    compressed = path.endswith(".gz") if compressed is None else compressed
+    if compressed:
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+# Temporary name next to `path`; it never matches is_record_file, so loaders skip it
+def temp_path(path):
+    return f"{path}.{os.getpid()}.tmp"
+
+
+# Write a JSON document so readers see either the old file or the complete new one
+def write_json_atomic(path, data, indent=None):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = temp_path(path)
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=indent)
+    os.replace(tmp_path, path)
+
+
+# Is this a file the record loaders can read?
+def is_record_file(name):
+    return name.endswith((".json", ".jsonl", ".jsonl.gz", ".parquet"))
+
+
+def require_pyarrow():
+    if pq is None:
+        raise RuntimeError("Parquet files need pyarrow: pip install pyarrow")
+
+
+# Append-only JSON Lines writer; the file is only created once a record arrives
+class RecordWriter:
+    """
+    With `atomic=True` the records go to a temporary file that replaces
+    `path` on a clean close, so a crashed worker never leaves half a file
+    behind (and an existing `path` is replaced, not appended to).
+    """
+
+    def __init__(self, path, atomic=False):
+        self.path = path
+        self.atomic = atomic
+        self.file = None
+        self.count = 0
+
+    def write(self, record):
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            if self.atomic:
+                self.file = open_text(temp_path(self.path), "w", compressed=self.path.endswith(".gz"))
+            else:
+                self.file = open_text(self.path, "a")
+        self.file.write(json.dumps(record, ensure_ascii=False))
+        self.file.write("\n")
+        self.count += 1
+
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+        return self.count
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            if self.atomic:
+                os.replace(temp_path(self.path), self.path)
+
+    # Drop whatever an atomic writer wrote so far
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            if self.atomic:
+                os.remove(temp_path(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.atomic:
+            self.discard()
+        else:
+            self.close()
+
+
+# Column types of the first row group; lists stay lists of strings instead of being flattened
+def parquet_schema(rows):
+    """
+    A column that is empty or missing in every row of the first group would
+    be typed as null and reject later values, so it becomes (a list of) string.
+    """
+    fields = []
+    for field in pa.Table.from_pylist(rows).schema:
+        if pa.types.is_null(field.type):
+            field = pa.field(field.name, pa.string())
+        elif pa.types.is_list(field.type) and pa.types.is_null(field.type.value_type):
+            field = pa.field(field.name, pa.list_(pa.string()))
+        fields.append(field)
+    return pa.schema(fields)
+
+
+# Parquet counterpart of RecordWriter; always atomic, since a Parquet file cannot be appended to
+class ParquetRecordWriter:
+    """
+    Records are buffered and written one row group at a time, so memory is
+    bounded by `row_group_size`. The columns are fixed by the first row group:
+    later records with extra keys lose them, missing keys become nulls.
+    """
+
+    def __init__(self, path, row_group_size=PARQUET_ROW_GROUP_SIZE, compression=PARQUET_COMPRESSION):
+        require_pyarrow()
+        self.path = path
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.rows = []
+        self.schema = None
+        self.writer = None
+        self.count = 0
+
+    def write(self, record):
+        self.rows.append(record)
+        self.count += 1
+        if len(self.rows) == self.row_group_size:
+            self.flush()
+
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+        return self.count
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.writer is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.schema = parquet_schema(self.rows)
+            self.writer = pq.ParquetWriter(temp_path(self.path), self.schema, compression=self.compression)
+        self.writer.write_table(pa.Table.from_pylist(self.rows, schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            os.replace(temp_path(self.path), self.path)
+
+    def discard(self):
+        self.rows = []
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            os.remove(temp_path(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.discard()
+        else:
+            self.close()
+
+
+# Build the timestamped output path used by every phase: <dir>/<category>_<kind>_<timestamp><ext>
+def record_path(directory, category, kind, fmt=DEFAULT_FORMAT, timestamp=None):
+    safe_name = category.replace(" ", "_")
+    timestamp = timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+    return os.path.join(directory, f"{safe_name}_{kind}_{timestamp}{FORMATS[fmt]}")
+
+
+# Write a whole iterable of records in the given format and return how many were written
+def save_records(path, records, fmt=DEFAULT_FORMAT):
+    if fmt == "json":
+        # Legacy pretty-printed array; needs the whole list in memory
+        data = list(records)
+        write_json_atomic(path, data, indent=2)
+        return len(data)
+    if fmt == "parquet":
+        with ParquetRecordWriter(path) as writer:
+            return writer.write_all(records)
+    with RecordWriter(path, atomic=True) as writer:
+        return writer.write_all(records)
+
+
+# Stream records from a JSON Lines file (plain or gzip), a Parquet file or a legacy JSON array
+def iter_records(path):
+    """
+    Yields one record at a time. JSON Lines files are read line by line and
+    Parquet files one row group at a time, so memory stays flat; legacy
+    `.json` files are a single array and are loaded whole, as before.
+    """
+    if path.endswith(".parquet"):
+        yield from iter_parquet_records(path)
+        return
+    if path.endswith(".json"):
+        with open(path, "r") as f:
+            data = json.load(f)
+        yield from data
+        return
+    with open_text(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+# Stream records of a Parquet file, decoding only the given columns and row groups
+def iter_parquet_records(path, columns=None, row_groups=None):
+    require_pyarrow()
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=PARQUET_ROW_GROUP_SIZE, row_groups=row_groups,
+                                           columns=columns):
+        yield from batch.to_pylist()
+
+
+# A partitioned directory of Parquet files as one dataset; None when it holds no files yet
+def open_partitioned(path):
+    # Listed by hand so a part file still being written (a .tmp) is never picked up
+    files = sorted(os.path.join(root, name) for root, _, names in os.walk(path)
+                   for name in names if name.endswith(".parquet"))
+    if not files:
+        return None
+    return ds.dataset(files, format="parquet", partitioning="hive", partition_base_dir=path)
+
+
+# Column names of a Parquet file, or of a partitioned directory including its partition keys
+def parquet_columns(path):
+    require_pyarrow()
+    if os.path.isdir(path):
+        dataset = open_partitioned(path)
+        return dataset.schema.names if dataset is not None else []
+    return pq.read_schema(path).names
+
+
+# Read whole columns of a Parquet file, or of a partitioned directory, as {column: list}
+def read_columns(path, columns, row_groups=None, filters=None):
+    """
+    Only the requested columns are decompressed. For a single file,
+    `row_groups` picks row groups by number; for a partitioned directory,
+    `filters` prunes partitions, e.g. [("category", "=", "vayu_app"),
+    ("date", ">=", "2024-01-01")], and the partition keys can be read as
+    columns.
+    """
+    require_pyarrow()
+    if os.path.isdir(path):
+        dataset = open_partitioned(path)
+        if dataset is None:
+            return {column: [] for column in columns}
+        table = dataset.to_table(columns=columns, filter=pq.filters_to_expression(filters) if filters else None)
+    elif row_groups is not None:
+        table = pq.ParquetFile(path).read_row_groups(row_groups, columns=columns)
+    else:
+        table = pq.read_table(path, columns=columns, filters=filters)
+    return table.to_pydict()
+
+
+# Add records as a new file in the category=<name>/date=<day> partition of a dataset directory
+def write_partition(records, category, root=PARTITIONED_DIR, date=None):
+    safe_name = category.replace(" ", "_")
+    date = date or datetime.now().strftime('%Y-%m-%d')
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    path = os.path.join(root, f"category={safe_name}", f"date={date}", f"part_{timestamp}_{os.getpid()}.parquet")
+    return path, save_records(path, records, "parquet")
+
+
+# All record files in `directory` whose name starts with the category, oldest first
+def category_files(directory, category):
+    safe_name = category.replace(" ", "_")
+    if not os.path.isdir(directory):
+        return []
+    files = [name for name in os.listdir(directory) if name.startswith(safe_name) and is_record_file(name)]
+    return [os.path.join(directory, name) for name in sorted(files)]
+
+
+# The current copy of a dataset kept under `base` (its path without extension), or None. Phase 4
+# replaces a category's dataset when --format changes, but a run cut short in between can leave
+# an older copy in another format behind: every reader goes through here, so the newest one wins
+def current_record_file(base):
+    paths = [base + extension for extension in FORMATS.values() if os.path.exists(base + extension)]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+# current_record_file of every dataset matching `pattern` (a glob without the extension), sorted
+def current_record_files(pattern):
+    bases = {path[:-len(extension)] for extension in FORMATS.values() for path in glob.glob(pattern + extension)}
+    return sorted(current_record_file(base) for base in bases)
+
+
+# Stream every record of a category across all of its files
+def iter_category_records(directory, category):
+    for path in category_files(directory, category):
+        yield from iter_records(path)
@@ -0,0 +1,505 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from array import array
+import numpy as np
+from record_store import current_record_files, iter_parquet_records, iter_records, temp_path, write_json_atomic
+
+# Full-text search over the processed pages: immutable on-disk segments, memory-mapped, BM25-ranked
+
+INDEX_DIR = "data/index"
+PROCESSED_PATTERN = "data/processed/*_processed_current"
+SEGMENT_DOCS = 20000            # Documents per newly built segment, which bounds memory while indexing
+MAX_SEGMENTS = 8                # More segments than this and the smallest ones get merged
+MERGE_FACTOR = 4                # Segments merged at a time
+
+# Cleaned fields and their weight in a document's term frequencies (a simple BM25F)
+FIELD_WEIGHTS = {"title": 3, "description": 2, "content": 1}
+K1 = 1.2
+B = 0.75
+SNIPPET_CHARS = 200
+MAX_TF = np.iinfo(np.uint16).max
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+# phase4_refine already lowercased and collapsed whitespace, so splitting on \w+ is enough
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def hash64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+# Identifies one version of a page: a changed record is indexed again, an unchanged one is skipped
+def document_hash(record, category):
+    return hash64(json.dumps([category] + [record.get(field) or "" for field in ("url", *FIELD_WEIGHTS)]))
+
+
+# Segment files -----------------------------------------------------------------
+
+# One immutable segment: a sorted term dictionary, postings, per-document data and a deleted mask
+class Segment:
+    """
+    Every array is an .npy file opened with mmap_mode="r", so opening a
+    segment costs almost nothing and a query only touches the pages of the
+    terms it asks for. Only deleted.npy is ever rewritten.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.terms = self.array("terms")                    # utf-8 terms, concatenated in byte order
+        self.term_offsets = self.array("term_offsets")      # term i is terms[term_offsets[i]:term_offsets[i + 1]]
+        self.postings_offsets = self.array("postings_offsets")
+        self.doc_ids = self.array("doc_ids")                # uint32, ascending within a term
+        self.tfs = self.array("tfs")                        # uint16 weighted term frequency
+        self.doc_lengths = self.array("doc_lengths")
+        self.url_hashes = self.array("url_hashes")
+        self.doc_hashes = self.array("doc_hashes")
+        self.doc_offsets = self.array("doc_offsets")
+        self.deleted = np.load(os.path.join(path, "deleted.npy"))
+
+    def array(self, name):
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def live_count(self):
+        return len(self) - int(self.deleted.sum())
+
+    def term_count(self):
+        return len(self.term_offsets) - 1
+
+    def term(self, i):
+        return self.terms[self.term_offsets[i]:self.term_offsets[i + 1]].tobytes()
+
+    # Binary search of the term dictionary straight on the memory map
+    def find_term(self, term):
+        key = term.encode("utf-8")
+        lo, hi = 0, self.term_count()
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.term_count() and self.term(lo) == key:
+            return lo
+        return None
+
+    def postings(self, term):
+        i = self.find_term(term)
+        if i is None:
+            return None, None
+        start, end = self.postings_offsets[i], self.postings_offsets[i + 1]
+        return self.doc_ids[start:end], self.tfs[start:end]
+
+    def iter_documents(self):
+        with open(os.path.join(self.path, "docs.jsonl"), "rb") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def document(self, doc_id):
+        with open(os.path.join(self.path, "docs.jsonl"), "rb") as f:
+            f.seek(int(self.doc_offsets[doc_id]))
+            return json.loads(f.read(int(self.doc_offsets[doc_id + 1] - self.doc_offsets[doc_id])))
+
+    def save_deleted(self, deleted):
+        path = os.path.join(self.path, "deleted.npy")
+        tmp_path = temp_path(path)
+        with open(tmp_path, "wb") as f:
+            np.save(f, deleted)
+        os.replace(tmp_path, path)
+        self.deleted = deleted
+
+
+# Write the arrays of a segment into a fresh directory and return its path
+def write_segment(index_dir, name, terms, term_ids, doc_ids, tfs, doc_lengths, url_hashes, doc_hashes, docs):
+    """
+    `terms` is the segment vocabulary and `term_ids`/`doc_ids`/`tfs` one entry
+    per posting, in any order. `docs` are the stored fields, one dict per document.
+    """
+    # Sort the vocabulary by its utf-8 bytes, which is the order find_term searches in
+    encoded = [term.encode("utf-8") for term in terms]
+    order = sorted(range(len(encoded)), key=encoded.__getitem__)
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    term_ids = rank[np.asarray(term_ids, dtype=np.int64)]
+
+    doc_ids = np.asarray(doc_ids, dtype=np.uint32)
+    postings_order = np.lexsort((doc_ids, term_ids))
+    counts = np.bincount(term_ids, minlength=len(order))
+
+    blob = b"".join(encoded[i] for i in order)
+    term_offsets = np.zeros(len(order) + 1, dtype=np.uint64)
+    np.cumsum([len(encoded[i]) for i in order], out=term_offsets[1:])
+    postings_offsets = np.zeros(len(order) + 1, dtype=np.uint64)
+    np.cumsum(counts, out=postings_offsets[1:])
+
+    tmp_dir = os.path.join(index_dir, f".{name}.tmp")
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    doc_offsets = [0]
+    with open(os.path.join(tmp_dir, "docs.jsonl"), "wb") as f:
+        for doc in docs:
+            f.write(json.dumps(doc, ensure_ascii=False).encode("utf-8") + b"\n")
+            doc_offsets.append(f.tell())
+
+    doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+    arrays = {
+        "terms": np.frombuffer(blob, dtype=np.uint8),
+        "term_offsets": term_offsets,
+        "postings_offsets": postings_offsets,
+        "doc_ids": doc_ids[postings_order],
+        "tfs": np.minimum(np.asarray(tfs, dtype=np.int64), MAX_TF).astype(np.uint16)[postings_order],
+        "doc_lengths": doc_lengths,
+        "url_hashes": np.asarray(url_hashes, dtype=np.uint64),
+        "doc_hashes": np.asarray(doc_hashes, dtype=np.uint64),
+        "doc_offsets": np.asarray(doc_offsets, dtype=np.uint64),
+        "deleted": np.zeros(len(doc_lengths), dtype=bool),
+    }
+    for array_name, values in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{array_name}.npy"), values)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump({"docs": len(doc_lengths), "total_length": float(doc_lengths.sum())}, f)
+
+    path = os.path.join(index_dir, name)
+    if os.path.exists(path):
+        # Left by a run that crashed before listing it in index.json; names are never reused otherwise
+        shutil.rmtree(path)
+    os.replace(tmp_dir, path)
+    return path
+
+
+# Index state -------------------------------------------------------------------
+
+def index_state_path(index_dir):
+    return os.path.join(index_dir, "index.json")
+
+
+def load_index_state(index_dir):
+    path = index_state_path(index_dir)
+    if not os.path.exists(path):
+        return {"segments": [], "next_segment": 1}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def next_segment_name(state):
+    name = f"seg_{state['next_segment']:06d}"
+    state["next_segment"] += 1
+    return name
+
+
+# A page's identity across versions: the same URL in the same category
+def page_hash(category, record):
+    return hash64(f"{category}\0{record.get('url') or ''}")
+
+
+# Hide documents whose page is no longer in any processed dataset; returns how many
+def delete_missing(segments, url_hashes):
+    removed = 0
+    for segment in segments:
+        missing = ~np.isin(segment.url_hashes, url_hashes) & ~segment.deleted
+        if missing.any():
+            segment.save_deleted(segment.deleted | missing)
+            removed += int(missing.sum())
+    return removed
+
+
+# Hide documents of older segments whose URL appears in a newer segment
+def delete_replaced(segments, url_hashes):
+    for segment in segments:
+        replaced = np.isin(segment.url_hashes, url_hashes) & ~segment.deleted
+        if replaced.any():
+            segment.save_deleted(segment.deleted | replaced)
+
+
+# Building ----------------------------------------------------------------------
+
+# Every record of the current processed datasets, with the category taken from the file name;
+# one copy per category, so pages left in an older format are not indexed twice
+def iter_processed_records(pattern=PROCESSED_PATTERN):
+    for path in current_record_files(pattern):
+        name = os.path.basename(path)
+        category = name[:name.index("_processed_current")].replace("_", " ")
+        # From Parquet only the indexed columns are read; the image and link lists are skipped
+        records = (iter_parquet_records(path, columns=["url", *FIELD_WEIGHTS]) if path.endswith(".parquet")
+                   else iter_records(path))
+        for record in records:
+            yield category, record
+
+
+# Accumulates postings for one segment in compact arrays
+class SegmentBuilder:
+    def __init__(self):
+        self.vocabulary = {}
+        self.term_ids = array("I")
+        self.doc_ids = array("I")
+        self.tfs = array("I")
+        self.doc_lengths = []
+        self.url_hashes = []
+        self.doc_hashes = []
+        self.docs = []
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, category, record, doc_hash):
+        doc_id = len(self.docs)
+        counts = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(record.get(field) or ""):
+                counts[token] = counts.get(token, 0) + weight
+        for token, tf in counts.items():
+            term_id = self.vocabulary.setdefault(token, len(self.vocabulary))
+            self.term_ids.append(term_id)
+            self.doc_ids.append(doc_id)
+            self.tfs.append(tf)
+        self.doc_lengths.append(sum(counts.values()))
+        self.url_hashes.append(page_hash(category, record))
+        self.doc_hashes.append(doc_hash)
+        self.docs.append({
+            "url": record.get("url"),
+            "title": record.get("title") or "",
+            "category": category,
+            "snippet": (record.get("description") or record.get("content") or "")[:SNIPPET_CHARS]
+        })
+
+    def write(self, index_dir, name):
+        return write_segment(index_dir, name, list(self.vocabulary), np.frombuffer(self.term_ids, dtype=np.uint32),
+                             np.frombuffer(self.doc_ids, dtype=np.uint32), np.frombuffer(self.tfs, dtype=np.uint32),
+                             self.doc_lengths, self.url_hashes, self.doc_hashes, self.docs)
+
+
+def open_segments(index_dir, state):
+    return [Segment(os.path.join(index_dir, name)) for name in state["segments"]]
+
+
+# Index every new or changed processed record into new segments, then merge if there are too many
+def update_index(index_dir=INDEX_DIR, pattern=PROCESSED_PATTERN, segment_docs=SEGMENT_DOCS,
+                 max_segments=MAX_SEGMENTS):
+    """
+    Records whose content is already indexed are skipped, so a weekly run only
+    indexes the pages that arrived or changed since the last one. A changed
+    page replaces its older version, and a page that is no longer in any
+    processed dataset is deleted. Returns the number of documents added.
+    """
+    start = time.perf_counter()
+    os.makedirs(index_dir, exist_ok=True)
+    state = load_index_state(index_dir)
+    segments = open_segments(index_dir, state)
+    known = (np.concatenate([segment.doc_hashes[~segment.deleted] for segment in segments])
+             if segments else np.zeros(0, dtype=np.uint64))
+    known = set(known.tolist())
+
+    added = 0
+    builder = SegmentBuilder()
+    present = array("Q")
+
+    def flush():
+        nonlocal builder, added
+        if not len(builder):
+            return
+        segment = Segment(builder.write(index_dir, next_segment_name(state)))
+        delete_replaced(segments, segment.url_hashes)
+        segments.append(segment)
+        state["segments"].append(segment.name)
+        write_json_atomic(index_state_path(index_dir), state)
+        added += len(builder)
+        builder = SegmentBuilder()
+
+    for category, record in iter_processed_records(pattern):
+        present.append(page_hash(category, record))
+        doc_hash = document_hash(record, category)
+        if doc_hash in known:
+            continue
+        known.add(doc_hash)
+        builder.add(category, record, doc_hash)
+        if len(builder) >= segment_docs:
+            flush()
+    flush()
+    # Without any processed data (e.g. a wrong pattern) the index is left alone rather than emptied
+    removed = delete_missing(segments, np.frombuffer(present, dtype=np.uint64)) if len(present) else 0
+
+    merged = merge_small_segments(index_dir, max_segments)
+    print(f"📊 Indexed {added} new documents, deleted {removed} gone ones in {time.perf_counter() - start:.1f}s "
+          f"({len(load_index_state(index_dir)['segments'])} segments{', merged ' + str(merged) if merged else ''})")
+    return added
+
+
+# Merging -----------------------------------------------------------------------
+
+# Combine segments into one, dropping deleted documents; postings are merged without re-tokenizing
+def merge_segments(index_dir, names):
+    state = load_index_state(index_dir)
+    segments = [Segment(os.path.join(index_dir, name)) for name in names]
+
+    # Stable vocabulary of the merged segment
+    vocabulary = {}
+    all_terms, all_docs, all_tfs = [], [], []
+    doc_lengths, url_hashes, doc_hashes, docs = [], [], [], []
+    for segment in segments:
+        live = ~segment.deleted
+        new_ids = np.full(len(segment), -1, dtype=np.int64)
+        new_ids[live] = np.arange(int(live.sum())) + len(doc_lengths)
+
+        term_map = np.array([vocabulary.setdefault(segment.term(i).decode("utf-8"), len(vocabulary))
+                             for i in range(segment.term_count())], dtype=np.int64)
+        counts = np.diff(segment.postings_offsets.astype(np.int64))
+        terms = np.repeat(term_map, counts)
+        remapped = new_ids[np.asarray(segment.doc_ids, dtype=np.int64)]
+        keep = remapped >= 0
+        all_terms.append(terms[keep])
+        all_docs.append(remapped[keep])
+        all_tfs.append(np.asarray(segment.tfs)[keep])
+
+        doc_lengths.extend(np.asarray(segment.doc_lengths)[live].tolist())
+        url_hashes.extend(np.asarray(segment.url_hashes)[live].tolist())
+        doc_hashes.extend(np.asarray(segment.doc_hashes)[live].tolist())
+        docs.extend(doc for doc, alive in zip(segment.iter_documents(), live.tolist()) if alive)
+
+    # Terms that only occurred in deleted documents are left out
+    term_ids = np.concatenate(all_terms) if all_terms else np.zeros(0, dtype=np.int64)
+    used = np.unique(term_ids)
+    remap = np.full(len(vocabulary), -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    terms = list(vocabulary)
+    name = next_segment_name(state)
+    path = write_segment(index_dir, name, [terms[i] for i in used.tolist()], remap[term_ids],
+                         np.concatenate(all_docs) if all_docs else [],
+                         np.concatenate(all_tfs) if all_tfs else [],
+                         doc_lengths, url_hashes, doc_hashes, docs)
+
+    # Swap the merged segment in where the first of the old ones was
+    position = state["segments"].index(names[0])
+    remaining = [segment for segment in state["segments"] if segment not in names]
+    remaining.insert(min(position, len(remaining)), name)
+    state["segments"] = remaining
+    write_json_atomic(index_state_path(index_dir), state)
+    for old in names:
+        shutil.rmtree(os.path.join(index_dir, old))
+    return path
+
+
+# Tiered merging: while there are too many segments, merge the smallest few
+def merge_small_segments(index_dir=INDEX_DIR, max_segments=MAX_SEGMENTS, merge_factor=MERGE_FACTOR):
+    merged = 0
+    while True:
+        state = load_index_state(index_dir)
+        if len(state["segments"]) <= max_segments:
+            return merged
+        sizes = {name: Segment(os.path.join(index_dir, name)).live_count() for name in state["segments"]}
+        smallest = sorted(state["segments"], key=sizes.get)[:merge_factor]
+        # Keep the segments in age order so newer versions of a page stay the ones that count
+        merge_segments(index_dir, [name for name in state["segments"] if name in smallest])
+        merged += len(smallest)
+
+
+def optimize(index_dir=INDEX_DIR):
+    state = load_index_state(index_dir)
+    if len(state["segments"]) > 1 or any(Segment(os.path.join(index_dir, name)).deleted.any()
+                                         for name in state["segments"]):
+        merge_segments(index_dir, state["segments"])
+
+
+# Searching ---------------------------------------------------------------------
+
+class SearchIndex:
+    """
+    Query API over the segments in `index_dir`:
+
+        index = SearchIndex()
+        for hit in index.search("street food ahmedabad", limit=5):
+            print(hit["score"], hit["url"], hit["title"])
+    """
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        self.segments = open_segments(index_dir, load_index_state(index_dir))
+        self.doc_count = sum(segment.live_count() for segment in self.segments)
+        total_length = sum(segment.meta["total_length"] for segment in self.segments)
+        all_docs = sum(len(segment) for segment in self.segments)
+        self.average_length = total_length / all_docs if all_docs else 0.0
+
+    def search(self, query, limit=10):
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.doc_count:
+            return []
+        postings = [[segment.postings(term) for term in terms] for segment in self.segments]
+
+        # Document frequencies over all segments give the idf of each query term
+        dfs = [sum(len(per_segment[i][0]) for per_segment in postings if per_segment[i][0] is not None)
+               for i in range(len(terms))]
+        idfs = [np.log(1 + (self.doc_count - min(df, self.doc_count) + 0.5) / (df + 0.5)) for df in dfs]
+
+        hits = []
+        for segment, per_term in zip(self.segments, postings):
+            doc_ids = [np.asarray(ids) for ids, _ in per_term if ids is not None]
+            if not doc_ids:
+                continue
+            weights = []
+            for (ids, tfs), idf in zip(per_term, idfs):
+                if ids is None:
+                    continue
+                tf = np.asarray(tfs, dtype=np.float32)
+                norm = K1 * (1 - B + B * np.asarray(segment.doc_lengths[np.asarray(ids)]) / self.average_length)
+                weights.append(idf * tf * (K1 + 1) / (tf + norm))
+            docs, inverse = np.unique(np.concatenate(doc_ids), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(weights))
+            scores[segment.deleted[docs]] = -np.inf
+
+            top = np.argsort(-scores)[:limit]
+            hits.extend((float(scores[i]), segment, int(docs[i])) for i in top.tolist() if np.isfinite(scores[i]))
+
+        hits.sort(key=lambda hit: -hit[0])
+        return [dict(segment.document(doc_id), score=round(score, 4)) for score, segment, doc_id in hits[:limit]]
+
+    def stats(self):
+        return {"segments": len(self.segments), "documents": self.doc_count,
+                "terms": sum(segment.term_count() for segment in self.segments)}
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Full-text search over the processed pages")
+    arg_parser.add_argument("--index-dir", default=INDEX_DIR)
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="index new and changed processed pages")
+    build.add_argument("--segment-docs", type=int, default=SEGMENT_DOCS)
+    build.add_argument("--max-segments", type=int, default=MAX_SEGMENTS)
+    commands.add_parser("optimize", help="merge every segment into one and drop deleted documents")
+    search = commands.add_parser("search", help="run a query")
+    search.add_argument("query", nargs="+")
+    search.add_argument("-k", "--limit", type=int, default=10)
+    commands.add_parser("stats", help="show segment and document counts")
+    args = arg_parser.parse_args()
+
+    if args.command == "build":
+        update_index(args.index_dir, segment_docs=args.segment_docs, max_segments=args.max_segments)
+    elif args.command == "optimize":
+        optimize(args.index_dir)
+        print(f"✅ Optimized: {SearchIndex(args.index_dir).stats()}")
+    elif args.command == "stats":
+        print(SearchIndex(args.index_dir).stats())
+    else:
+        index = SearchIndex(args.index_dir)
+        start = time.perf_counter()
+        hits = index.search(" ".join(args.query), args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+        for rank, hit in enumerate(hits, 1):
+            print(f"{rank:>3}. [{hit['score']:.3f}] {hit['title'] or hit['url']}")
+            print(f"     {hit['url']} ({hit['category']})")
+        print(f"🔍 {len(hits)} results in {elapsed:.1f} ms")
@@ -0,0 +1,334 @@
+import os
+import re
+import gzip
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from record_store import RecordWriter, record_path
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional: `pip install zstandard`; gzip always works
+    zstandard = None
+
+# Append-only archive of raw search results and pages: compressed segments plus an offset index
+
+ARCHIVE_DIR = "data/archive"
+SEGMENT_BYTES = 256 * 1024 * 1024   # Start a new segment file once the current one is this big
+COMPRESSIONS = {"gzip": ".warc.gz", "zstd": ".warc.zst"}
+DEFAULT_COMPRESSION = "gzip"
+REPLAY_CHUNK = 16                   # Snapshots handed to a replay worker at a time
+# Loose snapshots written before the archive existed: logs/<query>_<YYYYmmdd_HHMMSS>.json|html
+LOOSE_SNAPSHOT = re.compile(r"^(?P<key>.+)_(?P<stamp>\d{8}_\d{6})\.(?P<ext>json|html)$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    category TEXT,
+    timestamp REAL NOT NULL,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    compression TEXT NOT NULL,
+    content_type TEXT,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_key ON snapshots (kind, key, timestamp);
+CREATE INDEX IF NOT EXISTS snapshots_category ON snapshots (kind, category, timestamp);
+"""
+
+
+def compress(data, compression):
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def decompress(data, compression):
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+# Read one record straight from its segment: a seek and a read, nothing else is decompressed
+def read_record(archive_dir, segment, offset, length, compression):
+    with open(os.path.join(archive_dir, "segments", segment), "rb") as f:
+        f.seek(offset)
+        data = decompress(f.read(length), compression)
+    # Like a WARC record, each one starts with its own header line
+    header, _, body = data.partition(b"\n")
+    return json.loads(header), body
+
+
+class SnapshotArchive:
+    """
+    Every snapshot is compressed on its own (one gzip member or zstd frame)
+    and appended to the segment file this process is writing, so any one of
+    them can be read back without touching the rest. `index.db` (SQLite)
+    maps (kind, key, timestamp) to segment, offset and length. Each process
+    appends to its own segments, so scraper workers never share a file; a
+    snapshot identical to the previous one of the same key only gets an
+    index row pointing at the stored copy.
+    """
+
+    def __init__(self, archive_dir=ARCHIVE_DIR, compression=DEFAULT_COMPRESSION, segment_bytes=SEGMENT_BYTES):
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("zstd compression needs zstandard: pip install zstandard")
+        self.archive_dir = archive_dir
+        self.compression = compression
+        self.segment_bytes = segment_bytes
+        os.makedirs(os.path.join(archive_dir, "segments"), exist_ok=True)
+        self.lock = threading.Lock()
+        # Fetch threads add pages too; the lock keeps them to one statement at a time
+        self.db = sqlite3.connect(os.path.join(archive_dir, "index.db"), timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.segment = None
+        self.file = None
+        self.segments_opened = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def open_segment(self):
+        if self.file is not None:
+            self.file.close()
+        self.segments_opened += 1
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.segment = f"seg_{stamp}_{os.getpid()}_{self.segments_opened:04d}{COMPRESSIONS[self.compression]}"
+        self.file = open(os.path.join(self.archive_dir, "segments", self.segment), "ab")
+
+    # Store one snapshot (str or bytes) and return its index row id
+    def add(self, kind, key, body, category=None, content_type=None, timestamp=None):
+        raw = body.encode("utf-8") if isinstance(body, str) else body
+        digest = hashlib.sha256(raw).hexdigest()
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            previous = self.db.execute(
+                "SELECT segment, offset, length, compression FROM snapshots WHERE kind = ? AND key = ? "
+                "AND sha256 = ? ORDER BY timestamp DESC LIMIT 1", (kind, key, digest)).fetchone()
+            if previous is not None:
+                segment, offset, length, compression = previous
+            else:
+                header = {"kind": kind, "key": key, "category": category, "timestamp": timestamp,
+                          "content_type": content_type, "size": len(raw), "sha256": digest}
+                data = compress(json.dumps(header).encode("utf-8") + b"\n" + raw, self.compression)
+                if self.file is None or self.file.tell() + len(data) > self.segment_bytes:
+                    self.open_segment()
+                offset = self.file.tell()
+                self.file.write(data)
+                # Flushed before it is indexed, so a reader never follows a row to missing bytes
+                self.file.flush()
+                segment, length, compression = self.segment, len(data), self.compression
+            with self.db:
+                cursor = self.db.execute(
+                    "INSERT INTO snapshots (kind, key, category, timestamp, segment, offset, length, compression, "
+                    "content_type, size, sha256) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (kind, key, category, timestamp, segment, offset, length, compression, content_type,
+                     len(raw), digest))
+            return cursor.lastrowid
+
+    # Index rows, oldest first; with latest=True only the newest snapshot of every key
+    def snapshots(self, kind=None, key=None, category=None, since=None, until=None, latest=False):
+        conditions, params = [], []
+        for column, value in (("kind", kind), ("key", key), ("category", category)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp <= ?")
+            params.append(until)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        columns = "id, kind, key, category, segment, offset, length, compression, content_type, size"
+        if latest:
+            # SQLite fills the bare columns from the row that holds the MAX()
+            sql = (f"SELECT {columns}, MAX(timestamp) AS timestamp FROM snapshots{where} "
+                   f"GROUP BY kind, key ORDER BY timestamp")
+        else:
+            sql = f"SELECT {columns}, timestamp FROM snapshots{where} ORDER BY timestamp"
+        with self.lock:
+            cursor = self.db.execute(sql, params)
+            names = [description[0] for description in cursor.description]
+            return [dict(zip(names, row)) for row in cursor]
+
+    # The snapshot of `key` current at time `at` (default: the latest) as (header, body bytes)
+    def get(self, kind, key, at=None):
+        rows = self.snapshots(kind, key, until=at)
+        if not rows:
+            return None
+        row = rows[-1]
+        return read_record(self.archive_dir, row["segment"], row["offset"], row["length"], row["compression"])
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.db.execute("SELECT kind, COUNT(*) FROM snapshots GROUP BY kind"))
+            raw = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM snapshots").fetchone()[0]
+        directory = os.path.join(self.archive_dir, "segments")
+        stored = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        return {"snapshots": counts, "raw_bytes": raw, "stored_bytes": stored}
+
+
+# Move loose logs/<query>_<timestamp>.json|html files into the archive
+def import_loose_snapshots(archive, directory="logs"):
+    imported = 0
+    for name in sorted(os.listdir(directory)):
+        match = LOOSE_SNAPSHOT.match(name)
+        if not match:
+            continue
+        path = os.path.join(directory, name)
+        with open(path, "rb") as f:
+            body = f.read()
+        query = match["key"].replace("_", " ")
+        timestamp = datetime.strptime(match["stamp"], "%Y%m%d_%H%M%S").timestamp()
+        content_type = "application/json" if match["ext"] == "json" else "text/html"
+        archive.add("serp", query, body, category=query, content_type=content_type, timestamp=timestamp)
+        os.remove(path)
+        imported += 1
+    return imported
+
+
+# Replay ------------------------------------------------------------------------
+
+# Worker side: read a chunk of page snapshots and run the extractor on each
+def replay_pages_chunk(archive_dir, rows, parser):
+    from extractors import extract
+    records = []
+    for row in rows:
+        _, body = read_record(archive_dir, row["segment"], row["offset"], row["length"], row["compression"])
+        try:
+            records.append(extract(row["key"], body.decode("utf-8", errors="replace"), parser))
+        except Exception as e:
+            print(f"❌ Error re-parsing {row['key']}: {e}")
+    return records
+
+
+# Worker side: re-extract the result URLs of a chunk of archived search responses
+def replay_serp_chunk(archive_dir, rows):
+    from phase1_crawler import extract_result_urls
+    results = []
+    for row in rows:
+        _, body = read_record(archive_dir, row["segment"], row["offset"], row["length"], row["compression"])
+        if row["content_type"] == "application/json":
+            results.append((row["key"], extract_result_urls(json.loads(body))))
+    return results
+
+
+def chunks(rows, size=REPLAY_CHUNK):
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+
+# Run the current extractors over the latest archived copy of every page, offline and in parallel
+def replay_pages(archive_dir=ARCHIVE_DIR, parser="python", workers=None, category=None, since=None):
+    """
+    Each worker reads its snapshots straight from the segments, so only
+    offsets cross the process boundary. The records are written per category
+    as new data/refined/<category>_scraped_<timestamp>.jsonl files, which the
+    next refine run merges like freshly scraped pages. Returns the number of
+    pages re-parsed.
+    """
+    with SnapshotArchive(archive_dir) as archive:
+        rows = archive.snapshots("page", category=category, since=since, latest=True)
+    by_category = {}
+    for row in rows:
+        by_category.setdefault(row["category"] or "uncategorized", []).append(row)
+
+    start = time.perf_counter()
+    count = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for name, category_rows in by_category.items():
+            parts = chunks(category_rows)
+            with RecordWriter(record_path("data/refined", name, "scraped"), atomic=True) as writer:
+                for records in pool.map(replay_pages_chunk, [archive_dir] * len(parts), parts, [parser] * len(parts)):
+                    writer.write_all(records)
+            print(f"📝 Re-parsed {writer.count} archived pages of {name} into {writer.path}")
+            count += writer.count
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"📊 Replayed {count}/{len(rows)} pages in {elapsed:.1f}s ({rate:.2f} pages/sec)")
+    return count
+
+
+# Re-extract the URL lists from the latest archived search response of every query
+def replay_searches(archive_dir=ARCHIVE_DIR, workers=None, since=None):
+    from phase1_crawler import save_urls
+    with SnapshotArchive(archive_dir) as archive:
+        rows = archive.snapshots("serp", since=since, latest=True)
+    parts = chunks(rows)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = [pair for part in pool.map(replay_serp_chunk, [archive_dir] * len(parts), parts) for pair in part]
+    for query, urls in results:
+        save_urls(query, urls)
+    return len(results)
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Browse, import and replay the raw snapshot archive")
+    arg_parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="archive location")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="snapshot counts and compression ratio")
+    list_parser = commands.add_parser("list", help="list snapshots")
+    list_parser.add_argument("--kind", choices=["serp", "page"])
+    list_parser.add_argument("--key", help="query or URL")
+    list_parser.add_argument("--category")
+    get_parser = commands.add_parser("get", help="print one snapshot")
+    get_parser.add_argument("kind", choices=["serp", "page"])
+    get_parser.add_argument("key", help="query or URL")
+    get_parser.add_argument("--at", help="ISO time; the snapshot current at that moment (default: latest)")
+    import_parser = commands.add_parser("import", help="move loose logs/*.json|html snapshots into the archive")
+    import_parser.add_argument("--logs-dir", default="logs")
+    replay_parser = commands.add_parser("replay", help="re-run the extractors over archived snapshots")
+    replay_parser.add_argument("kind", choices=["serp", "page"])
+    replay_parser.add_argument("--parser", default="python", help="extractor backend for pages")
+    replay_parser.add_argument("--category", help="only this category's pages")
+    replay_parser.add_argument("--since", help="ISO time; only snapshots taken since then")
+    replay_parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    args = arg_parser.parse_args()
+
+    if args.command == "replay" and args.kind == "page":
+        replay_pages(args.archive_dir, args.parser, args.workers, args.category, parse_time(args.since))
+    elif args.command == "replay":
+        print(f"📝 Re-extracted URLs of {replay_searches(args.archive_dir, args.workers, parse_time(args.since))} queries")
+    else:
+        with SnapshotArchive(args.archive_dir) as archive:
+            if args.command == "stats":
+                stats = archive.stats()
+                ratio = stats["raw_bytes"] / stats["stored_bytes"] if stats["stored_bytes"] else 0.0
+                print(f"📊 {stats['snapshots']}, {stats['raw_bytes'] / 1024:.1f} KB raw in "
+                      f"{stats['stored_bytes'] / 1024:.1f} KB ({ratio:.1f}x)")
+            elif args.command == "list":
+                for row in archive.snapshots(args.kind, args.key, args.category):
+                    stamp = datetime.fromtimestamp(row["timestamp"]).isoformat(timespec="seconds")
+                    print(f"{stamp}  {row['kind']:<5} {row['size']:>9}  {row['key']}")
+            elif args.command == "get":
+                snapshot = archive.get(args.kind, args.key, parse_time(args.at))
+                if snapshot is None:
+                    print(f"❌ No {args.kind} snapshot of {args.key}")
+                else:
+                    print(snapshot[1].decode("utf-8", errors="replace"))
+            else:
+                print(f"📝 Imported {import_loose_snapshots(archive, args.logs_dir)} loose snapshots "
+                      f"into {args.archive_dir}")
@@ -0,0 +1,140 @@
+import os
+import time
+import sqlite3
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Location of the crawl state and the default refresh policy
+FRONTIER_DB = "data/frontier.db"
+REFRESH_INTERVAL = 7 * 24 * 3600    # Fetch each URL at most once a week
+MAX_RETRIES = 3                     # Failed fetches retried this often before waiting a full interval
+RETRY_DELAY = 3600                  # First retry after an hour, doubling afterwards
+
+# Query parameters that only track the click and never change the page
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "dclid", "yclid", "mc_cid", "mc_eid", "srsltid", "_ga", "igshid"}
+TRACKING_PREFIXES = ("utm_",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    canonical_url TEXT PRIMARY KEY,
+    original_url TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    last_fetched REAL,
+    next_due REAL NOT NULL DEFAULT 0,
+    content_hash TEXT,
+    retries INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS urls_due ON urls (next_due);
+CREATE TABLE IF NOT EXISTS url_categories (
+    canonical_url TEXT NOT NULL,
+    category TEXT NOT NULL,
+    PRIMARY KEY (category, canonical_url)
+);
+"""
+
+
+# Canonical form used as the dedupe key: same page, same string
+def canonicalize(url):
+    """
+    Lowercases scheme and host, drops default ports, fragments and tracking
+    parameters, sorts the remaining query parameters and gives an empty
+    path a "/". Returns None for URLs that cannot be parsed, such as an
+    invalid port or a broken IPv6 literal.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    if parts.username:
+        credentials = parts.username + (f":{parts.password}" if parts.password else "")
+        host = f"{credentials}@{host}"
+
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)]
+    query.sort()
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+# SQLite-backed crawl frontier shared by every category
+class Frontier:
+    def __init__(self, path=FRONTIER_DB, refresh_interval=REFRESH_INTERVAL, max_retries=MAX_RETRIES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.refresh_interval = refresh_interval
+        self.max_retries = max_retries
+        # Several scraper processes may share the file; wait for each other's writes
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    # Register URLs for a category; returns how many were new to the frontier. Malformed URLs are skipped
+    def add_urls(self, urls, category):
+        added = 0
+        with self.db:
+            for url in urls:
+                canonical = canonicalize(url)
+                if canonical is None:
+                    continue
+                cursor = self.db.execute("INSERT OR IGNORE INTO urls (canonical_url, original_url) VALUES (?, ?)",
+                                         (canonical, url))
+                added += cursor.rowcount
+                self.db.execute("INSERT OR IGNORE INTO url_categories (canonical_url, category) VALUES (?, ?)",
+                                (canonical, category))
+        return added
+
+    # URLs that are due for (re)fetching, optionally only those of one category
+    def due(self, category=None, limit=None, now=None):
+        now = time.time() if now is None else now
+        sql = "SELECT u.original_url FROM urls u"
+        params = []
+        if category is not None:
+            sql += " JOIN url_categories c ON c.canonical_url = u.canonical_url AND c.category = ?"
+            params.append(category)
+        sql += " WHERE u.next_due <= ? ORDER BY u.next_due"
+        params.append(now)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [row[0] for row in self.db.execute(sql, params)]
+
+    def mark_done(self, url, content_hash, now=None):
+        now = time.time() if now is None else now
+        with self.db:
+            self.db.execute(
+                "UPDATE urls SET status = 'done', last_fetched = ?, next_due = ?, content_hash = ?, "
+                "retries = 0, last_error = NULL WHERE canonical_url = ?",
+                (now, now + self.refresh_interval, content_hash, canonicalize(url)))
+
+    # Not worth retrying (e.g. not an HTML page): wait for the next refresh
+    def mark_skipped(self, url, reason, now=None):
+        now = time.time() if now is None else now
+        with self.db:
+            self.db.execute("UPDATE urls SET status = 'skipped', next_due = ?, retries = 0, last_error = ? "
+                            "WHERE canonical_url = ?", (now + self.refresh_interval, reason, canonicalize(url)))
+
+    # Back off exponentially; after max_retries wait for the next refresh instead
+    def mark_failed(self, url, error="", now=None):
+        now = time.time() if now is None else now
+        canonical = canonicalize(url)
+        row = self.db.execute("SELECT retries FROM urls WHERE canonical_url = ?", (canonical,)).fetchone()
+        retries = (row[0] if row else 0) + 1
+        if retries > self.max_retries:
+            status, next_due, retries = "failed", now + self.refresh_interval, 0
+        else:
+            status, next_due = "pending", now + RETRY_DELAY * 2 ** (retries - 1)
+        with self.db:
+            self.db.execute("UPDATE urls SET status = ?, next_due = ?, retries = ?, last_error = ? "
+                            "WHERE canonical_url = ?", (status, next_due, retries, str(error), canonical))
+
+    def stats(self):
+        counts = dict(self.db.execute("SELECT status, COUNT(*) FROM urls GROUP BY status"))
+        counts["due"] = self.db.execute("SELECT COUNT(*) FROM urls WHERE next_due <= ?",
+                                        (time.time(),)).fetchone()[0]
+        return counts